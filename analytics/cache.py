@@ -0,0 +1,101 @@
+"""
+Versioned snapshot cache with stale-while-revalidate.
+
+A ``SnapshotCache`` keeps one computed payload in Django's cache together
+with the data version it was built from and its build time:
+
+* fresh (same version, younger than the TTL) - served as is
+* stale (older, or built before the last invalidation) - served while a
+  single worker, elected with ``cache.add()`` on a lock key, rebuilds it in a
+  background thread; only used while younger than TTL + stale window
+* missing or too old - rebuilt inline
+
+``invalidate()`` bumps the version once the current transaction commits, so
+the next read treats the snapshot as stale; ``analytics.signals`` calls it
+when the underlying rows change. Bumping before the commit would let a
+concurrent rebuild store pre-commit data under the new version.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotCache:
+    def __init__(self, name, ttl_setting, stale_setting, default_ttl=60, default_stale=300):
+        self.name = name
+        self.ttl_setting = ttl_setting
+        self.stale_setting = stale_setting
+        self.default_ttl = default_ttl
+        self.default_stale = default_stale
+        self.key = f"snapshot:{name}"
+        self.version_key = f"snapshot:{name}:version"
+        self.lock_key = f"snapshot:{name}:lock"
+
+    @property
+    def ttl(self):
+        return getattr(settings, self.ttl_setting, self.default_ttl)
+
+    @property
+    def stale_ttl(self):
+        return getattr(settings, self.stale_setting, self.default_stale)
+
+    def version(self):
+        return cache.get_or_set(self.version_key, 1, timeout=None)
+
+    def invalidate(self):
+        transaction.on_commit(self._bump_version)
+
+    def _bump_version(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 2, timeout=None)
+
+    def get(self, builder):
+        """Return the snapshot payload, calling ``builder()`` when it must be rebuilt"""
+        version = self.version()
+        entry = cache.get(self.key)
+        if entry is not None:
+            entry_version, built_at, payload = entry
+            age = time.time() - built_at
+            if entry_version == version and age < self.ttl:
+                return payload
+            if self.stale_ttl and age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(builder, version)
+                return payload
+        return self._rebuild(builder, version)
+
+    def _rebuild(self, builder, version):
+        payload = builder()
+        # Keep the entry around long enough to be served stale
+        cache.set(self.key, (version, time.time(), payload), self.ttl + self.stale_ttl)
+        return payload
+
+    def _refresh_in_background(self, builder, version):
+        # Only one worker recomputes; the others keep serving the stale copy
+        if not cache.add(self.lock_key, 1, timeout=max(self.ttl, 30)):
+            return
+
+        def refresh():
+            try:
+                self._rebuild(builder, version)
+            except Exception:
+                logger.exception("Refreshing snapshot %s failed", self.name)
+            finally:
+                cache.delete(self.lock_key)
+                connections.close_all()
+
+        threading.Thread(target=refresh, name=f"snapshot-{self.name}", daemon=True).start()
+
+
+admin_analytics_snapshot = SnapshotCache(
+    "admin_analytics",
+    ttl_setting="ADMIN_ANALYTICS_CACHE_TTL",
+    stale_setting="ADMIN_ANALYTICS_STALE_TTL",
+)
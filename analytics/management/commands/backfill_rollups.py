@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from analytics import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily appointment, registration and prescription rollups. "
+        "Without options the whole history is rebuilt; schedule it with --days to "
+        "repair drift from bulk updates that bypass signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to rebuild, YYYY-MM-DD")
+        parser.add_argument("--end", help="Last day to rebuild, YYYY-MM-DD")
+        parser.add_argument("--days", type=int, help="Rebuild only the last N days (plus scheduled days ahead)")
+
+    def handle(self, *args, **options):
+        start_day = end_day = None
+        if options["days"]:
+            start_day = timezone.localdate() - timedelta(days=options["days"])
+        for name in ("start", "end"):
+            if options[name]:
+                value = parse_date(options[name])
+                if value is None:
+                    raise CommandError(f"--{name} must be a date in YYYY-MM-DD format")
+                if name == "start":
+                    start_day = value
+                else:
+                    end_day = value
+
+        totals = rollups.rebuild(start_day, end_day)
+        scope = f"{start_day or 'beginning'} to {end_day or 'latest'}"
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups for {scope}: {totals['appointments']} appointment rows, "
+            f"{totals['registrations']} registration rows, {totals['prescriptions']} prescription rows"
+        ))
@@ -0,0 +1,54 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    """Build the rollups for rows that existed before the tables did"""
+    sources = [
+        (
+            apps.get_model('appointments', 'Appointment'),
+            apps.get_model('analytics', 'AppointmentDailyRollup'),
+            'appointment_datetime',
+            ('doctor_id', 'status', 'appointment_type'),
+        ),
+        (
+            apps.get_model('users', 'User'),
+            apps.get_model('analytics', 'RegistrationDailyRollup'),
+            'date_joined',
+            ('role',),
+        ),
+        (
+            apps.get_model('prescriptions', 'Prescription'),
+            apps.get_model('analytics', 'PrescriptionDailyRollup'),
+            'date_issued',
+            ('doctor_id',),
+        ),
+    ]
+    for model, rollup, date_field, bucket in sources:
+        rows = (
+            model.objects.filter(**{f'{date_field}__isnull': False})
+            .annotate(day=TruncDate(date_field))
+            .values('day', *bucket)
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        rollup.objects.all().delete()
+        rollup.objects.bulk_create(
+            [rollup(count=row.pop('total'), **row) for row in rows],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('appointments', '0012_appointmentreminder_alter_appointment_status_and_more'),
+        ('prescriptions', '0005_prescription_updated_at'),
+        ('users', '0006_userstats_missed_appointments'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
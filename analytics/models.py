@@ -0,0 +1,63 @@
+from django.db import models
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+
+class AppointmentDailyRollup(models.Model):
+    """Appointments per local day, doctor, status and type"""
+    day = models.DateField()
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    status = models.CharField(max_length=20)
+    appointment_type = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["day"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "doctor", "status", "appointment_type"],
+                name="unique_appointment_rollup_bucket",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["doctor", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} doctor={self.doctor_id} {self.status}/{self.appointment_type}: {self.count}"
+
+
+class RegistrationDailyRollup(models.Model):
+    """User registrations per local day and role"""
+    day = models.DateField()
+    role = models.CharField(max_length=10)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["day"]
+        constraints = [
+            models.UniqueConstraint(fields=["day", "role"], name="unique_registration_rollup_bucket"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.role}: {self.count}"
+
+
+class PrescriptionDailyRollup(models.Model):
+    """Prescriptions issued per local day and doctor"""
+    day = models.DateField()
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["day"]
+        constraints = [
+            models.UniqueConstraint(fields=["day", "doctor"], name="unique_prescription_rollup_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["doctor", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} doctor={self.doctor_id}: {self.count}"
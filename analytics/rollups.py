@@ -0,0 +1,273 @@
+"""
+Daily rollups for appointments, registrations and prescriptions.
+
+The rollup tables hold one row per local day and bucket (doctor, status,
+type, role). Signal handlers in ``analytics.signals`` keep them current with
+``F()`` increments, ``rebuild()`` (``manage.py backfill_rollups``) recomputes a
+date range from the source tables, and the ``*_series`` readers let the
+analytics views build day/week/month charts in O(days) instead of grouping
+every source row on each request.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from users.models import User
+from .models import AppointmentDailyRollup, PrescriptionDailyRollup, RegistrationDailyRollup
+
+def local_day(value):
+    return timezone.localtime(value).date()
+
+
+def bump(model, delta, **bucket):
+    """
+    Add ``delta`` to one rollup bucket, creating it on first use.
+
+    Decrements never create a bucket: a missing one was either never
+    built (``backfill_rollups`` repairs it) or is being removed with its
+    doctor, whose cascade deletes the rollups before the appointments.
+    """
+    if not delta:
+        return
+    if model.objects.filter(**bucket).update(count=F("count") + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=delta, **bucket)
+    except IntegrityError:
+        # Another writer created the bucket first
+        model.objects.filter(**bucket).update(count=F("count") + delta)
+
+
+# ===== Incremental maintenance =====
+
+def appointment_bucket(values):
+    """Rollup bucket for appointment field values keyed by attname"""
+    if not values.get("appointment_datetime") or not values.get("doctor_id"):
+        return None
+    return {
+        "day": local_day(values["appointment_datetime"]),
+        "doctor_id": values["doctor_id"],
+        "status": values["status"],
+        "appointment_type": values["appointment_type"],
+    }
+
+
+def _appointment_values(appointment, fallback=None):
+    fallback = fallback or {}
+    return {
+        name: fallback.get(name, getattr(appointment, name))
+        for name in ("appointment_datetime", "doctor_id", "status", "appointment_type")
+    }
+
+
+def appointment_changed(appointment, previous=None):
+    new = appointment_bucket(_appointment_values(appointment))
+    old = appointment_bucket(_appointment_values(appointment, previous)) if previous is not None else None
+    if old == new:
+        return
+    if old:
+        bump(AppointmentDailyRollup, -1, **old)
+    if new:
+        bump(AppointmentDailyRollup, 1, **new)
+
+
+def appointment_deleted(appointment):
+    bucket = appointment_bucket(_appointment_values(appointment))
+    if bucket:
+        bump(AppointmentDailyRollup, -1, **bucket)
+
+
+def user_registered(user, delta=1):
+    if user.date_joined:
+        bump(RegistrationDailyRollup, delta, day=local_day(user.date_joined), role=user.role)
+
+
+def user_role_changed(user, previous_role):
+    """Move a user's registration to their new role, as ``rebuild()`` would count it"""
+    if user.date_joined and previous_role != user.role:
+        day = local_day(user.date_joined)
+        bump(RegistrationDailyRollup, -1, day=day, role=previous_role)
+        bump(RegistrationDailyRollup, 1, day=day, role=user.role)
+
+
+def prescription_issued(prescription, delta=1):
+    if prescription.date_issued and prescription.doctor_id:
+        bump(
+            PrescriptionDailyRollup,
+            delta,
+            day=local_day(prescription.date_issued),
+            doctor_id=prescription.doctor_id,
+        )
+
+
+# ===== Backfill =====
+
+def _day_range_filter(field, start_day, end_day):
+    filters = {}
+    if start_day:
+        filters[f"{field}__date__gte"] = start_day
+    if end_day:
+        filters[f"{field}__date__lte"] = end_day
+    return filters
+
+
+def _rollup_range_filter(start_day, end_day):
+    filters = {}
+    if start_day:
+        filters["day__gte"] = start_day
+    if end_day:
+        filters["day__lte"] = end_day
+    return filters
+
+
+@transaction.atomic
+def rebuild(start_day=None, end_day=None, batch_size=1000):
+    """Recompute all rollups for [start_day, end_day] (whole history when omitted)"""
+    rollup_filter = _rollup_range_filter(start_day, end_day)
+    totals = {}
+
+    AppointmentDailyRollup.objects.filter(**rollup_filter).delete()
+    rows = (
+        Appointment.objects.filter(**_day_range_filter("appointment_datetime", start_day, end_day))
+        .annotate(day=TruncDate("appointment_datetime"))
+        .values("day", "doctor_id", "status", "appointment_type")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    AppointmentDailyRollup.objects.bulk_create(
+        [
+            AppointmentDailyRollup(
+                day=row["day"],
+                doctor_id=row["doctor_id"],
+                status=row["status"],
+                appointment_type=row["appointment_type"],
+                count=row["total"],
+            )
+            for row in rows
+        ],
+        batch_size=batch_size,
+    )
+    totals["appointments"] = AppointmentDailyRollup.objects.filter(**rollup_filter).count()
+
+    RegistrationDailyRollup.objects.filter(**rollup_filter).delete()
+    rows = (
+        User.objects.filter(**_day_range_filter("date_joined", start_day, end_day))
+        .annotate(day=TruncDate("date_joined"))
+        .values("day", "role")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    RegistrationDailyRollup.objects.bulk_create(
+        [RegistrationDailyRollup(day=row["day"], role=row["role"], count=row["total"]) for row in rows],
+        batch_size=batch_size,
+    )
+    totals["registrations"] = RegistrationDailyRollup.objects.filter(**rollup_filter).count()
+
+    PrescriptionDailyRollup.objects.filter(**rollup_filter).delete()
+    rows = (
+        Prescription.objects.filter(**_day_range_filter("date_issued", start_day, end_day))
+        .annotate(day=TruncDate("date_issued"))
+        .values("day", "doctor_id")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    PrescriptionDailyRollup.objects.bulk_create(
+        [PrescriptionDailyRollup(day=row["day"], doctor_id=row["doctor_id"], count=row["total"]) for row in rows],
+        batch_size=batch_size,
+    )
+    totals["prescriptions"] = PrescriptionDailyRollup.objects.filter(**rollup_filter).count()
+    return totals
+
+
+# ===== Readers =====
+
+def period_start(day, period="day"):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _series(rows, period, key_field, value_fields):
+    """Fold (day, key, count) rows into sorted per-period dicts"""
+    buckets = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        bucket = buckets[period_start(row["day"], period)]
+        bucket["total"] += row["count"]
+        key = value_fields.get(row[key_field]) if key_field else None
+        if key:
+            bucket[key] += row["count"]
+    series = []
+    for start in sorted(buckets):
+        values = buckets[start]
+        if not values["total"]:
+            continue
+        entry = {"period": start, "total": values["total"]}
+        for name in value_fields.values():
+            entry[name] = values[name]
+        series.append(entry)
+    return series
+
+
+def appointment_series(start_day, end_day, period="day", doctor_id=None):
+    """[{'period', 'total', 'pending', 'completed', 'cancelled'}, ...]"""
+    rollups = AppointmentDailyRollup.objects.filter(day__range=(start_day, end_day))
+    if doctor_id:
+        rollups = rollups.filter(doctor_id=doctor_id)
+    rows = rollups.values("day", "status").annotate(count=Sum("count")).order_by()
+    statuses = {status: status for status, _label in Appointment.STATUS_CHOICES}
+    return _series(rows, period, "status", statuses)
+
+
+def registration_series(start_day, end_day, period="day"):
+    """
+    [{'period', 'total', 'doctors', 'patients', 'admins'}, ...]
+
+    Registrations are counted on the signup day under the user's current role.
+    """
+    rows = (
+        RegistrationDailyRollup.objects.filter(day__range=(start_day, end_day))
+        .values("day", "role")
+        .annotate(count=Sum("count"))
+        .order_by()
+    )
+    return _series(rows, period, "role", {"doctor": "doctors", "patient": "patients", "admin": "admins"})
+
+
+def prescription_series(start_day, end_day, period="day", doctor_id=None):
+    """[{'period', 'total'}, ...]"""
+    rollups = PrescriptionDailyRollup.objects.filter(day__range=(start_day, end_day))
+    if doctor_id:
+        rollups = rollups.filter(doctor_id=doctor_id)
+    rows = rollups.values("day").annotate(count=Sum("count")).order_by()
+    return _series(rows, period, None, {})
+
+
+def appointment_totals(start_day=None, end_day=None, doctor_id=None):
+    """{'total', 'pending', 'completed', 'cancelled'} over an optional day range"""
+    rollups = AppointmentDailyRollup.objects.filter(**_rollup_range_filter(start_day, end_day))
+    if doctor_id:
+        rollups = rollups.filter(doctor_id=doctor_id)
+    totals = {status: 0 for status, _label in Appointment.STATUS_CHOICES}
+    for row in rollups.values("status").annotate(count=Sum("count")).order_by():
+        totals[row["status"]] = totals.get(row["status"], 0) + row["count"]
+    totals["total"] = sum(totals.values())
+    return totals
+
+
+def peak_appointment_day():
+    """{'day', 'count'} for the busiest day on record, or None"""
+    return (
+        AppointmentDailyRollup.objects.values("day")
+        .annotate(count=Sum("count"))
+        .order_by("-count", "day")
+        .first()
+    )
@@ -0,0 +1,69 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from users.models import User
+from . import rollups
+from .cache import admin_analytics_snapshot
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    admin_analytics_snapshot.invalidate()
+    previous = None if created else getattr(instance, "_loaded_values", None)
+    if not created and previous is None:
+        # Unknown prior state; the periodic backfill repairs this bucket
+        return
+    rollups.appointment_changed(instance, previous)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_removed(sender, instance, **kwargs):
+    admin_analytics_snapshot.invalidate()
+    rollups.appointment_deleted(instance)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or (update_fields is not None and "role" not in update_fields):
+        return
+    # User does not track loaded values; a role change moves the registration bucket
+    instance._registered_role = User.objects.filter(pk=instance.pk).values_list("role", flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Logins save last_login only, which no analytics figure reads
+    if raw or (update_fields is not None and set(update_fields) <= {"last_login"}):
+        return
+    admin_analytics_snapshot.invalidate()
+    if created:
+        rollups.user_registered(instance)
+        return
+    previous_role = instance.__dict__.pop("_registered_role", None)
+    if previous_role is not None:
+        rollups.user_role_changed(instance, previous_role)
+
+
+@receiver(post_delete, sender=User)
+def user_removed(sender, instance, **kwargs):
+    admin_analytics_snapshot.invalidate()
+    rollups.user_registered(instance, delta=-1)
+
+
+@receiver(post_save, sender=Prescription)
+def prescription_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    admin_analytics_snapshot.invalidate()
+    if created:
+        rollups.prescription_issued(instance)
+
+
+@receiver(post_delete, sender=Prescription)
+def prescription_removed(sender, instance, **kwargs):
+    admin_analytics_snapshot.invalidate()
+    rollups.prescription_issued(instance, delta=-1)
@@ -0,0 +1,153 @@
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from users.models import User
+from . import rollups
+from .cache import SnapshotCache
+from .models import AppointmentDailyRollup, PrescriptionDailyRollup, RegistrationDailyRollup
+
+
+class RollupMaintenanceTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+        self.when = timezone.now() + timedelta(days=2)
+
+    def bucket_count(self, status):
+        row = AppointmentDailyRollup.objects.filter(doctor=self.doctor, status=status).first()
+        return row.count if row else 0
+
+    def test_status_change_moves_between_buckets(self):
+        appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+        self.assertEqual(self.bucket_count("pending"), 1)
+        appointment.status = "cancelled"
+        appointment.save()
+        self.assertEqual(self.bucket_count("pending"), 0)
+        self.assertEqual(self.bucket_count("cancelled"), 1)
+
+    def test_decrement_never_creates_a_bucket(self):
+        rollups.bump(AppointmentDailyRollup, -1, day=self.when.date(), doctor_id=self.doctor.pk,
+                     status="pending", appointment_type="consultation")
+        self.assertFalse(AppointmentDailyRollup.objects.exists())
+
+
+    def registrations(self):
+        return dict(RegistrationDailyRollup.objects.values_list("role", "count"))
+
+    def test_role_change_moves_the_registration(self):
+        self.patient.role = "doctor"
+        self.patient.save()
+        self.assertEqual(self.registrations(), {"doctor": 2, "patient": 0})
+        rollups.rebuild()
+        self.assertEqual(self.registrations(), {"doctor": 2})
+
+    def test_migration_backfills_existing_rows(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+        expected = sorted(AppointmentDailyRollup.objects.values_list("day", "doctor_id", "status", "count"))
+        for model in (AppointmentDailyRollup, RegistrationDailyRollup):
+            model.objects.all().delete()
+        import_module("analytics.migrations.0002_backfill_rollups").fill_rollups(apps, None)
+        self.assertEqual(
+            sorted(AppointmentDailyRollup.objects.values_list("day", "doctor_id", "status", "count")), expected
+        )
+        self.assertEqual(self.registrations(), {"doctor": 1, "patient": 1})
+
+
+class DoctorDeletionTests(TransactionTestCase):
+    """Deleting a doctor cascades through appointments whose signals touch the rollups"""
+
+    def test_delete_doctor_with_appointments(self):
+        doctor = User.objects.create(username="doc", role="doctor")
+        other = User.objects.create(username="other", role="doctor")
+        patient = User.objects.create(username="pat", role="patient")
+        when = timezone.now() + timedelta(days=1)
+        for hours, owner in ((0, doctor), (1, doctor), (2, other)):
+            Appointment.objects.create(
+                patient=patient, doctor=owner, appointment_datetime=when + timedelta(hours=hours)
+            )
+        Prescription.objects.create(
+            appointment=Appointment.objects.filter(doctor=doctor).first(),
+            doctor=doctor, patient=patient, instructions="rest",
+        )
+
+        doctor.delete()
+
+        self.assertFalse(User.objects.filter(pk=doctor.pk).exists())
+        self.assertFalse(AppointmentDailyRollup.objects.filter(doctor_id=doctor.pk).exists())
+        self.assertFalse(PrescriptionDailyRollup.objects.filter(doctor_id=doctor.pk).exists())
+        self.assertEqual(
+            AppointmentDailyRollup.objects.get(doctor=other).count,
+            Appointment.objects.filter(doctor=other).count(),
+        )
+
+
+class ImmediateThread:
+    """Stand-in for threading.Thread that runs the target on start()"""
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@override_settings(TEST_SNAPSHOT_TTL=60, TEST_SNAPSHOT_STALE=300)
+class SnapshotCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.snapshot = SnapshotCache("test", "TEST_SNAPSHOT_TTL", "TEST_SNAPSHOT_STALE")
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return self.builds
+
+    def get(self):
+        # The refresh thread closes its connections; keep the test's open
+        with mock.patch("analytics.cache.threading.Thread", ImmediateThread), \
+                mock.patch("analytics.cache.connections"):
+            return self.snapshot.get(self.build)
+
+    def test_fresh_snapshot_is_served_from_cache(self):
+        self.assertEqual((self.get(), self.get()), (1, 1))
+
+    def test_invalidated_snapshot_is_served_stale_while_refreshing(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.snapshot.invalidate()
+        self.assertEqual(self.get(), 1)
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(self.get(), 2)
+        self.assertIsNone(cache.get(self.snapshot.lock_key))
+
+    def test_held_lock_skips_the_refresh(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.snapshot.invalidate()
+        cache.add(self.snapshot.lock_key, 1)
+        self.assertEqual((self.get(), self.builds), (1, 1))
+
+    def test_too_old_snapshot_is_rebuilt_inline(self):
+        cache.set(self.snapshot.key, (self.snapshot.version(), 0, "ancient"))
+        self.assertEqual(self.get(), 1)
+
+    def test_invalidation_waits_for_the_commit(self):
+        self.get()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.snapshot.invalidate()
+            self.assertEqual((self.get(), self.builds), (1, 1))
+        self.assertEqual(len(callbacks), 1)
+
+    def test_login_saves_leave_the_analytics_snapshot(self):
+        user = User.objects.create(username="pat", role="patient")
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save(update_fields=["last_login"])
+        self.assertEqual(callbacks, [])
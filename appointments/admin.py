@@ -4,7 +4,7 @@ from django.contrib import admin
 
 # appointments/admin.py
 from django.contrib import admin
-from .models import Appointment
+from .models import Appointment, AppointmentReminder, AvailabilityTemplate
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
@@ -13,6 +13,7 @@ class AppointmentAdmin(admin.ModelAdmin):
     search_fields = ('patient__username', 'doctor__username', 'symptoms', 'notes')
     date_hierarchy = 'appointment_datetime'
     ordering = ('-appointment_datetime',)
+    list_select_related = ('patient', 'doctor')
     
     fieldsets = (
         ('Appointment Details', {
@@ -29,3 +30,19 @@ class AppointmentAdmin(admin.ModelAdmin):
     
     readonly_fields = ('created_at', 'updated_at')
 
+
+
+@admin.register(AvailabilityTemplate)
+class AvailabilityTemplateAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'weekday', 'start_time', 'end_time', 'slot_minutes', 'slot_type', 'is_active')
+    list_filter = ('weekday', 'slot_type', 'is_active')
+    search_fields = ('doctor__username',)
+    list_select_related = ('doctor',)
+
+
+@admin.register(AppointmentReminder)
+class AppointmentReminderAdmin(admin.ModelAdmin):
+    list_display = ('appointment', 'kind', 'appointment_datetime', 'recipient', 'sent_at')
+    list_filter = ('kind', 'sent_at')
+    search_fields = ('recipient', 'appointment__patient__username')
+    list_select_related = ('appointment__patient', 'appointment__doctor')
@@ -0,0 +1,329 @@
+"""
+Per-doctor, per-day free-slot index.
+
+A doctor's day is stored as bitmaps of 30-minute slot ordinals
+(bit 0 = 00:00, bit 18 = 09:00, bit 47 = 23:30):
+
+* ``open``      - bookable ordinals (working hours plus regular slots,
+                  minus blocked / unavailable slots)
+* ``emergency`` - ordinals opened by emergency slots
+* ``booked``    - ordinals taken by pending or completed appointments
+
+Entries live in Django's cache. They are built from ``Appointment`` and
+``Slot`` rows on first read, so an availability lookup is usually a single
+cache read. The signal handlers in ``appointments.signals`` delete the
+affected days once the change commits; a rolled-back booking leaves the
+cache alone. Entries are never edited in place, because a read-modify-write
+races with other writers. With a per-process cache, other workers only see
+a change when their own copy expires (``AVAILABILITY_INDEX_TTL``, short by
+default in that case). A slot shown free by mistake is still rejected at
+booking by the ``unique_active_doctor_slot`` constraint.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, Slot
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+WORKDAY_START = time(9, 0)
+WORKDAY_END = time(17, 0)
+
+ACTIVE_STATUSES = Appointment.ACTIVE_STATUSES
+
+CACHE_PREFIX = "availability"
+
+
+def _ttl():
+    return getattr(settings, "AVAILABILITY_INDEX_TTL", 300)
+
+
+def slot_ordinal(value):
+    """Ordinal of the 30-minute slot containing ``value`` (time or aware datetime)"""
+    if isinstance(value, datetime):
+        value = timezone.localtime(value).time()
+    return (value.hour * 60 + value.minute) // SLOT_MINUTES
+
+
+def ordinal_time(ordinal):
+    minutes = ordinal * SLOT_MINUTES
+    return time(minutes // 60, minutes % 60)
+
+
+def range_mask(start, end):
+    """Bitmap covering every slot that overlaps the local-time range [start, end)"""
+    first = slot_ordinal(start)
+    end_minutes = end.hour * 60 + end.minute
+    last = min(-(-end_minutes // SLOT_MINUTES), SLOTS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+WORKDAY_MASK = range_mask(WORKDAY_START, WORKDAY_END)
+
+
+def day_bounds(day):
+    """Aware [start, end) datetimes of a local calendar day"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def span_day_masks(start_time, end_time):
+    """Yield (date, mask) for each local day the span [start_time, end_time) touches"""
+    start = timezone.localtime(start_time)
+    end = timezone.localtime(end_time)
+    day = start.date()
+    while day <= end.date():
+        day_start = start.time() if day == start.date() else time.min
+        if day == end.date():
+            mask = range_mask(day_start, end.time())
+        else:
+            mask = range_mask(day_start, time.max)
+        if mask:
+            yield day, mask
+        day += timedelta(days=1)
+
+
+class DayIndex:
+    """Bitmaps for one doctor on one day"""
+
+    __slots__ = ("open", "emergency", "booked")
+
+    def __init__(self, open=WORKDAY_MASK, emergency=0, booked=0):
+        self.open = open
+        self.emergency = emergency
+        self.booked = booked
+
+    def add_slot(self, slot, mask):
+        if slot.slot_type == "blocked" or not slot.is_available:
+            self.open &= ~mask
+            self.emergency &= ~mask
+        elif slot.slot_type == "emergency":
+            self.emergency |= mask
+        else:
+            self.open |= mask
+
+    def free_mask(self, appointment_type=None):
+        mask = self.open
+        if appointment_type == "emergency":
+            mask |= self.emergency
+        return mask & ~self.booked
+
+    def to_tuple(self):
+        return (self.open, self.emergency, self.booked)
+
+    @classmethod
+    def from_tuple(cls, value):
+        return cls(*value)
+
+
+def _cache_key(doctor_id, day):
+    return f"{CACHE_PREFIX}:{doctor_id}:{day.isoformat()}"
+
+
+def build_day_index(doctor_id, day):
+    """Build the index for one doctor and day straight from the database"""
+    start, end = day_bounds(day)
+    index = DayIndex()
+
+    slots = Slot.objects.filter(
+        doctor_id=doctor_id,
+        start_time__lt=end,
+        end_time__gt=start,
+    ).only("start_time", "end_time", "is_available", "slot_type")
+    for slot in slots:
+        for slot_date, mask in span_day_masks(slot.start_time, slot.end_time):
+            if slot_date == day:
+                index.add_slot(slot, mask)
+
+    booked_times = Appointment.objects.filter(
+        doctor_id=doctor_id,
+        appointment_datetime__gte=start,
+        appointment_datetime__lt=end,
+        status__in=ACTIVE_STATUSES,
+    ).values_list("appointment_datetime", flat=True)
+    for booked_at in booked_times:
+        index.booked |= 1 << slot_ordinal(booked_at)
+
+    return index
+
+
+def get_day_index(doctor_id, day):
+    """Cached index for one doctor and day, built on a miss"""
+    key = _cache_key(doctor_id, day)
+    value = cache.get(key)
+    if value is not None:
+        return DayIndex.from_tuple(value)
+    index = build_day_index(doctor_id, day)
+    cache.set(key, index.to_tuple(), _ttl())
+    return index
+
+
+def store_day_indexes(indexes):
+    """Prime the cache with {(doctor_id, day): DayIndex} built elsewhere"""
+    cache.set_many(
+        {_cache_key(doctor_id, day): index.to_tuple() for (doctor_id, day), index in indexes.items()},
+        _ttl(),
+    )
+
+
+def mask_to_times(mask, day, now=None):
+    """Expand a bitmap into slot start times, dropping ones already past"""
+    now = timezone.localtime(now or timezone.now())
+    if day < now.date():
+        return []
+    if day == now.date():
+        # Only slots that start after the current time
+        first_future = (now.hour * 60 + now.minute) // SLOT_MINUTES + 1
+        mask &= ~((1 << first_future) - 1)
+    times = []
+    while mask:
+        low_bit = mask & -mask
+        times.append(ordinal_time(low_bit.bit_length() - 1))
+        mask ^= low_bit
+    return times
+
+
+def free_slots(doctor_id, day, appointment_type=None, now=None):
+    """Free slot start times for a doctor on a day"""
+    now = now or timezone.now()
+    if day < timezone.localtime(now).date():
+        return []
+    index = get_day_index(doctor_id, day)
+    return mask_to_times(index.free_mask(appointment_type), day, now)
+
+
+def invalidate(doctor_id, day):
+    cache.delete(_cache_key(doctor_id, day))
+
+
+def invalidate_on_commit(entries):
+    """Drop the cached days of {(doctor_id, aware datetime)} once the transaction commits"""
+    keys = {
+        _cache_key(doctor_id, timezone.localtime(when).date())
+        for doctor_id, when in entries
+        if doctor_id is not None and when is not None
+    }
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(list(keys)))
+
+
+def appointment_changed(appointment, previous=None):
+    """
+    Invalidate the days an appointment insert/update touches.
+
+    ``previous`` holds the field values loaded from the database
+    (``Appointment._loaded_values``) or ``None`` for a new row.
+    """
+    new = None
+    if appointment.status in ACTIVE_STATUSES and appointment.appointment_datetime:
+        new = (appointment.doctor_id, appointment.appointment_datetime)
+
+    old = None
+    if previous and previous.get("status") in ACTIVE_STATUSES:
+        old = (previous.get("doctor_id"), previous.get("appointment_datetime"))
+
+    if old == new:
+        return
+    invalidate_on_commit([entry for entry in (old, new) if entry])
+
+
+def appointment_deleted(appointment):
+    if appointment.status in ACTIVE_STATUSES:
+        invalidate_on_commit([(appointment.doctor_id, appointment.appointment_datetime)])
+
+
+def slot_changed(slot, previous=None):
+    """Slots reshape the open bitmaps, so affected days are rebuilt on next read"""
+    spans = [(slot.doctor_id, slot.start_time, slot.end_time)]
+    if previous:
+        spans.append((previous.get("doctor_id"), previous.get("start_time"), previous.get("end_time")))
+    keys = set()
+    for doctor_id, start_time, end_time in spans:
+        if doctor_id is None or not start_time or not end_time:
+            continue
+        for day, _mask in span_day_masks(start_time, end_time):
+            keys.add(_cache_key(doctor_id, day))
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(list(keys)))
+
+
+def build_range_indexes(doctor_ids, start_day, end_day):
+    """
+    Build indexes for several doctors over [start_day, end_day] at once.
+
+    One range query over (doctor, appointment_datetime) and one over slots,
+    then the booked/blocked intervals are subtracted as bitmaps per day.
+    """
+    range_start, _ = day_bounds(start_day)
+    _, range_end = day_bounds(end_day)
+
+    indexes = {}
+    day = start_day
+    while day <= end_day:
+        for doctor_id in doctor_ids:
+            indexes[(doctor_id, day)] = DayIndex()
+        day += timedelta(days=1)
+
+    slots = Slot.objects.filter(
+        doctor_id__in=doctor_ids,
+        start_time__lt=range_end,
+        end_time__gt=range_start,
+    ).only("doctor_id", "start_time", "end_time", "is_available", "slot_type")
+    for slot in slots:
+        for slot_date, mask in span_day_masks(slot.start_time, slot.end_time):
+            index = indexes.get((slot.doctor_id, slot_date))
+            if index is not None:
+                index.add_slot(slot, mask)
+
+    booked = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        appointment_datetime__gte=range_start,
+        appointment_datetime__lt=range_end,
+        status__in=ACTIVE_STATUSES,
+    ).values_list("doctor_id", "appointment_datetime")
+    for doctor_id, booked_at in booked:
+        local = timezone.localtime(booked_at)
+        index = indexes.get((doctor_id, local.date()))
+        if index is not None:
+            index.booked |= 1 << slot_ordinal(local)
+
+    return indexes
+
+
+def search_free_slots(doctor_ids, start_day, end_day, appointment_type=None, now=None):
+    """
+    Free slots for many doctors over a date range.
+
+    Returns {doctor_id: {date: [time, ...]}}. Cached day indexes are reused;
+    anything missing is built with a single batch of range queries and
+    written back to the cache.
+    """
+    now = now or timezone.now()
+    start_day = max(start_day, timezone.localtime(now).date())
+    results = {doctor_id: {} for doctor_id in doctor_ids}
+    if not doctor_ids or start_day > end_day:
+        return results
+
+    days = [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+    keys = {_cache_key(doctor_id, day): (doctor_id, day) for doctor_id in doctor_ids for day in days}
+    cached = cache.get_many(list(keys))
+    indexes = {keys[key]: DayIndex.from_tuple(value) for key, value in cached.items()}
+
+    missing_doctors = sorted({doctor_id for key, (doctor_id, _day) in keys.items() if key not in cached})
+    if missing_doctors:
+        built = build_range_indexes(missing_doctors, start_day, end_day)
+        fresh = {pair: index for pair, index in built.items() if _cache_key(*pair) not in cached}
+        store_day_indexes(fresh)
+        indexes.update(fresh)
+
+    for (doctor_id, day), index in indexes.items():
+        results[doctor_id][day] = mask_to_times(index.free_mask(appointment_type), day, now)
+    return results
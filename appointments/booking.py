@@ -0,0 +1,84 @@
+"""
+Booking engine.
+
+Double bookings are prevented by the ``unique_active_doctor_slot`` partial
+unique constraint rather than by a check-then-insert: a booking is a single
+INSERT (a reschedule a single UPDATE), and the database rejects whichever of
+two concurrent requests loses the race. That ``IntegrityError`` is mapped to
+``BookingConflict`` for the views to report.
+"""
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Appointment
+
+CONSTRAINT_NAME = "unique_active_doctor_slot"
+
+
+class BookingConflict(Exception):
+    """The doctor already has an active appointment at the requested time"""
+
+
+def _sqlite_unique_message():
+    table = Appointment._meta.db_table
+    columns = ", ".join(
+        f"{table}.{Appointment._meta.get_field(name).column}" for name in ("doctor", "appointment_datetime")
+    )
+    return f"UNIQUE constraint failed: {columns}"
+
+
+def _is_slot_conflict(exc):
+    """
+    Whether ``exc`` is a violation of the slot constraint. Postgres names the
+    constraint; SQLite only reports the constrained columns. Any other
+    integrity error (NOT NULL, foreign keys) is left to propagate.
+    """
+    message = str(exc)
+    return CONSTRAINT_NAME in message or _sqlite_unique_message() in message
+
+
+def _check_future(when):
+    if when <= timezone.now():
+        raise ValidationError("Appointments must be scheduled for future dates.")
+
+
+def book(patient, doctor, when, **fields):
+    """Create a pending appointment, raising BookingConflict if the slot is taken"""
+    _check_future(when)
+    appointment = Appointment(
+        patient=patient,
+        doctor=doctor,
+        appointment_datetime=when,
+        **fields
+    )
+    try:
+        with transaction.atomic():
+            appointment.save(validate=False)
+    except IntegrityError as exc:
+        if _is_slot_conflict(exc):
+            raise BookingConflict("This doctor is already booked at the selected time.") from exc
+        raise
+    return appointment
+
+
+def reschedule(appointment, when):
+    """Move an appointment to a new time, raising BookingConflict if it is taken"""
+    _check_future(when)
+    old_datetime = appointment.appointment_datetime
+    old_rescheduled = appointment.is_rescheduled
+    appointment.appointment_datetime = when
+    appointment.is_rescheduled = True
+    try:
+        with transaction.atomic():
+            appointment.save(
+                validate=False,
+                update_fields=["appointment_datetime", "is_rescheduled", "updated_at"],
+            )
+    except IntegrityError as exc:
+        appointment.appointment_datetime = old_datetime
+        appointment.is_rescheduled = old_rescheduled
+        if _is_slot_conflict(exc):
+            raise BookingConflict("Doctor is already booked at this time.") from exc
+        raise
+    return appointment
@@ -0,0 +1,139 @@
+"""
+Periodic appointment jobs (see ``users.jobs`` for the runner).
+
+``sweep_missed`` moves pending appointments more than
+``APPOINTMENT_MISSED_AFTER_HOURS`` past their time to ``missed``, so the
+"overdue" queries only ever see the last day or so of appointments.
+Rows are saved one by one so the usual signal handlers keep counters,
+rollups, notifications and dashboard caches in step.
+
+``send_reminders`` emails patients 24 hours and 1 hour before pending
+appointments through ``EMAIL_BACKEND``. Each batch first commits its
+``AppointmentReminder`` claims, whose unique constraint means a reminder is
+sent at most once per appointment time, and then sends outside the
+transaction, so no locks are held during the SMTP round trip. A batch whose
+send raises deletes its claims and is retried on the next run; a worker
+that dies between the commit and the send loses that batch's reminders.
+With the outbox backend the send is only an insert into the queue.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage, get_connection
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Appointment, AppointmentReminder
+
+logger = logging.getLogger(__name__)
+
+# Reminder kinds, nearest first: each covers the appointments between its
+# lead time and the next shorter one
+REMINDERS = (("1h", timedelta(hours=1)), ("24h", timedelta(hours=24)))
+
+
+# ===== Missed appointments =====
+
+def _after(queryset, cursor):
+    """Rows ordered after the ``[appointment_datetime, id]`` cursor"""
+    when, pk = parse_datetime(cursor[0]), cursor[1]
+    return queryset.filter(Q(appointment_datetime__gt=when) | Q(appointment_datetime=when, id__gt=pk))
+
+
+def sweep_missed(checkpoint, batch_size):
+    cutoff = timezone.now() - timedelta(hours=settings.APPOINTMENT_MISSED_AFTER_HOURS)
+    cursor = checkpoint.cursor.get("after")
+    while True:
+        with transaction.atomic():
+            overdue = Appointment.objects.filter(
+                status="pending", appointment_datetime__lt=cutoff
+            ).order_by("appointment_datetime", "id")
+            if cursor:
+                overdue = _after(overdue, cursor)
+            # Rows a doctor is updating right now are left for the next pass
+            batch = list(overdue.select_for_update(skip_locked=True)[:batch_size])
+            if not batch:
+                return
+            marked = 0
+            for appointment in batch:
+                appointment.status = "missed"
+                try:
+                    with transaction.atomic():
+                        appointment.save()
+                    marked += 1
+                except (ValidationError, DatabaseError):
+                    logger.exception("Could not mark appointment #%s missed", appointment.pk)
+            last = batch[-1]
+            cursor = [last.appointment_datetime.isoformat(), last.pk]
+        yield marked, {"after": cursor}
+
+
+# ===== Reminders =====
+
+def _due(kind, lead, nearer, now):
+    """Pending appointments in the kind's window without that reminder for their current time"""
+    reminded = AppointmentReminder.objects.filter(
+        appointment=OuterRef("pk"), kind=kind, appointment_datetime=OuterRef("appointment_datetime")
+    )
+    return (
+        Appointment.objects.filter(
+            status="pending",
+            appointment_datetime__gt=now + nearer,
+            appointment_datetime__lte=now + lead,
+        )
+        .annotate(recipient=Coalesce(NullIf("email", Value("")), NullIf("patient__email", Value(""))))
+        .filter(recipient__isnull=False)
+        .exclude(Exists(reminded))
+        .select_related("patient", "doctor")
+        .order_by("appointment_datetime", "id")
+    )
+
+
+def reminder_message(appointment, kind):
+    when = timezone.localtime(appointment.appointment_datetime)
+    context = {"appointment": appointment, "when": when, "kind": kind}
+    return EmailMessage(
+        subject=f"Reminder: appointment with Dr. {appointment.doctor.username} on {when:%b %d at %H:%M}",
+        body=render_to_string("appointments/reminder_email.txt", context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[appointment.recipient],
+    )
+
+
+def send_reminders(checkpoint, batch_size):
+    now = timezone.now()
+    nearer = timedelta(0)
+    for kind, lead in REMINDERS:
+        while True:
+            with transaction.atomic():
+                batch = list(_due(kind, lead, nearer, now)[:batch_size])
+                if not batch:
+                    break
+                claims, messages = [], []
+                for appointment in batch:
+                    try:
+                        with transaction.atomic():
+                            claims.append(AppointmentReminder.objects.create(
+                                appointment=appointment,
+                                kind=kind,
+                                appointment_datetime=appointment.appointment_datetime,
+                                recipient=appointment.recipient,
+                            ).pk)
+                    except IntegrityError:
+                        # Claimed by a concurrent run
+                        continue
+                    messages.append(reminder_message(appointment, kind))
+            try:
+                get_connection().send_messages(messages)
+            except Exception:
+                # Free the claims so the next run retries the batch
+                AppointmentReminder.objects.filter(pk__in=claims).delete()
+                raise
+            yield len(messages), {}
+        nearer = lead
@@ -0,0 +1,134 @@
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Count
+from django.utils import timezone
+
+from appointments import booking
+from appointments.models import Appointment
+from users.models import User
+
+BENCH_PREFIX = "bench_booking_"
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent booking load test comparing the legacy check-then-insert "
+        "path with the constraint-backed booking engine. Creates throwaway "
+        "bench users in the configured database and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--attempts", type=int, default=25, help="Booking attempts per worker")
+        parser.add_argument("--slots", type=int, default=20, help="Contended slots per run")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        self._cleanup()
+        doctor = User.objects.create(username=f"{BENCH_PREFIX}doctor", role="doctor")
+        patients = [
+            User.objects.create(username=f"{BENCH_PREFIX}patient_{i}", role="patient")
+            for i in range(options["workers"])
+        ]
+        try:
+            for offset, (label, attempt) in enumerate((
+                ("legacy check-then-insert", self._legacy_attempt),
+                ("booking engine", self._engine_attempt),
+            )):
+                # Each run gets its own day so the two never contend with each other
+                base = (timezone.now() + timedelta(days=30 + offset)).replace(
+                    hour=9, minute=0, second=0, microsecond=0
+                )
+                slot_times = [base + timedelta(minutes=30 * i) for i in range(options["slots"])]
+                result = self._run(doctor, patients, slot_times, attempt, options["attempts"])
+                self._report(label, result, doctor)
+        finally:
+            self._cleanup()
+
+    def _legacy_attempt(self, patient, doctor, when):
+        """The pre-engine view logic: exists() check, then save() re-running clean()"""
+        if Appointment.objects.filter(
+            doctor=doctor,
+            appointment_datetime=when,
+            status__in=Appointment.ACTIVE_STATUSES,
+        ).exists():
+            return "conflict"
+        try:
+            Appointment.objects.create(patient=patient, doctor=doctor, appointment_datetime=when)
+        except IntegrityError:
+            # Passed the check but lost the race: a double booking without the constraint
+            return "race"
+        except Exception:
+            # clean() saw the competing row
+            return "conflict"
+        return "booked"
+
+    def _engine_attempt(self, patient, doctor, when):
+        try:
+            booking.book(patient, doctor, when)
+        except booking.BookingConflict:
+            return "conflict"
+        return "booked"
+
+    def _run(self, doctor, patients, slot_times, attempt, attempts):
+        counts = {"booked": 0, "conflict": 0, "race": 0, "error": 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(patients))
+
+        def worker(patient):
+            local = dict.fromkeys(counts, 0)
+            barrier.wait()
+            try:
+                for _ in range(attempts):
+                    try:
+                        outcome = attempt(patient, doctor, random.choice(slot_times))
+                    except OperationalError:
+                        outcome = "error"
+                    local[outcome] += 1
+            finally:
+                connection.close()
+            with lock:
+                for key, value in local.items():
+                    counts[key] += value
+
+        threads = [threading.Thread(target=worker, args=(patient,)) for patient in patients]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counts["elapsed"] = time.perf_counter() - started
+        counts["slot_times"] = slot_times
+        return counts
+
+    def _report(self, label, result, doctor):
+        total = result["booked"] + result["conflict"] + result["race"] + result["error"]
+        double_booked = (
+            Appointment.objects.filter(
+                doctor=doctor,
+                appointment_datetime__in=result["slot_times"],
+                status__in=Appointment.ACTIVE_STATUSES,
+            )
+            .values("appointment_datetime")
+            .annotate(total=Count("id"))
+            .filter(total__gt=1)
+            .count()
+        )
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write(
+            f"  attempts={total} booked={result['booked']} conflicts={result['conflict']} "
+            f"lost_races={result['race']} db_errors={result['error']}"
+        )
+        self.stdout.write(
+            f"  elapsed={result['elapsed']:.2f}s throughput={total / result['elapsed']:.1f} attempts/s "
+            f"double_booked_slots={double_booked}"
+        )
+
+    def _cleanup(self):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
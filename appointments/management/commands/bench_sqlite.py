@@ -0,0 +1,163 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from appointments import booking
+from appointments.schedule import build_schedule
+from users.models import User
+
+BENCH_PREFIX = "bench_sqlite_"
+
+PROFILES = {
+    "default": {"SQLITE_TUNING": "False"},
+    "tuned": {"SQLITE_TUNING": "True"},
+}
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Multi-process read/booking load against a throwaway SQLite file, once "
+        "with the stock settings and once with SQLITE_TUNING=True, to compare "
+        "throughput, latency and 'database is locked' errors. Each worker is a "
+        "separate process, like gunicorn workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=10.0, help="Load duration per profile")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of operations that book")
+        parser.add_argument("--profile", action="append", choices=sorted(PROFILES),
+                            help="Only run this profile (repeatable)")
+        # Internal: run inside the subprocesses
+        parser.add_argument("--setup", action="store_true", help="(internal) create bench users")
+        parser.add_argument("--worker", type=int, help="(internal) worker number")
+        parser.add_argument("--start-at", type=float, help="(internal) shared start time")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite" and (options["setup"] or options["worker"] is not None):
+            raise CommandError("bench_sqlite workers must run against SQLite")
+        if options["setup"]:
+            return self._setup(options["workers"])
+        if options["worker"] is not None:
+            return self._work(options)
+
+        for name in options["profile"] or PROFILES:
+            with tempfile.TemporaryDirectory(prefix="bench-sqlite-") as directory:
+                env = dict(os.environ, **PROFILES[name])
+                env["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.sqlite3')}"
+                env.pop("DATABASE_REPLICA_URL", None)
+                self._manage(env, "migrate", "--noinput", "-v0")
+                self._manage(env, "bench_sqlite", "--setup", "--workers", str(options["workers"]))
+                results = self._run_workers(env, options)
+            self._report(name, results, options["seconds"])
+
+    # ===== Parent =====
+
+    def _manage(self, env, *arguments):
+        subprocess.run([sys.executable, "manage.py", *arguments], env=env, check=True)
+
+    def _run_workers(self, env, options):
+        # Leave time for every worker to import Django before the clock starts
+        start_at = time.time() + 3
+        processes = [
+            subprocess.Popen(
+                [
+                    sys.executable, "manage.py", "bench_sqlite",
+                    "--worker", str(number),
+                    "--workers", str(options["workers"]),
+                    "--seconds", str(options["seconds"]),
+                    "--write-ratio", str(options["write_ratio"]),
+                    "--start-at", str(start_at),
+                ],
+                env=env,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            for number in range(options["workers"])
+        ]
+        results = []
+        for process in processes:
+            output, _ = process.communicate()
+            if process.returncode:
+                raise CommandError(f"bench worker exited with status {process.returncode}")
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        return results
+
+    def _report(self, name, results, seconds):
+        latencies = {"read": [], "write": []}
+        totals = {"read": 0, "write": 0, "conflict": 0, "locked": 0}
+        for result in results:
+            for key in totals:
+                totals[key] += result[key]
+            for kind in latencies:
+                latencies[kind].extend(result[f"{kind}_latencies"])
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({PROFILES[name]})"))
+        self.stdout.write(
+            f"  reads={totals['read']} ({totals['read'] / seconds:.0f}/s) "
+            f"bookings={totals['write']} ({totals['write'] / seconds:.0f}/s) "
+            f"conflicts={totals['conflict']} database_locked={totals['locked']}"
+        )
+        for kind, values in latencies.items():
+            self.stdout.write(
+                f"  {kind:5} p50={_percentile(values, 0.5) * 1000:.1f}ms "
+                f"p95={_percentile(values, 0.95) * 1000:.1f}ms "
+                f"p99={_percentile(values, 0.99) * 1000:.1f}ms"
+            )
+
+    # ===== Subprocesses =====
+
+    def _setup(self, workers):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        User.objects.bulk_create(
+            [User(username=f"{BENCH_PREFIX}doctor_{i}", role="doctor") for i in range(4)]
+            + [User(username=f"{BENCH_PREFIX}patient_{i}", role="patient") for i in range(workers)]
+        )
+
+    def _work(self, options):
+        random.seed(options["worker"])
+        doctors = list(User.objects.filter(username__startswith=f"{BENCH_PREFIX}doctor_"))
+        patient = User.objects.get(username=f"{BENCH_PREFIX}patient_{options['worker']}")
+        base = (timezone.now() + timedelta(days=1)).replace(hour=8, minute=0, second=0, microsecond=0)
+        today = timezone.localdate()
+        counts = {"read": 0, "write": 0, "conflict": 0, "locked": 0}
+        latencies = {"read_latencies": [], "write_latencies": []}
+
+        time.sleep(max(0.0, options["start_at"] - time.time()))
+        deadline = time.monotonic() + options["seconds"]
+        while time.monotonic() < deadline:
+            doctor = random.choice(doctors)
+            writes = random.random() < options["write_ratio"]
+            started = time.perf_counter()
+            try:
+                if writes:
+                    when = base + timedelta(minutes=30 * random.randrange(2000))
+                    booking.book(patient, doctor, when)
+                else:
+                    build_schedule(doctor.pk, today, today + timedelta(days=7)).total()
+            except booking.BookingConflict:
+                counts["conflict"] += 1
+            except OperationalError:
+                # "database is locked": the busy timeout ran out
+                counts["locked"] += 1
+                continue
+            kind = "write" if writes else "read"
+            counts[kind] += 1
+            latencies[f"{kind}_latencies"].append(time.perf_counter() - started)
+
+        self.stdout.write(json.dumps({**counts, **latencies}))
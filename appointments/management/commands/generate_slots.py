@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from appointments.slots import generate_slots
+
+
+class Command(BaseCommand):
+    help = "Pre-materialize Slot rows from doctors' recurring availability templates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--weeks", type=int, default=4, help="Weeks ahead to generate (default 4)")
+        parser.add_argument("--start", help="First date to generate, YYYY-MM-DD (default today)")
+        parser.add_argument("--doctor", type=int, action="append", dest="doctors", help="Limit to a doctor id (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be created without writing")
+
+    def handle(self, *args, **options):
+        start_day = timezone.localdate()
+        if options["start"]:
+            start_day = parse_date(options["start"])
+            if start_day is None:
+                raise CommandError("--start must be a date in YYYY-MM-DD format")
+        if options["weeks"] < 1:
+            raise CommandError("--weeks must be at least 1")
+        end_day = start_day + timedelta(weeks=options["weeks"]) - timedelta(days=1)
+
+        result = generate_slots(
+            start_day,
+            end_day,
+            doctor_ids=options["doctors"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        verb = "Would create" if options["dry_run"] else "Created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.created} slots for {start_day} to {end_day} "
+            f"(already existed: {result.existing}, overlapping other slots: {result.overlapping}, "
+            f"in the past: {result.past})"
+        ))
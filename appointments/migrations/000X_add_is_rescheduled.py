@@ -1,17 +1,19 @@
 # Generated migration file - save as: appointments/migrations/000X_add_is_rescheduled.py
 
-from django.db import migrations, models
+from django.db import migrations
+
 
 class Migration(migrations.Migration):
+    """
+    Kept empty for the 0008 merge. It used to add ``is_rescheduled``, which
+    0006 adds as well: SQLite rebuilt the table over the duplicate, but
+    PostgreSQL stopped at 0006 with "column already exists". 0009 adds the
+    field in its final form, and databases that already applied this
+    migration are unaffected.
+    """
 
     dependencies = [
-        ('appointments', '0001_initial'),  # Replace with your last migration number
+        ('appointments', '0001_initial'),
     ]
 
-    operations = [
-        migrations.AddField(
-            model_name='appointment',
-            name='is_rescheduled',
-            field=models.BooleanField(default=False, help_text='True if this appointment has been rescheduled'),
-        ),
-    ]
\ No newline at end of file
+    operations = []
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cancel_duplicate_bookings(apps, schema_editor):
+    """
+    Double bookings made before the constraint existed would block it.
+    Keep the earliest booking for each doctor/time and cancel the rest.
+    """
+    Appointment = apps.get_model('appointments', 'Appointment')
+    duplicates = (
+        Appointment.objects.filter(status__in=['pending', 'completed'])
+        .values('doctor_id', 'appointment_datetime')
+        .annotate(total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        extra_ids = list(
+            Appointment.objects.filter(
+                doctor_id=row['doctor_id'],
+                appointment_datetime=row['appointment_datetime'],
+                status__in=['pending', 'completed'],
+            ).order_by('created_at', 'id').values_list('id', flat=True)[1:]
+        )
+        Appointment.objects.filter(id__in=extra_ids).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_alter_slot_options_alter_appointment_unique_together_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'completed'])), fields=('doctor', 'appointment_datetime'), name='unique_active_doctor_slot'),
+        ),
+    ]
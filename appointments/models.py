@@ -1,17 +1,90 @@
+from collections import Counter
+
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.core.exceptions import ValidationError
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 
 User = get_user_model()
 
-class Appointment(models.Model):
+# How often Appointment.save() ran or skipped its validation query and how
+# many saves were narrowed to the changed columns
+save_counters = Counter()
+
+
+class LoadedValuesMixin:
+    """Remember the column values an instance was loaded or last saved with"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None:
+            return
+        if fields is None:
+            refreshed = self._meta.concrete_fields
+        else:
+            # Only the reloaded fields match the database again; others keep
+            # their pending changes
+            refreshed = []
+            for name in fields:
+                try:
+                    field = self._meta.get_field(name)
+                except FieldDoesNotExist:
+                    continue  # a prefetched relation
+                if field.concrete:
+                    refreshed.append(field)
+        for field in refreshed:
+            if field.attname in self.__dict__:
+                loaded[field.attname] = self.__dict__[field.attname]
+
+    def _snapshot_loaded_values(self, update_fields=None):
+        """Record the values just written: all of them, or only ``update_fields``"""
+        loaded = getattr(self, "_loaded_values", None)
+        if update_fields is None or loaded is None:
+            self._loaded_values = loaded = {}
+            fields = self._meta.concrete_fields
+        else:
+            fields = [self._meta.get_field(name) for name in update_fields]
+        for field in fields:
+            if field.attname in self.__dict__:
+                loaded[field.attname] = self.__dict__[field.attname]
+
+    def get_dirty_fields(self):
+        """
+        Names of concrete fields changed since load, or ``None`` when the
+        instance was never loaded (everything must be written).
+        """
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None or self._state.adding:
+            return None
+        dirty = set()
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if field.attname not in loaded or self.__dict__[field.attname] != loaded[field.attname]:
+                dirty.add(field.name)
+        return dirty
+
+
+class Appointment(LoadedValuesMixin, models.Model):
     STATUS_CHOICES = [
         ("pending", "Pending"),
         ("completed", "Completed"),
         ("cancelled", "Cancelled"),
+        # Set by the sweep_missed job on pending appointments well past their time
+        ("missed", "Missed"),
     ]
 
+    # Statuses that occupy the doctor's time slot
+    ACTIVE_STATUSES = ("pending", "completed")
+
     TYPE_CHOICES = [
         ("consultation", "Consultation"),
         ("follow_up", "Follow-up"),
@@ -79,29 +152,42 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ["-appointment_datetime"]
-        # Remove unique constraint to allow rescheduling
+        # Only active appointments hold a slot; cancelled ones may share the time
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_datetime'],
+                condition=Q(status__in=["pending", "completed"]),
+                name='unique_active_doctor_slot',
+            ),
+        ]
         indexes = [
             models.Index(fields=['doctor', 'appointment_datetime']),
             models.Index(fields=['patient', 'status']),
             models.Index(fields=['appointment_datetime']),
+            # Overdue pending appointments (sweep_missed, reminders, stats)
+            models.Index(fields=['status', 'appointment_datetime']),
         ]
 
     def clean(self):
         """Custom validation"""
         super().clean()
-        
+        self._validate_future()
+        self._validate_no_conflict()
+
+    def _validate_future(self):
         # Validate appointment is in the future (except for completed ones)
-        if self.appointment_datetime and self.status not in ['completed', 'cancelled']:
+        if self.appointment_datetime and self.status not in ['completed', 'cancelled', 'missed']:
             if self.appointment_datetime <= timezone.now():
                 raise ValidationError("Appointments must be scheduled for future dates.")
 
-        
+    def _validate_no_conflict(self):
         # Check for conflicts only if not cancelled
         if self.status != "cancelled" and self.appointment_datetime:
+            save_counters["conflict_checks"] += 1
             conflict = Appointment.objects.filter(
-                doctor=self.doctor,
+                doctor_id=self.doctor_id,
                 appointment_datetime=self.appointment_datetime,
-                status__in=["pending", "completed"]
+                status__in=self.ACTIVE_STATUSES
             ).exclude(id=self.id if self.id else None)
             
             if conflict.exists():
@@ -109,9 +195,64 @@ class Appointment(models.Model):
                     f"Dr. {self.doctor.username} already has an appointment at this time."
                 )
 
-    def save(self, *args, **kwargs):
-        self.clean()
+    def _slot_changed(self, changed):
+        """Whether the changed fields could make this appointment collide with another"""
+        if changed is None:
+            return True
+        if {"doctor", "appointment_datetime"} & changed:
+            return True
+        # Reactivating a cancelled appointment claims its slot again
+        return (
+            "status" in changed
+            and self.status in self.ACTIVE_STATUSES
+            and self._previous_status() not in self.ACTIVE_STATUSES
+        )
+
+    def _previous_status(self):
+        # None (treated as inactive) for instances that were never loaded,
+        # e.g. Appointment(pk=..., status=...).save(update_fields=[...])
+        loaded = getattr(self, "_loaded_values", None)
+        return loaded.get("status") if loaded else None
+
+    def save(self, *args, validate=True, skip_unchanged=False, **kwargs):
+        """
+        Save with model validation, writing only the columns that changed.
+
+        Updates of loaded instances are narrowed to the dirty fields (plus
+        ``updated_at``), and the conflict query only runs when the doctor,
+        time or an inactive-to-active status change could cause a clash.
+        Status and notes updates therefore cost a single UPDATE.
+
+        Saving an unchanged instance still touches ``updated_at`` and sends
+        ``post_save``; pass ``skip_unchanged=True`` to skip the write (and the
+        signals) entirely.
+
+        ``validate=False`` is for callers such as ``appointments.booking``
+        that rely on the ``unique_active_doctor_slot`` constraint instead of
+        the conflict query in ``clean()``.
+        """
+        dirty = self.get_dirty_fields()
+        update_fields = kwargs.get("update_fields")
+        if dirty is not None and update_fields is None and not kwargs.get("force_insert"):
+            if not dirty and skip_unchanged:
+                save_counters["writes_skipped"] += 1
+                return
+            kwargs["update_fields"] = sorted(dirty | {"updated_at"})
+            save_counters["narrow_updates"] += 1
+
+        changed = dirty
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            changed = update_fields if dirty is None else dirty & update_fields
+
+        if validate:
+            if self._slot_changed(changed):
+                self._validate_future()
+                self._validate_no_conflict()
+            else:
+                save_counters["conflict_checks_skipped"] += 1
         super().save(*args, **kwargs)
+        self._snapshot_loaded_values(kwargs.get("update_fields"))
 
     @property
     def is_upcoming(self):
@@ -143,7 +284,7 @@ class Appointment(models.Model):
         return f"{self.patient.username} → Dr. {self.doctor.username} on {self.appointment_datetime.strftime('%Y-%m-%d %H:%M')} ({self.status})"
 
 
-class Slot(models.Model):
+class Slot(LoadedValuesMixin, models.Model):
     """Doctor availability slots"""
     doctor = models.ForeignKey(
         User, 
@@ -183,6 +324,7 @@ class Slot(models.Model):
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
+        self._snapshot_loaded_values(kwargs.get("update_fields"))
 
     @property
     def duration(self):
@@ -196,5 +338,117 @@ class Slot(models.Model):
         return f"Dr. {self.doctor.username}: {self.start_time.strftime('%Y-%m-%d %H:%M')} - {self.end_time.strftime('%H:%M')} ({status})"
 
 
+class AppointmentReminder(models.Model):
+    """
+    A reminder email sent (or being sent) by the send_reminders job.
+
+    One row per appointment, kind and appointment time: the unique
+    constraint makes each reminder go out once, and a rescheduled
+    appointment gets fresh reminders for its new time.
+    """
+    KIND_CHOICES = [
+        ("24h", "24 hours before"),
+        ("1h", "1 hour before"),
+    ]
+
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name="reminders"
+    )
+    kind = models.CharField(max_length=3, choices=KIND_CHOICES)
+    appointment_datetime = models.DateTimeField()
+    recipient = models.EmailField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-sent_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["appointment", "kind", "appointment_datetime"],
+                name="unique_appointment_reminder",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} reminder for appointment #{self.appointment_id} to {self.recipient}"
+
+
+class AvailabilityTemplate(models.Model):
+    """Recurring weekly availability that is expanded into Slot rows"""
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    doctor = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="availability_templates"
+    )
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+    slot_type = models.CharField(
+        max_length=20,
+        choices=Slot.SLOT_TYPES,
+        default='regular'
+    )
+    is_active = models.BooleanField(default=True)
+
+    # Optional window the template applies to
+    valid_from = models.DateField(blank=True, null=True)
+    valid_until = models.DateField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['doctor', 'weekday', 'start_time']
+
+    def clean(self):
+        super().clean()
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError("Start time must be before end time.")
+        if not self.slot_minutes:
+            raise ValidationError("Slot length must be at least one minute.")
+        if self.valid_from and self.valid_until and self.valid_from > self.valid_until:
+            raise ValidationError("Valid from must not be after valid until.")
+        if self.is_active and self.doctor_id and self.weekday is not None and self.start_time and self.end_time:
+            overlapping = AvailabilityTemplate.objects.filter(
+                doctor_id=self.doctor_id,
+                weekday=self.weekday,
+                is_active=True,
+                start_time__lt=self.end_time,
+                end_time__gt=self.start_time,
+            ).exclude(pk=self.pk)
+            if self.valid_until:
+                overlapping = overlapping.filter(Q(valid_from__isnull=True) | Q(valid_from__lte=self.valid_until))
+            if self.valid_from:
+                overlapping = overlapping.filter(Q(valid_until__isnull=True) | Q(valid_until__gte=self.valid_from))
+            if overlapping.exists():
+                raise ValidationError("This overlaps another active availability template for the doctor.")
+
+    def applies_on(self, day):
+        """Whether this template produces slots on the given date"""
+        if not self.is_active or day.weekday() != self.weekday:
+            return False
+        if self.valid_from and day < self.valid_from:
+            return False
+        if self.valid_until and day > self.valid_until:
+            return False
+        return True
+
+    def __str__(self):
+        return (
+            f"Dr. {self.doctor.username}: {self.get_weekday_display()} "
+            f"{self.start_time.strftime('%H:%M')}-{self.end_time.strftime('%H:%M')} "
+            f"every {self.slot_minutes} min ({self.slot_type})"
+        )
+
+
 # Prescription model removed from here since you have a separate prescriptions app
 # The dashboard will work with your existing prescriptions.Prescription model
\ No newline at end of file
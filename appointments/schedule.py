@@ -0,0 +1,146 @@
+"""
+Calendar-shaped appointment schedules.
+
+``build_schedule()`` loads every appointment for one or more doctors over a
+day range with a single range query on ``appointment_datetime`` and groups
+the rows by local date in Python, so a week (or month) view costs one
+round-trip instead of one query per day.
+"""
+import calendar
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .availability import day_bounds
+from .models import Appointment
+
+PERIODS = ("day", "week", "month")
+
+# Longest custom range a schedule may span
+MAX_SCHEDULE_DAYS = 62
+
+
+def parse_day(value):
+    """Date from a YYYY-MM-DD query parameter, or None when missing/invalid"""
+    try:
+        return parse_date(value or "")
+    except ValueError:
+        return None
+
+
+def period_range(period, anchor):
+    """(start_day, end_day) of the day/week/month containing ``anchor``"""
+    if period == "day":
+        return anchor, anchor
+    if period == "month":
+        last = calendar.monthrange(anchor.year, anchor.month)[1]
+        return anchor.replace(day=1), anchor.replace(day=last)
+    start = anchor - timedelta(days=anchor.weekday())
+    return start, start + timedelta(days=6)
+
+
+@dataclass
+class ScheduleDay:
+    day: date
+    appointments: list = field(default_factory=list)
+    is_today: bool = False
+
+    def __iter__(self):
+        return iter(self.appointments)
+
+    def __len__(self):
+        return len(self.appointments)
+
+    def for_doctor(self, doctor_id):
+        return [appointment for appointment in self.appointments if appointment.doctor_id == doctor_id]
+
+    def count_by_status(self):
+        counts = defaultdict(int)
+        for appointment in self.appointments:
+            counts[appointment.status] += 1
+        return dict(counts)
+
+
+@dataclass
+class Schedule:
+    """Every day in [start, end] in order, each holding its appointments sorted by time"""
+    start: date
+    end: date
+    days: list
+
+    def __iter__(self):
+        return iter(self.days)
+
+    def day(self, day):
+        if self.start <= day <= self.end:
+            return self.days[(day - self.start).days]
+        return ScheduleDay(day)
+
+    def items(self):
+        """(date, appointments) pairs, as the old per-day dict exposed"""
+        return [(schedule_day.day, schedule_day.appointments) for schedule_day in self.days]
+
+    @property
+    def today(self):
+        for schedule_day in self.days:
+            if schedule_day.is_today:
+                return schedule_day.appointments
+        return []
+
+    def appointments(self):
+        return [appointment for schedule_day in self.days for appointment in schedule_day.appointments]
+
+    def total(self):
+        return sum(len(schedule_day) for schedule_day in self.days)
+
+
+def _schedule_queryset(doctor_ids, start_day, end_day, statuses, related):
+    range_start, _ = day_bounds(start_day)
+    _, range_end = day_bounds(end_day)
+
+    appointments = Appointment.objects.filter(
+        appointment_datetime__gte=range_start,
+        appointment_datetime__lt=range_end,
+    )
+    if isinstance(doctor_ids, int):
+        appointments = appointments.filter(doctor_id=doctor_ids)
+    elif doctor_ids is not None:
+        appointments = appointments.filter(doctor_id__in=list(doctor_ids))
+    if statuses:
+        appointments = appointments.filter(status__in=statuses)
+    if related:
+        appointments = appointments.select_related(*related)
+    return appointments.order_by("appointment_datetime", "id")
+
+
+def _group(appointments, start_day, end_day, now):
+    today = timezone.localtime(now or timezone.now()).date()
+    days = []
+    day = start_day
+    while day <= end_day:
+        days.append(ScheduleDay(day, is_today=day == today))
+        day += timedelta(days=1)
+
+    for appointment in appointments:
+        local_day = timezone.localtime(appointment.appointment_datetime).date()
+        days[(local_day - start_day).days].appointments.append(appointment)
+
+    return Schedule(start_day, end_day, days)
+
+
+def build_schedule(doctor_ids, start_day, end_day, statuses=None, related=("patient",), now=None):
+    """
+    Schedule for ``doctor_ids`` (one id, an iterable, or ``None`` for every
+    doctor) over [start_day, end_day] from one query.
+    """
+    appointments = _schedule_queryset(doctor_ids, start_day, end_day, statuses, related)
+    return _group(appointments, start_day, end_day, now)
+
+
+async def abuild_schedule(doctor_ids, start_day, end_day, statuses=None, related=("patient",), now=None):
+    """``build_schedule()`` through the async ORM"""
+    appointments = _schedule_queryset(doctor_ids, start_day, end_day, statuses, related)
+    return _group([appointment async for appointment in appointments], start_day, end_day, now)
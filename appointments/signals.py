@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import availability
+from .models import Appointment, Slot
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    """Keep the free-slot index in step with booking, rescheduling and cancelling"""
+    if raw:
+        return
+    previous = None if created else getattr(instance, "_loaded_values", None)
+    availability.appointment_changed(instance, previous)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_removed(sender, instance, **kwargs):
+    availability.appointment_deleted(instance)
+
+
+@receiver(post_save, sender=Slot)
+def slot_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, "_loaded_values", None)
+    availability.slot_changed(instance, previous)
+
+
+@receiver(post_delete, sender=Slot)
+def slot_removed(sender, instance, **kwargs):
+    availability.slot_changed(instance)
@@ -0,0 +1,125 @@
+"""
+Bulk Slot generation from recurring AvailabilityTemplate rows.
+
+Templates are expanded in memory, checked against the doctors' existing
+slots in the range with one query, and written with ``bulk_create`` in
+batches. ``Slot.save()``/``clean()`` are not run per row; the template
+guarantees well-formed ranges and past times are dropped up front. A slot
+that overlaps an existing or already generated slot of the same doctor
+(overlapping templates) is skipped rather than double-booking the doctor.
+
+``created`` counts rows actually inserted: a batch whose keys a concurrent
+run inserted first is ignored by ``bulk_create`` and counted as existing.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import availability
+from .models import AvailabilityTemplate, Slot
+
+
+@dataclass
+class GenerationResult:
+    created: int = 0
+    existing: int = 0
+    overlapping: int = 0
+    past: int = 0
+
+
+def expand_template(template, start_day, end_day):
+    """Yield (start, end) aware datetimes for one template over [start_day, end_day]"""
+    step = timedelta(minutes=template.slot_minutes)
+    day = start_day
+    while day <= end_day:
+        if template.applies_on(day):
+            current = timezone.make_aware(datetime.combine(day, template.start_time))
+            day_end = timezone.make_aware(datetime.combine(day, template.end_time))
+            while current + step <= day_end:
+                yield current, current + step
+                current += step
+        day += timedelta(days=1)
+
+
+def _stored(slots):
+    """How many of the slots' (doctor, start_time) keys are in the database"""
+    keys = {(slot.doctor_id, slot.start_time) for slot in slots}
+    return sum(
+        1 for key in Slot.objects.filter(
+            doctor_id__in={doctor_id for doctor_id, _ in keys},
+            start_time__in={start for _, start in keys},
+        ).values_list("doctor_id", "start_time")
+        if key in keys
+    )
+
+
+def generate_slots(start_day, end_day, doctor_ids=None, batch_size=1000, dry_run=False, now=None):
+    """Materialize slots for all active templates between two dates (inclusive)"""
+    now = now or timezone.now()
+    templates = AvailabilityTemplate.objects.filter(is_active=True)
+    if doctor_ids:
+        templates = templates.filter(doctor_id__in=doctor_ids)
+    templates = list(templates)
+    result = GenerationResult()
+    if not templates:
+        return result
+
+    range_start, _ = availability.day_bounds(start_day)
+    _, range_end = availability.day_bounds(end_day)
+    # Existing and accepted slots per (doctor, day), to catch overlaps
+    booked = defaultdict(list)
+    existing = Slot.objects.filter(
+        doctor_id__in={template.doctor_id for template in templates},
+        start_time__lt=range_end,
+        end_time__gt=range_start,
+    ).values_list("doctor_id", "start_time", "end_time")
+    for doctor_id, start, end in existing:
+        # A slot running past midnight (or into range_start) blocks every day it touches
+        day = timezone.localtime(start).date()
+        while day <= timezone.localtime(end).date():
+            booked[doctor_id, day].append((start, end))
+            day += timedelta(days=1)
+    taken = {(doctor_id, start) for (doctor_id, _), ranges in booked.items() for start, _ in ranges}
+
+    pending = []
+    for template in templates:
+        for start, end in expand_template(template, start_day, end_day):
+            key = (template.doctor_id, start)
+            day_ranges = booked[template.doctor_id, timezone.localtime(start).date()]
+            if start < now:
+                result.past += 1
+            elif key in taken:
+                result.existing += 1
+            elif any(start < other_end and other_start < end for other_start, other_end in day_ranges):
+                result.overlapping += 1
+            else:
+                day_ranges.append((start, end))
+                pending.append(Slot(
+                    doctor_id=template.doctor_id,
+                    start_time=start,
+                    end_time=end,
+                    slot_type=template.slot_type,
+                ))
+
+    if dry_run:
+        result.created = len(pending)
+        return result
+
+    for offset in range(0, len(pending), batch_size):
+        batch = pending[offset:offset + batch_size]
+        with transaction.atomic():
+            before = _stored(batch)
+            # ignore_conflicts covers slots inserted by a concurrent run
+            Slot.objects.bulk_create(batch, ignore_conflicts=True)
+            inserted = _stored(batch) - before
+        result.created += inserted
+        result.existing += len(batch) - inserted
+
+    # bulk_create skips signals, so drop the affected availability index days
+    for doctor_id, day in {(slot.doctor_id, timezone.localtime(slot.start_time).date()) for slot in pending}:
+        availability.invalidate(doctor_id, day)
+
+    return result
@@ -1,3 +1,395 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail.backends import locmem
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users import jobs
+from users.models import User
+from . import availability, booking
+from .booking import BookingConflict
+from .models import Appointment, AppointmentReminder, AvailabilityTemplate, Slot, save_counters
+from .schedule import build_schedule, period_range
+from .slots import generate_slots
+from .views import MAX_AVAILABILITY_SEARCH_DAYS
+
+
+def local_datetime(day, at):
+    return timezone.make_aware(datetime.combine(day, at))
+
+
+class TransactionDepthBackend(locmem.EmailBackend):
+    """locmem backend noting how many atomic blocks are open at each send"""
+    depths = []
+
+    def send_messages(self, messages):
+        self.depths.append(len(connection.atomic_blocks))
+        return super().send_messages(messages)
+
+
+class AvailabilityIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.when = local_datetime(self.day, time(10, 0))
+
+    def free(self):
+        return availability.free_slots(self.doctor.pk, self.day)
+
+    def test_committed_booking_takes_the_slot(self):
+        self.assertIn(time(10, 0), self.free())
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+        self.assertNotIn(time(10, 0), self.free())
+
+    def test_rolled_back_booking_leaves_the_slot_free(self):
+        self.assertIn(time(10, 0), self.free())
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertIn(time(10, 0), self.free())
+
+    def test_cancelling_frees_the_slot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, appointment_datetime=self.when
+            )
+        self.assertNotIn(time(10, 0), self.free())
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = "cancelled"
+            appointment.save()
+        self.assertIn(time(10, 0), self.free())
+
+
+class AvailabilitySearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.first = User.objects.create(username="doc1", role="doctor", specialization="Cardiology")
+        self.second = User.objects.create(username="doc2", role="doctor", specialization="Dermatology")
+        self.patient = User.objects.create(username="pat", role="patient")
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.next_day = self.day + timedelta(days=1)
+
+    def book(self, doctor, day, at, **fields):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=doctor, appointment_datetime=local_datetime(day, at), **fields
+        )
+
+    def search(self, **params):
+        self.client.force_login(self.patient)
+        return self.client.get(reverse("appointments:availability_search"), params)
+
+    def test_results_cover_every_doctor_and_day(self):
+        self.book(self.first, self.day, time(9, 0))
+        self.book(self.second, self.next_day, time(16, 30), status="cancelled")
+        Slot.objects.create(
+            doctor=self.second, start_time=local_datetime(self.day, time(12, 0)),
+            end_time=local_datetime(self.day, time(13, 0)), slot_type="blocked",
+        )
+
+        free = availability.search_free_slots([self.first.pk, self.second.pk], self.day, self.next_day)
+        self.assertEqual(set(free), {self.first.pk, self.second.pk})
+        self.assertEqual(set(free[self.first.pk]), {self.day, self.next_day})
+        self.assertNotIn(time(9, 0), free[self.first.pk][self.day])
+        self.assertIn(time(9, 0), free[self.first.pk][self.next_day])
+        self.assertNotIn(time(12, 30), free[self.second.pk][self.day])
+        self.assertIn(time(9, 0), free[self.second.pk][self.day])
+        self.assertIn(time(16, 30), free[self.second.pk][self.next_day])
+
+    def test_matches_the_single_day_lookup(self):
+        self.book(self.first, self.day, time(10, 30))
+        free = availability.search_free_slots([self.first.pk], self.day, self.day)
+        cache.clear()
+        self.assertEqual(free[self.first.pk][self.day], availability.free_slots(self.first.pk, self.day))
+
+    def test_one_query_per_table_then_cache_hits(self):
+        doctors = [self.first.pk, self.second.pk]
+        with self.assertNumQueries(2):
+            availability.search_free_slots(doctors, self.day, self.day + timedelta(days=6))
+        with self.assertNumQueries(0):
+            availability.search_free_slots(doctors, self.day, self.day + timedelta(days=6))
+
+    def test_view_filters_by_specialization(self):
+        self.book(self.first, self.day, time(9, 0))
+        response = self.search(start=self.day.isoformat(), end=self.next_day.isoformat(), specialization="cardiology")
+        self.assertEqual(response.status_code, 200)
+        doctors = response.json()["doctors"]
+        self.assertEqual([doctor["id"] for doctor in doctors], [self.first.pk])
+        days = doctors[0]["days"]
+        self.assertEqual(list(days), [self.day.isoformat(), self.next_day.isoformat()])
+        self.assertNotIn("09:00", days[self.day.isoformat()])
+
+    def test_view_rejects_bad_ranges(self):
+        too_long = self.day + timedelta(days=MAX_AVAILABILITY_SEARCH_DAYS)
+        for params in (
+            {"start": "not-a-date"},
+            {"start": self.next_day.isoformat(), "end": self.day.isoformat()},
+            {"start": self.day.isoformat(), "end": too_long.isoformat()},
+            {"start": self.day.isoformat(), "appointment_type": "surgery"},
+            {"start": self.day.isoformat(), "doctors": "1,x"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.search(**params).status_code, 400)
+
+
+class BookingTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+        self.other = User.objects.create(username="other", role="patient")
+        self.when = local_datetime(timezone.localdate() + timedelta(days=3), time(10, 0))
+
+    def test_taken_slot_raises_booking_conflict(self):
+        booking.book(self.patient, self.doctor, self.when)
+        with self.assertRaises(BookingConflict):
+            booking.book(self.other, self.doctor, self.when)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 1)
+
+    def test_cancelled_appointment_frees_the_slot(self):
+        first = booking.book(self.patient, self.doctor, self.when)
+        first.status = "cancelled"
+        first.save()
+        booking.book(self.other, self.doctor, self.when)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor, status="pending").count(), 1)
+
+    def test_constraint_holds_without_model_validation(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Appointment(patient=self.other, doctor=self.doctor, appointment_datetime=self.when).save(validate=False)
+
+    def test_reschedule_into_taken_slot_restores_the_instance(self):
+        booking.book(self.patient, self.doctor, self.when)
+        later = booking.book(self.other, self.doctor, self.when + timedelta(hours=1))
+        with self.assertRaises(BookingConflict):
+            booking.reschedule(later, self.when)
+        self.assertEqual(later.appointment_datetime, self.when + timedelta(hours=1))
+        self.assertFalse(later.is_rescheduled)
+
+    def test_other_integrity_errors_are_not_conflicts(self):
+        with self.assertRaises(IntegrityError) as caught, transaction.atomic():
+            Appointment(patient=self.patient, doctor=self.doctor, appointment_datetime=None).save(validate=False)
+        self.assertFalse(booking._is_slot_conflict(caught.exception))
+
+
+class DirtyFieldSaveTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+        created = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_datetime=local_datetime(timezone.localdate() + timedelta(days=3), time(10, 0)),
+        )
+        self.appointment = Appointment.objects.get(pk=created.pk)
+
+    def test_update_writes_only_changed_columns(self):
+        self.appointment.notes = "bring results"
+        with self.assertNumQueries(1) as queries:
+            self.appointment.save()
+        sql = queries.captured_queries[0]["sql"]
+        self.assertIn('"notes"', sql)
+        self.assertNotIn('"status"', sql)
+        self.assertEqual(Appointment.objects.get(pk=self.appointment.pk).notes, "bring results")
+
+    def test_unchanged_instance_touches_updated_at(self):
+        before = self.appointment.updated_at
+        with self.assertNumQueries(1) as queries:
+            self.appointment.save()
+        self.assertNotIn('"notes"', queries.captured_queries[0]["sql"])
+        self.assertGreater(Appointment.objects.get(pk=self.appointment.pk).updated_at, before)
+
+    def test_unchanged_instance_can_skip_the_write(self):
+        with self.assertNumQueries(0):
+            self.appointment.save(skip_unchanged=True)
+
+    def test_unloaded_instance_can_update_the_status(self):
+        self.appointment.status = "cancelled"
+        self.appointment.save()
+        save_counters.clear()
+        Appointment(pk=self.appointment.pk, status="pending").save(update_fields=["status"])
+        self.assertEqual(Appointment.objects.get(pk=self.appointment.pk).status, "pending")
+        # The previous status is unknown, so the change counts as a reactivation
+        self.assertEqual(save_counters["conflict_checks_skipped"], 0)
+
+    def test_partial_refresh_keeps_other_pending_changes(self):
+        self.appointment.notes = "bring results"
+        self.appointment.refresh_from_db(fields=["status"])
+        self.assertEqual(self.appointment.get_dirty_fields(), {"notes"})
+        self.appointment.save()
+        self.assertEqual(Appointment.objects.get(pk=self.appointment.pk).notes, "bring results")
+
+    def test_full_refresh_discards_pending_changes(self):
+        self.appointment.notes = "bring results"
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.get_dirty_fields(), set())
+
+    def test_save_with_update_fields_keeps_other_changes_dirty(self):
+        self.appointment.notes = "bring results"
+        self.appointment.status = "cancelled"
+        self.appointment.save(update_fields=["status", "updated_at"])
+        self.assertEqual(self.appointment.get_dirty_fields(), {"notes"})
+
+
+@override_settings(TIME_ZONE="America/New_York")
+class ScheduleTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.other = User.objects.create(username="other", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+        self.day = timezone.localdate() + timedelta(days=7)
+
+    def book(self, doctor, day, at):
+        appointment = Appointment(patient=self.patient, doctor=doctor, appointment_datetime=local_datetime(day, at))
+        appointment.save(validate=False)
+        return appointment
+
+    def test_groups_by_local_date_across_midnight(self):
+        # 23:30 and 00:30 local fall on the same UTC date
+        late = self.book(self.doctor, self.day, time(23, 30))
+        early = self.book(self.doctor, self.day + timedelta(days=1), time(0, 30))
+        first = self.book(self.doctor, self.day, time(9, 0))
+        self.book(self.other, self.day, time(10, 0))
+
+        with self.assertNumQueries(1):
+            schedule = build_schedule(self.doctor.pk, self.day, self.day + timedelta(days=2))
+        self.assertEqual([len(day) for day in schedule], [2, 1, 0])
+        self.assertEqual(schedule.day(self.day).appointments, [first, late])
+        self.assertEqual(schedule.day(self.day + timedelta(days=1)).appointments, [early])
+        self.assertEqual(schedule.total(), 3)
+
+    def test_several_doctors_share_one_schedule(self):
+        self.book(self.doctor, self.day, time(9, 0))
+        self.book(self.other, self.day, time(9, 0))
+        schedule = build_schedule([self.doctor.pk, self.other.pk], self.day, self.day)
+        self.assertEqual(len(schedule.day(self.day).for_doctor(self.other.pk)), 1)
+        self.assertEqual(schedule.day(self.day).count_by_status(), {"pending": 2})
+
+    def test_week_starts_on_monday(self):
+        start, end = period_range("week", self.day)
+        self.assertEqual((start.weekday(), (end - start).days), (0, 6))
+        self.assertTrue(start <= self.day <= end)
+
+
+class SlotGenerationTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.day = timezone.localdate() + timedelta(days=7)
+
+    def template(self, start, end, minutes=30, **fields):
+        return AvailabilityTemplate.objects.create(
+            doctor=self.doctor, weekday=self.day.weekday(), start_time=start, end_time=end,
+            slot_minutes=minutes, **fields
+        )
+
+    def test_created_counts_only_inserted_rows(self):
+        self.template(time(9, 0), time(11, 0))
+        first = generate_slots(self.day, self.day)
+        self.assertEqual((first.created, first.existing), (4, 0))
+        again = generate_slots(self.day, self.day)
+        self.assertEqual((again.created, again.existing), (0, 4))
+        self.assertEqual(Slot.objects.count(), 4)
+
+    def test_overlapping_templates_do_not_overlap_slots(self):
+        self.template(time(9, 0), time(11, 0))
+        self.template(time(9, 15), time(10, 15), minutes=60)
+        result = generate_slots(self.day, self.day)
+        self.assertEqual((result.created, result.overlapping), (4, 1))
+        slots = list(Slot.objects.order_by("start_time"))
+        for earlier, later in zip(slots, slots[1:]):
+            self.assertLessEqual(earlier.end_time, later.start_time)
+
+    def test_slot_from_the_previous_day_blocks_the_overlap(self):
+        Slot.objects.create(
+            doctor=self.doctor,
+            start_time=local_datetime(self.day - timedelta(days=1), time(23, 0)),
+            end_time=local_datetime(self.day, time(9, 30)),
+        )
+        self.template(time(9, 0), time(11, 0))
+        result = generate_slots(self.day, self.day)
+        self.assertEqual((result.created, result.overlapping), (3, 1))
+
+    def test_overlapping_template_is_rejected(self):
+        self.template(time(9, 0), time(12, 0))
+        overlapping = AvailabilityTemplate(
+            doctor=self.doctor, weekday=self.day.weekday(), start_time=time(11, 0), end_time=time(13, 0)
+        )
+        with self.assertRaises(ValidationError):
+            overlapping.full_clean()
+        adjacent = AvailabilityTemplate(
+            doctor=self.doctor, weekday=self.day.weekday(), start_time=time(12, 0), end_time=time(13, 0)
+        )
+        adjacent.full_clean()
+
+
+@override_settings(APPOINTMENT_MISSED_AFTER_HOURS=24)
+class AppointmentJobTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient", email="pat@example.com")
+
+    def appointment(self, hours, **fields):
+        appointment = Appointment(
+            patient=self.patient, doctor=self.doctor,
+            appointment_datetime=timezone.now() + timedelta(hours=hours), **fields
+        )
+        appointment.save(validate=False)
+        return appointment
+
+    def test_sweep_marks_only_long_overdue_pending(self):
+        overdue = self.appointment(-30)
+        recent = self.appointment(-2)
+        cancelled = self.appointment(-40, status="cancelled")
+        upcoming = self.appointment(5)
+        result = jobs.run("sweep_missed")
+        self.assertEqual((result.processed, result.finished_pass), (1, True))
+        statuses = dict(Appointment.objects.values_list("pk", "status"))
+        self.assertEqual(statuses, {
+            overdue.pk: "missed", recent.pk: "pending", cancelled.pk: "cancelled", upcoming.pk: "pending",
+        })
+
+    def test_reminders_go_out_once_per_appointment_time(self):
+        soon = self.appointment(0.5)
+        tomorrow = self.appointment(20)
+        jobs.run("send_reminders")
+        self.assertEqual(
+            set(AppointmentReminder.objects.values_list("appointment_id", "kind")),
+            {(soon.pk, "1h"), (tomorrow.pk, "24h")},
+        )
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["pat@example.com"] * 2)
+
+        jobs.run("send_reminders")
+        self.assertEqual(len(mail.outbox), 2)
+
+        tomorrow.appointment_datetime += timedelta(hours=1)
+        tomorrow.save(validate=False)
+        jobs.run("send_reminders")
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(EMAIL_BACKEND="appointments.tests.TransactionDepthBackend")
+    def test_claims_commit_before_the_send(self):
+        self.appointment(0.5)
+        TransactionDepthBackend.depths = []
+        outside = len(connection.atomic_blocks)
+        jobs.run("send_reminders")
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(TransactionDepthBackend.depths)
+        self.assertEqual(set(TransactionDepthBackend.depths), {outside})
+
+    @override_settings(EMAIL_BACKEND="outbox.tests.FailingBackend")
+    def test_failed_send_releases_the_claims(self):
+        self.appointment(0.5)
+        with self.assertLogs("users.jobs", "ERROR"):
+            result = jobs.run("send_reminders")
+        self.assertIn("server unavailable", result.error)
+        self.assertFalse(AppointmentReminder.objects.exists())
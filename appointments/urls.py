@@ -23,6 +23,7 @@ urlpatterns = [
     path("complete/<int:appointment_id>/", views.mark_appointment_completed, name="complete_appointment"),
     path("add-notes/<int:appointment_id>/", views.add_appointment_notes, name="add_notes"),
     path("doctor/<int:doctor_id>/availability/", views.doctor_availability, name="doctor_availability"),
+    path("availability/search/", views.availability_search, name="availability_search"),
 
      # Patient record view (doctor only)
     path("patient/<int:patient_id>/record/", views.patient_record, name="patient_record"),
@@ -7,8 +7,16 @@ from django.utils.dateparse import parse_date, parse_time
 from django.db.models import Q, Count
 from datetime import datetime, timedelta
 from .models import Appointment, Slot
+from . import availability, booking
+from .schedule import abuild_schedule, build_schedule
 from users.models import User
-from django.http import HttpResponseNotAllowed
+from users import conditional
+from users.async_support import alist, aload_request
+from users.counters import aget_user_stats, get_user_stats
+from users.fragments import adashboard_fragments, deferred
+from users.middleware import query_budget
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from asgiref.sync import sync_to_async
 
 # Import your existing Prescription model
 try:
@@ -19,46 +27,39 @@ except ImportError:
         objects = type('MockManager', (), {'filter': lambda *args, **kwargs: []})()
 
 @login_required
-def dashboard_patient(request):
+@query_budget(20)
+async def dashboard_patient(request):
     """Enhanced patient dashboard with proper statistics"""
-    if request.user.role != "patient":
+    user = await aload_request(request)
+    if user.role != "patient":
         messages.error(request, "Access denied. Patients only.")
         return redirect("home")
     
     now = timezone.now()
     
     # Get appointments for the patient
-    appointments = Appointment.objects.filter(
-        patient=request.user
-    ).select_related('doctor').order_by('-appointment_datetime')[:5]  # Show latest 5
+    appointments = await alist(Appointment.objects.filter(
+        patient=user
+    ).select_related('doctor').order_by('-appointment_datetime')[:5])  # Show latest 5
     
-    # Calculate statistics
-    all_appointments = Appointment.objects.filter(patient=request.user)
+    # Calculate statistics (counters from one primary-key lookup)
+    stats = await aget_user_stats(user)
     
-    upcoming_appointments_count = all_appointments.filter(
+    upcoming_appointments_count = await Appointment.objects.filter(
+        patient=user,
         appointment_datetime__gte=now,
         status='pending'
-    ).count()
+    ).acount()
     
-    pending_appointments_count = all_appointments.filter(
-        status='pending'
-    ).count()
-    
-    total_visits = all_appointments.filter(
-        status='completed'
-    ).count()
+    pending_appointments_count = stats.pending_appointments
+    total_visits = stats.completed_appointments
     
     # Get prescriptions from your existing prescriptions app
     try:
-        prescriptions = Prescription.objects.filter(
-            patient=request.user
-        ).select_related('doctor').order_by('-date_issued')[:5]
-        
-        # Count active prescriptions (adjust field name if different in your model)
-        active_prescriptions_count = Prescription.objects.filter(
-            patient=request.user,
-            is_active=True  # Adjust this field name based on your model
-        ).count()
+        prescriptions = await alist(Prescription.objects.filter(
+            patient=user
+        ).select_related('doctor').order_by('-date_issued')[:5])
+        active_prescriptions_count = stats.active_prescriptions
     except:
         prescriptions = []
         active_prescriptions_count = 0
@@ -109,26 +110,21 @@ def book_appointment(request):
                 messages.error(request, "Cannot book appointments in the past.")
                 return redirect("book_appointment")
             
-            # Check for conflicts
-            if Appointment.objects.filter(
-                doctor=doctor,
-                appointment_datetime=datetime_obj,
-                status__in=["pending", "completed"]
-            ).exists():
-                messages.error(request, "This doctor is already booked at the selected time.")
-            else:
-                appointment = Appointment.objects.create(
-                    patient=request.user,
-                    doctor=doctor,
-                    appointment_datetime=datetime_obj,
-                    appointment_type=appointment_type,
-                    symptoms=symptoms,
-                    phone=phone,
-                    email=email
-                )
-                messages.success(request, f"Appointment booked successfully for {datetime_obj.strftime('%B %d, %Y at %I:%M %p')}!")
-                return redirect("dashboard_patient")
+            # The unique constraint rejects the slot if it is already taken
+            booking.book(
+                request.user,
+                doctor,
+                datetime_obj,
+                appointment_type=appointment_type,
+                symptoms=symptoms,
+                phone=phone,
+                email=email
+            )
+            messages.success(request, f"Appointment booked successfully for {datetime_obj.strftime('%B %d, %Y at %I:%M %p')}!")
+            return redirect("dashboard_patient")
                 
+        except booking.BookingConflict as e:
+            messages.error(request, str(e))
         except User.DoesNotExist:
             messages.error(request, "Invalid doctor selected.")
         except ValueError as e:
@@ -142,6 +138,7 @@ def book_appointment(request):
 
 
 @login_required
+@conditional.conditional_page(conditional.own_appointments)
 def list_appointments(request):
     """Show appointments based on user role with filtering"""
     if request.user.role == "patient":
@@ -158,7 +155,7 @@ def list_appointments(request):
 
     # Filter by status if requested
     status_filter = request.GET.get('status')
-    if status_filter and status_filter in ['pending', 'completed', 'cancelled']:
+    if status_filter and status_filter in ['pending', 'completed', 'cancelled', 'missed']:
         appointments = appointments.filter(status=status_filter)
 
     return render(request, "appointments/list.html", {
@@ -195,19 +192,12 @@ def reschedule_appointment(request, appointment_id):
             messages.error(request, "Cannot reschedule to a past date/time.")
             return redirect("reschedule_appointment", appointment_id=appointment.id)
 
-        # Check if doctor is already booked at that time
-        if Appointment.objects.filter(
-            doctor=appointment.doctor, 
-            appointment_datetime=new_datetime, 
-            status__in=["pending", "completed"]
-        ).exclude(id=appointment.id).exists():
-            messages.error(request, "Doctor is already booked at this time.")
+        old_datetime = appointment.appointment_datetime
+        try:
+            booking.reschedule(appointment, new_datetime)
+        except booking.BookingConflict as e:
+            messages.error(request, str(e))
         else:
-            old_datetime = appointment.appointment_datetime
-            appointment.appointment_datetime = new_datetime
-            appointment.is_rescheduled = True
-            appointment.save()
-            
             messages.success(
                 request, 
                 f"Appointment rescheduled from {old_datetime.strftime('%B %d, %Y at %I:%M %p')} "
@@ -269,9 +259,13 @@ def appointment_detail(request, appointment_id):
 
 
 @login_required  
-def doctor_availability(request, doctor_id):
+async def doctor_availability(request, doctor_id):
     """Get available time slots for a specific doctor"""
-    doctor = get_object_or_404(User, id=doctor_id, role="doctor")
+    user = await aload_request(request)
+    try:
+        doctor = await User.objects.aget(id=doctor_id, role="doctor")
+    except User.DoesNotExist:
+        raise Http404("No doctor matches the given query.")
     
     # Get date from request (default to today)
     date_str = request.GET.get('date', timezone.now().date().strftime('%Y-%m-%d'))
@@ -280,44 +274,99 @@ def doctor_availability(request, doctor_id):
     except ValueError:
         selected_date = timezone.now().date()
     
-    # Don't show availability for past dates
-    if selected_date < timezone.now().date():
-        available_slots = []
-    else:
-        # Get booked appointments for this doctor on this date
-        booked_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            appointment_datetime__date=selected_date,
-            status__in=['pending', 'completed']
-        ).values_list('appointment_datetime__time', flat=True)
-        
-        # Generate time slots (9 AM to 5 PM, 30-minute intervals)
-        available_slots = []
-        start_time = datetime.strptime('09:00', '%H:%M').time()
-        end_time = datetime.strptime('17:00', '%H:%M').time()
-        current_time = datetime.combine(selected_date, start_time)
-        end_datetime = datetime.combine(selected_date, end_time)
-        
-        while current_time < end_datetime:
-            if current_time.time() not in booked_appointments:
-                # Skip past times for today
-                if selected_date == timezone.now().date():
-                    if timezone.make_aware(current_time) > timezone.now():
-                        available_slots.append(current_time.time())
-                else:
-                    available_slots.append(current_time.time())
-            current_time += timedelta(minutes=30)
+    # One cache read of the per-day index (built from the database on a miss)
+    available_slots = await sync_to_async(availability.free_slots)(doctor.id, selected_date)
+    
+    # Doctors looking at their own day also see what is already booked
+    booked_appointments = []
+    if user.id == doctor.id:
+        booked_appointments = (await abuild_schedule(
+            doctor.id, selected_date, selected_date, statuses=Appointment.ACTIVE_STATUSES
+        )).day(selected_date).appointments
     
     return render(request, "appointments/availability.html", {
         "doctor": doctor,
         "selected_date": selected_date,
-        "available_slots": available_slots
+        "available_slots": available_slots,
+        "booked_appointments": booked_appointments
+    })
+
+
+# Longest date range a single availability search may cover
+MAX_AVAILABILITY_SEARCH_DAYS = 31
+
+
+@login_required
+@query_budget(10)
+def availability_search(request):
+    """
+    Free slots for several doctors over a date range in one request.
+
+    GET params: ``start``/``end`` (YYYY-MM-DD, inclusive), optional
+    ``doctors`` (comma-separated ids, or repeated), ``specialization`` and
+    ``appointment_type``.
+    """
+    try:
+        start_date = parse_date(request.GET.get('start') or timezone.localdate().isoformat())
+        end_param = request.GET.get('end')
+        end_date = parse_date(end_param) if end_param else start_date and start_date + timedelta(days=6)
+    except ValueError:
+        start_date = end_date = None
+    if not start_date or not end_date:
+        return JsonResponse({'error': 'Invalid date format, use YYYY-MM-DD'}, status=400)
+    if end_date < start_date:
+        return JsonResponse({'error': 'End date must not be before start date'}, status=400)
+    if (end_date - start_date).days >= MAX_AVAILABILITY_SEARCH_DAYS:
+        return JsonResponse(
+            {'error': f'Date range is limited to {MAX_AVAILABILITY_SEARCH_DAYS} days'},
+            status=400
+        )
+
+    appointment_type = request.GET.get('appointment_type') or None
+    if appointment_type and appointment_type not in dict(Appointment.TYPE_CHOICES):
+        return JsonResponse({'error': 'Invalid appointment type'}, status=400)
+
+    doctors = User.objects.filter(role='doctor').order_by('username')
+    raw_ids = [
+        value for param in request.GET.getlist('doctors') for value in param.split(',') if value.strip()
+    ]
+    if raw_ids:
+        try:
+            doctors = doctors.filter(id__in=[int(value) for value in raw_ids])
+        except ValueError:
+            return JsonResponse({'error': 'Invalid doctor id'}, status=400)
+    specialization = request.GET.get('specialization', '').strip()
+    if specialization:
+        doctors = doctors.filter(specialization__iexact=specialization)
+    doctors = list(doctors.only('id', 'username', 'first_name', 'last_name', 'specialization'))
+
+    free = availability.search_free_slots(
+        [doctor.id for doctor in doctors], start_date, end_date, appointment_type
+    )
+
+    return JsonResponse({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'appointment_type': appointment_type,
+        'doctors': [
+            {
+                'id': doctor.id,
+                'name': f"Dr. {doctor.get_full_name() or doctor.username}",
+                'specialization': doctor.specialization or '',
+                'days': {
+                    day.isoformat(): [slot.strftime('%H:%M') for slot in slots]
+                    for day, slots in sorted(free[doctor.id].items())
+                },
+            }
+            for doctor in doctors
+        ],
     })
 
 
 # Additional utility views for better user experience
 
 @login_required
+@conditional.conditional_page(conditional.patient_appointments)
 def upcoming_appointments(request):
     """Show only upcoming appointments for patients"""
     if request.user.role != "patient":
@@ -356,57 +405,51 @@ def appointment_history(request):
 # Doctor-specific views (FIXED VERSION)
 
 @login_required
-def doctor_dashboard(request):
+@conditional.conditional_page(conditional.doctor_dashboard)
+@query_budget(18)
+async def doctor_dashboard(request):
     """Dashboard for doctors - FIXED VERSION"""
-    if request.user.role != "doctor":
+    user = await aload_request(request)
+    if user.role != "doctor":
         messages.error(request, "Access denied. Doctors only.")
         return redirect("home")
     
     now = timezone.now()
-    today = now.date()
+    today = timezone.localtime(now).date()
     
-    # Get today's appointments
-    todays_appointments = Appointment.objects.filter(
-        doctor=request.user,
-        appointment_datetime__date=today
-    ).select_related('patient').order_by('appointment_datetime')
-    
-    # Get upcoming appointments (next 7 days)
-    upcoming_appointments = Appointment.objects.filter(
-        doctor=request.user,
-        appointment_datetime__gte=now,
-        appointment_datetime__date__lte=today + timedelta(days=7),
-        status='pending'
-    ).select_related('patient').order_by('appointment_datetime')
+    fragments = await adashboard_fragments(request, "appointments.doctor_dashboard", user.pk)
+
+    # Loaded while rendering, and only for sections missing from the
+    # fragment cache
+    # Today plus the next 7 days from one query
+    week = deferred(lambda: build_schedule(user.id, today, today + timedelta(days=7), now=now))
+    upcoming_appointments = deferred(lambda: [
+        appointment for appointment in week().appointments()
+        if appointment.status == 'pending' and appointment.appointment_datetime >= now
+    ])
     
     # Calculate statistics
-    all_appointments = Appointment.objects.filter(doctor=request.user)
-    total_patients = all_appointments.values('patient').distinct().count()
-    pending_appointments_count = all_appointments.filter(status='pending').count()
+    stats = deferred(lambda: get_user_stats(user))
     
-    # Get prescriptions - try to get recent prescriptions for the dashboard
-    try:
-        prescriptions = Prescription.objects.filter(
-            doctor=request.user
-        ).select_related('patient').order_by('-date_issued')[:5]
-        prescriptions_count = Prescription.objects.filter(doctor=request.user).count()
-    except:
-        prescriptions = []
-        prescriptions_count = 0
+    # Recent prescriptions for the dashboard
+    prescriptions = Prescription.objects.filter(
+        doctor=user
+    ).select_related('patient').order_by('-date_issued')[:5]
 
     context = {
-        'todays_appointments_count': todays_appointments.count(),
-        'total_patients': total_patients,
-        'prescriptions_count': prescriptions_count,
-        'pending_appointments': pending_appointments_count,  # Fixed variable name
+        'todays_appointments_count': lambda: len(week().today),
+        'total_patients': lambda: stats().distinct_patients,
+        'prescriptions_count': lambda: stats().prescriptions,
+        'pending_appointments': lambda: stats().pending_appointments,  # Fixed variable name
         'appointments': upcoming_appointments,
-        'todays_appointments': todays_appointments,
+        'todays_appointments': lambda: week().today,
         'prescriptions': prescriptions,  # Add prescriptions to context
         'today': today,
         'now': now,  # Add current time for template use
+        **fragments.context(),
     }
     
-    return render(request, "users/dashboard_doctor.html", context)
+    return await sync_to_async(render)(request, "users/dashboard_doctor.html", context)
 
 
 @login_required
@@ -420,7 +463,7 @@ def mark_appointment_completed(request, appointment_id):
         Appointment, 
         id=appointment_id, 
         doctor=request.user,
-        status='pending'
+        status__in=['pending', 'missed']  # A missed visit may be recorded late
     )
     
     if request.method == "POST":
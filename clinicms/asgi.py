@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinicms.settings')
 
 application = get_asgi_application()
+
+# Compile every template before serving (TEMPLATE_WARMUP)
+from users.template_warmup import warm_on_startup  # noqa: E402
+
+warm_on_startup()
@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import tempfile
+
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+
+from .database import sqlite_options
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "tuned.sqlite3")
+        # A standalone connection outside django.db.connections, filled with
+        # the same defaults settings.DATABASES entries get
+        config = ConnectionHandler({
+            "default": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": self.path,
+                "OPTIONS": sqlite_options(busy_timeout_ms=1234, cache_size_kib=2048),
+            },
+        }).settings["default"]
+        self.connection = DatabaseWrapper(config, alias="tuned")
+        self.addCleanup(self.connection.close)
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_apply_to_each_connection(self):
+        self.assertEqual(self.pragma("journal_mode"), "wal")
+        self.assertEqual(self.pragma("synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma("busy_timeout"), 1234)
+        self.assertEqual(self.pragma("cache_size"), -2048)
+        self.assertEqual(self.pragma("temp_store"), 2)  # MEMORY
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (value integer)")
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        # What atomic() runs on SQLite when it opens a transaction
+        self.connection._start_transaction_under_autocommit()
+        # No write yet, but BEGIN IMMEDIATE already holds the lock
+        self.connection.cursor().execute("SELECT count(*) FROM counter")
+        with self.assertRaisesRegex(sqlite3.OperationalError, "locked"):
+            other.execute("BEGIN IMMEDIATE")
+        # Readers are not blocked under WAL
+        self.assertEqual(other.execute("SELECT count(*) FROM counter").fetchone(), (0,))
+        self.connection.rollback()
@@ -72,6 +72,8 @@ urlpatterns = [
     path('patient/prescriptions/', user_views.patient_prescriptions, name='patient_prescriptions'),
     path('prescription/download/<int:prescription_id>/', user_views.download_prescription, name='download_prescription'),
     path("patient/notifications/", user_views.patient_notifications, name="patient_notifications"),
+    path("patient/notifications/stream/", user_views.patient_notifications_stream, name="patient_notifications_stream"),
+    path("patient/appointments/ajax/", user_views.patient_appointments_ajax, name="patient_appointments_ajax"),
 
     # Password Reset URLs
     path('password-reset/', CustomPasswordResetView.as_view(), name='password_reset'),
@@ -86,6 +88,7 @@ urlpatterns = [
     path("dashboard/admin/reports/", user_views.admin_reports, name="admin_reports"),
     path("dashboard/admin/user-analytics/", user_views.admin_user_analytics, name="admin_user_analytics"),
     path("dashboard/admin/system-health/", user_views.admin_system_health, name="admin_system_health"),
+    path("metrics", user_views.metrics_endpoint, name="metrics"),
     path("dashboard/admin/export-data/", user_views.admin_export_data, name="admin_export_data"),
 
     # NEW: Admin Management URLs
@@ -0,0 +1,26 @@
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """
+    ``EMAIL_BACKEND`` that queues messages in the outbox table instead of
+    sending them; the rows commit or roll back with the caller's transaction
+    """
+
+    def send_messages(self, email_messages):
+        now = timezone.now()
+        rows = [
+            OutboxEmail.from_message(message, next_attempt_at=now)
+            for message in email_messages
+            if message.recipients()
+        ]
+        try:
+            OutboxEmail.objects.bulk_create(rows)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(rows)
@@ -0,0 +1,109 @@
+"""
+Outbox delivery.
+
+``send_queued_mail`` is a ``users.jobs`` job: each batch claims the due
+pending rows, oldest first, and sends them one by one over a single
+connection to ``EMAIL_DELIVERY_BACKEND``, kept open for the whole run.
+Claiming moves ``next_attempt_at`` past the end of the batch
+(``JOBS_LEASE_SECONDS`` ahead) in a short transaction, so another mailer
+(say one that took over an expired job lease) skips those rows instead of
+sending them a second time.
+A message that raises is retried after ``OUTBOX_RETRY_BASE_SECONDS``,
+doubling per attempt up to ``OUTBOX_RETRY_MAX_SECONDS``, and marked failed
+after ``OUTBOX_MAX_ATTEMPTS``. After an error the connection is reopened,
+because SMTP servers often drop the session. Sent rows are deleted after
+``OUTBOX_KEEP_DAYS``.
+
+Delivery is at least once: a worker that dies between handing a message
+to the server and marking its row sent delivers it again once the claim
+runs out.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts):
+    """Seconds before attempt ``attempts + 1``"""
+    return min(
+        settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        settings.OUTBOX_RETRY_MAX_SECONDS,
+    )
+
+
+def delivery_connection():
+    backend = settings.EMAIL_DELIVERY_BACKEND
+    if backend == "outbox.backends.OutboxEmailBackend":
+        raise ImproperlyConfigured("EMAIL_DELIVERY_BACKEND must be a backend that actually sends")
+    return get_connection(backend, fail_silently=False)
+
+
+def purge_sent(limit):
+    """Delete up to ``limit`` sent rows older than ``OUTBOX_KEEP_DAYS``"""
+    cutoff = timezone.now() - timedelta(days=settings.OUTBOX_KEEP_DAYS)
+    expired = OutboxEmail.objects.filter(status=OutboxEmail.SENT, sent_at__lt=cutoff).values_list("pk", flat=True)
+    return OutboxEmail.objects.filter(pk__in=list(expired[:limit])).delete()[0]
+
+
+def _record_failure(email, exc, now):
+    email.attempts += 1
+    email.last_error = f"{type(exc).__name__}: {exc}"[:1000]
+    if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboxEmail.FAILED
+        logger.error("Giving up on outbox email #%s after %s attempts: %s", email.pk, email.attempts, email.last_error)
+    else:
+        email.next_attempt_at = now + timedelta(seconds=retry_delay(email.attempts))
+    email.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def claim_due(batch_size, now):
+    """Up to ``batch_size`` due pending rows, taken out of other runs' reach"""
+    claimed_until = now + timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+    due = OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+    with transaction.atomic():
+        ids = list(
+            due.order_by("next_attempt_at", "id").select_for_update(skip_locked=True)
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        # Without row locks (SQLite) the update still only takes rows that are due
+        due.filter(pk__in=ids).update(next_attempt_at=claimed_until)
+    return list(OutboxEmail.objects.filter(pk__in=ids, next_attempt_at=claimed_until).order_by("id"))
+
+
+def send_queued_mail(checkpoint, batch_size):
+    purge_sent(batch_size)
+    connection = delivery_connection()
+    connection.open()
+    try:
+        while True:
+            now = timezone.now()
+            batch = claim_due(batch_size, now)
+            if not batch:
+                return
+            sent = 0
+            for email in batch:
+                try:
+                    connection.send_messages([email.to_message(connection)])
+                except Exception as exc:
+                    _record_failure(email, exc, now)
+                    connection.close()
+                    connection.open()
+                    continue
+                email.attempts += 1
+                email.status = OutboxEmail.SENT
+                email.sent_at = timezone.now()
+                email.last_error = ""
+                email.save(update_fields=["attempts", "status", "sent_at", "last_error"])
+                sent += 1
+            yield sent, {}
+    finally:
+        connection.close()
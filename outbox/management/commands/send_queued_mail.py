@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued outbox emails through EMAIL_DELIVERY_BACKEND, retrying "
+        "failures with backoff. Run once, or with --loop as the mail worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--max-batches", type=int, default=50, help="Batches per run")
+        parser.add_argument("--loop", action="store_true", help="Keep running every --interval seconds")
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            result = jobs.run("send_queued_mail", options["batch_size"], options["max_batches"])
+            if result.error:
+                self.stdout.write(self.style.ERROR(f"send_queued_mail: {result.error} after {result.processed} sent"))
+            elif result.processed or not options["loop"]:
+                self.stdout.write(f"send_queued_mail: {result.processed} sent")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from users import jobs
+from .delivery import claim_due, retry_delay
+from .models import OutboxEmail
+
+
+class FailingBackend(BaseEmailBackend):
+    """Delivery backend whose server rejects every message"""
+
+    def send_messages(self, email_messages):
+        raise ConnectionError("server unavailable")
+
+
+@override_settings(
+    EMAIL_BACKEND="outbox.backends.OutboxEmailBackend",
+    EMAIL_DELIVERY_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    JOBS_LEASE_SECONDS=600,
+    OUTBOX_MAX_ATTEMPTS=3,
+    OUTBOX_RETRY_BASE_SECONDS=30,
+    OUTBOX_RETRY_MAX_SECONDS=60,
+)
+class OutboxTests(TestCase):
+    def send(self, subject="Reminder"):
+        mail.EmailMultiAlternatives(
+            subject, "See you soon", "clinic@example.com", ["pat@example.com"],
+            alternatives=[("<p>See you soon</p>", "text/html")],
+        ).send()
+
+    def deliver(self):
+        return jobs.run("send_queued_mail", batch_size=10, max_batches=5)
+
+    def test_send_queues_instead_of_delivering(self):
+        self.send()
+        self.assertEqual(mail.outbox, [])
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.to), (OutboxEmail.PENDING, ["pat@example.com"]))
+
+    def test_rolled_back_transaction_drops_the_email(self):
+        try:
+            with transaction.atomic():
+                self.send()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_delivery_sends_and_marks_rows(self):
+        self.send()
+        result = self.deliver()
+        self.assertEqual((result.processed, result.error), (1, ""))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0].mimetype, "text/html")
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.SENT, 1))
+        self.deliver()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_claimed_rows_are_skipped_by_other_runs(self):
+        self.send("First")
+        self.send("Second")
+        now = timezone.now()
+        claimed = claim_due(1, now)
+        self.assertEqual([email.subject for email in claimed], ["First"])
+        self.assertEqual(claimed[0].next_attempt_at, now + timedelta(seconds=600))
+        self.assertEqual([email.subject for email in claim_due(10, now)], ["Second"])
+        self.assertEqual(claim_due(10, now), [])
+
+        # A run that died mid-batch: its rows come back once the claim runs out
+        self.assertEqual(self.deliver().processed, 0)
+        OutboxEmail.objects.update(next_attempt_at=now)
+        self.assertEqual(self.deliver().processed, 2)
+
+    @override_settings(EMAIL_DELIVERY_BACKEND="outbox.tests.FailingBackend")
+    def test_failures_back_off_then_give_up(self):
+        self.send()
+        self.deliver()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertIn("server unavailable", email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=25))
+
+        # Not due yet: the next run leaves it alone
+        self.deliver()
+        self.assertEqual(OutboxEmail.objects.get().attempts, 1)
+
+        with self.assertLogs("outbox.delivery", "ERROR"):
+            for _ in range(2):
+                OutboxEmail.objects.update(next_attempt_at=timezone.now())
+                self.deliver()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.FAILED, 3))
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        self.assertEqual([retry_delay(attempts) for attempts in (1, 2, 3)], [30, 60, 60])
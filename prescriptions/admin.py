@@ -12,6 +12,8 @@ class PrescriptionAdmin(admin.ModelAdmin):
     search_fields = ('medicine', 'doctor__username', 'appointment__patient__username')
     date_hierarchy = 'date_issued'
     ordering = ('-date_issued',)
+    # get_patient_name and the appointment column (Appointment.__str__) read these
+    list_select_related = ('doctor', 'appointment__patient', 'appointment__doctor')
     
     fieldsets = (
         ('Prescription Details', {
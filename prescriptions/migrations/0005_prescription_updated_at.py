@@ -0,0 +1,23 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_date_issued(apps, schema_editor):
+    Prescription = apps.get_model("prescriptions", "Prescription")
+    Prescription.objects.update(updated_at=F("date_issued"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0004_prescription_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_date_issued, migrations.RunPython.noop),
+    ]
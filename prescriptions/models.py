@@ -3,9 +3,9 @@ from django.db import models
 # Create your models here.
 from django.db import models
 from users.models import User
-from appointments.models import Appointment
+from appointments.models import Appointment, LoadedValuesMixin
 
-class Prescription(models.Model):
+class Prescription(LoadedValuesMixin, models.Model):
     appointment = models.OneToOneField(
         Appointment,
         on_delete=models.CASCADE,
@@ -17,8 +17,14 @@ class Prescription(models.Model):
     dosage = models.CharField(max_length=100, blank=True, null=True)
     instructions = models.TextField()
     date_issued = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Post-save signal handlers have seen the previous values by now
+        self._snapshot_loaded_values(kwargs.get("update_fields"))
+
     def __str__(self):
         try:
             if self.appointment and self.appointment.patient:
@@ -6,7 +6,8 @@ from .models import Prescription
 from appointments.models import Appointment
 from django.contrib import messages
 from django.db.models import Q, Count
-from django.core.paginator import Paginator
+from users.pagination import paginate
+from search.engine import search_filter
 from django.utils import timezone
 from users.forms import PrescriptionForm
 from django.contrib.auth import get_user_model
@@ -57,11 +58,10 @@ def list_prescriptions(request):
     # Filter by search query
     search_query = request.GET.get('q', '')
     if search_query:
+        patient_ids = prescriptions.values_list('patient_id', flat=True).distinct()
         prescriptions = prescriptions.filter(
-            Q(patient__username__icontains=search_query) |
-            Q(patient__first_name__icontains=search_query) |
-            Q(patient__last_name__icontains=search_query) |
-            Q(medication__icontains=search_query)
+            Q(id__in=search_filter('prescription', search_query, within=prescriptions.values_list('id', flat=True))) |
+            Q(patient_id__in=search_filter('user', search_query, within=patient_ids))
         )
     
     # Filter by status
@@ -73,15 +73,13 @@ def list_prescriptions(request):
             prescriptions = prescriptions.filter(is_active=False)
     
     # Pagination
-    paginator = Paginator(prescriptions, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, prescriptions, 20)
     
     context = {
         'prescriptions': page_obj,
         'search_query': search_query,
         'status_filter': status_filter,
-        'total_prescriptions': prescriptions.count()
+        'total_prescriptions': page_obj.count
     }
     
     return render(request, 'users/list.html', context)
@@ -99,14 +97,12 @@ def active_prescriptions(request):
     ).select_related('patient', 'appointment').order_by('-date_issued')
     
     # Pagination
-    paginator = Paginator(prescriptions, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, prescriptions, 20)
     
     context = {
         'prescriptions': page_obj,
         'title': 'Active Prescriptions',
-        'total_prescriptions': prescriptions.count()
+        'total_prescriptions': page_obj.count
     }
     
     return render(request, 'users/active.html', context)
@@ -0,0 +1,84 @@
+"""
+What each model contributes to the search index, and keeping it current.
+
+Prescriptions index only their own text (medicine, dosage, instructions);
+doctor and patient names are matched through the user documents and joined
+in the views, so renaming a user never re-indexes their prescriptions.
+"""
+import unicodedata
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.utils import timezone
+
+# kind: (app_label, model_name, indexed fields)
+DOCUMENTS = {
+    "user": ("users", "User", ("username", "first_name", "last_name", "email", "specialization")),
+    "prescription": ("prescriptions", "Prescription", ("medicine", "dosage", "instructions")),
+}
+
+
+def normalize(text):
+    """Lowercase, accent-free, single-spaced text (applied to documents and queries)"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.lower().split())
+
+
+def kind_for(model):
+    for kind, (app_label, model_name, _fields) in DOCUMENTS.items():
+        if model._meta.app_label == app_label and model._meta.object_name == model_name:
+            return kind
+    return None
+
+
+def document_body(kind, obj):
+    fields = DOCUMENTS[kind][2]
+    return normalize(" ".join(str(getattr(obj, name) or "") for name in fields))
+
+
+def index_object(kind, obj):
+    from .models import SearchDocument
+
+    body = document_body(kind, obj)
+    updated = SearchDocument.objects.filter(kind=kind, object_id=obj.pk).update(body=body, updated_at=timezone.now())
+    if not updated:
+        SearchDocument.objects.create(kind=kind, object_id=obj.pk, body=body)
+
+
+def remove_object(kind, object_id):
+    from .models import SearchDocument
+
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild(kinds=None, batch_size=2000, apps=global_apps):
+    """
+    Rewrite the documents of ``kinds`` (default: all) from the source tables
+    in primary-key batches; returns {kind: documents written}. ``apps`` lets
+    migrations pass their historical registry.
+    """
+    SearchDocument = apps.get_model("search", "SearchDocument")
+    totals = {}
+    for kind in kinds or DOCUMENTS:
+        app_label, model_name, fields = DOCUMENTS[kind]
+        model = apps.get_model(app_label, model_name)
+        written = 0
+        last_pk = 0
+        # One transaction per kind, so searches never see a half-built index
+        with transaction.atomic():
+            SearchDocument.objects.filter(kind=kind).delete()
+            while True:
+                rows = list(
+                    model.objects.filter(pk__gt=last_pk).order_by("pk").only("pk", *fields)[:batch_size]
+                )
+                if not rows:
+                    break
+                last_pk = rows[-1].pk
+                SearchDocument.objects.bulk_create([
+                    SearchDocument(kind=kind, object_id=row.pk, body=document_body(kind, row))
+                    for row in rows
+                ])
+                written += len(rows)
+        totals[kind] = written
+    return totals
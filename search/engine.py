@@ -0,0 +1,254 @@
+"""
+Ranked lookups against the search index.
+
+``search_ids(kind, query)`` returns matching object ids, best first, and
+``search_filter(kind, query)`` an uncapped subquery of them for ``id__in``
+list filters, using the backend for the database behind ``using``:
+
+* SQLite: the ``search_fts`` FTS5 table (trigram tokenizer, external content
+  on ``search_searchdocument``). Each query term of three or more characters
+  becomes a substring phrase, so "amox" finds "amoxicillin"; rows are
+  ordered by bm25. Shorter terms are applied as ``LIKE`` filters.
+* PostgreSQL: ``LIKE`` on the pg_trgm GIN-indexed body, ordered by
+  ``word_similarity``.
+* Anything else, or SQLite built without the trigram tokenizer: ``LIKE``
+  on the single document column.
+
+When nothing matches exactly, the SQLite and PostgreSQL backends retry by
+trigram similarity, so a typo ("amoxicilin") still finds the row.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.models.expressions import RawSQL
+from django.db.models.query import QuerySet
+
+from .documents import normalize
+from .models import SearchDocument
+
+FTS_TABLE = "search_fts"
+
+# Candidates fetched per requested hit before fuzzy re-scoring (SQLite)
+FUZZY_CANDIDATE_FACTOR = 5
+
+# pg_trgm's default similarity threshold
+FUZZY_THRESHOLD = 0.3
+
+
+def trigrams(word):
+    """pg_trgm-style trigrams: the word padded with two spaces in front, one behind"""
+    padded = f"  {word} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def similarity(term, body):
+    """Best trigram similarity between ``term`` and any word of ``body``"""
+    term_trigrams = trigrams(term)
+    best = 0.0
+    for word in body.split():
+        word_trigrams = trigrams(word)
+        score = len(term_trigrams & word_trigrams) / len(term_trigrams | word_trigrams)
+        best = max(best, score)
+    return best
+
+
+def _like_pattern(term):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _within_sql(within, connection):
+    """(" AND object_id IN (...)", params) restricting hits to ``within``"""
+    if within is None:
+        return "", []
+    if isinstance(within, QuerySet):
+        sql, params = within.order_by().query.get_compiler(connection=connection).as_sql()
+        return f" AND object_id IN ({sql})", list(params)
+    ids = list(within)
+    return f" AND object_id IN ({', '.join(['%s'] * len(ids))})", ids
+
+
+class LikeBackend:
+    """Portable fallback: substring filters on the normalized document body"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _documents(self, kind, terms, within):
+        documents = SearchDocument.objects.using(self.connection.alias).filter(kind=kind)
+        for term in terms:
+            documents = documents.filter(body__contains=term)
+        if within is not None:
+            documents = documents.filter(object_id__in=within)
+        return documents
+
+    def exact(self, kind, terms, limit, within):
+        documents = self._documents(kind, terms, within)
+        return list(documents.order_by("-object_id").values_list("object_id", flat=True)[:limit])
+
+    def exact_sql(self, kind, terms, within):
+        """(sql, params) selecting every exact match's object_id, unordered and uncapped"""
+        documents = self._documents(kind, terms, within).order_by().values("object_id")
+        sql, params = documents.query.get_compiler(connection=self.connection).as_sql()
+        return sql, list(params)
+
+    def fuzzy(self, kind, terms, limit, within):
+        return []
+
+    def _fetch(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class SQLiteFTSBackend(LikeBackend):
+    """FTS5 trigram index maintained by triggers on ``search_searchdocument``"""
+
+    @staticmethod
+    def _phrase(text):
+        return '"' + text.replace('"', '""') + '"'
+
+    def exact(self, kind, terms, limit, within):
+        if not any(len(term) >= 3 for term in terms):
+            return super().exact(kind, terms, limit, within)
+        sql, params = self.exact_sql(kind, terms, within)
+        return [row[0] for row in self._fetch(f"{sql} ORDER BY rank LIMIT %s", params + [limit])]
+
+    def exact_sql(self, kind, terms, within):
+        long_terms = [term for term in terms if len(term) >= 3]
+        short_terms = [term for term in terms if len(term) < 3]
+        if not long_terms:
+            # Trigrams cannot match one or two characters
+            return super().exact_sql(kind, terms, within)
+
+        within_sql, within_params = _within_sql(within, self.connection)
+        short_sql = "".join(" AND body LIKE %s ESCAPE '\\'" for _term in short_terms)
+        return (
+            f"SELECT object_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND kind = %s{short_sql}{within_sql}",
+            [" AND ".join(self._phrase(term) for term in long_terms), kind]
+            + [_like_pattern(term) for term in short_terms]
+            + within_params,
+        )
+
+    def fuzzy(self, kind, terms, limit, within):
+        grams = sorted({
+            term[index:index + 3]
+            for term in terms if len(term) >= 3
+            for index in range(len(term) - 2)
+        })
+        if not grams:
+            return []
+        within_sql, within_params = _within_sql(within, self.connection)
+        rows = self._fetch(
+            f"SELECT object_id, body FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND kind = %s"
+            f"{within_sql} ORDER BY rank LIMIT %s",
+            [" OR ".join(self._phrase(gram) for gram in grams), kind]
+            + within_params
+            + [limit * FUZZY_CANDIDATE_FACTOR],
+        )
+        scored = []
+        for object_id, body in rows:
+            score = sum(similarity(term, body) for term in terms) / len(terms)
+            if score >= FUZZY_THRESHOLD:
+                scored.append((score, object_id))
+        # sort() is stable, so equal scores keep their bm25 order
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [object_id for _score, object_id in scored[:limit]]
+
+
+class PostgresTrigramBackend(LikeBackend):
+    """pg_trgm GIN index on ``search_searchdocument.body``"""
+
+    table = SearchDocument._meta.db_table
+
+    def exact(self, kind, terms, limit, within):
+        sql, params = self.exact_sql(kind, terms, within)
+        rows = self._fetch(
+            f"{sql} ORDER BY word_similarity(%s, body) DESC, object_id DESC LIMIT %s",
+            params + [" ".join(terms), limit],
+        )
+        return [row[0] for row in rows]
+
+    def exact_sql(self, kind, terms, within):
+        within_sql, within_params = _within_sql(within, self.connection)
+        like_sql = "".join(" AND body LIKE %s" for _term in terms)
+        return (
+            f"SELECT object_id FROM {self.table} WHERE kind = %s{like_sql}{within_sql}",
+            [kind] + [_like_pattern(term) for term in terms] + within_params,
+        )
+
+    def fuzzy(self, kind, terms, limit, within):
+        query = " ".join(terms)
+        within_sql, within_params = _within_sql(within, self.connection)
+        # <% compares against pg_trgm.word_similarity_threshold and uses the index
+        rows = self._fetch(
+            f"SELECT object_id FROM {self.table} WHERE kind = %s AND %s <%% body{within_sql}"
+            f" ORDER BY word_similarity(%s, body) DESC, object_id DESC LIMIT %s",
+            [kind, query] + within_params + [query, limit],
+        )
+        return [row[0] for row in rows]
+
+
+_fts_tables = {}
+
+
+def _has_fts_table(connection):
+    key = (connection.alias, connection.settings_dict["NAME"])
+    if key not in _fts_tables:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts_tables[key] = cursor.fetchone() is not None
+    return _fts_tables[key]
+
+
+def get_backend(using=None):
+    connection = connections[using or router.db_for_read(SearchDocument) or DEFAULT_DB_ALIAS]
+    if connection.vendor == "postgresql":
+        return PostgresTrigramBackend(connection)
+    if connection.vendor == "sqlite" and _has_fts_table(connection):
+        return SQLiteFTSBackend(connection)
+    return LikeBackend(connection)
+
+
+def search_ids(kind, query, limit=None, within=None, using=None):
+    """
+    Ids of ``kind`` objects matching ``query``, best match first, at most
+    ``limit`` (default ``SEARCH_MAX_HITS``). ``within`` (ids, or a flat
+    ``values_list`` queryset) restricts the candidates inside the index
+    query, so a small scope is never crowded out by global matches.
+    """
+    terms = normalize(query).split()
+    if not terms:
+        return []
+    if within is not None and not isinstance(within, QuerySet):
+        within = list(within)
+        if not within:
+            return []
+    limit = limit or settings.SEARCH_MAX_HITS
+    backend = get_backend(using)
+    ids = backend.exact(kind, terms, limit, within)
+    if not ids and settings.SEARCH_FUZZY:
+        ids = backend.fuzzy(kind, terms, limit, within)
+    return ids
+
+
+def search_filter(kind, query, within=None, using=None):
+    """
+    Right-hand side for an ``id__in`` filter on ``kind`` objects matching
+    ``query``: every exact match as an unranked SQL subquery, with no
+    ``SEARCH_MAX_HITS`` cap, so filtered lists and their counts stay
+    complete. When nothing matches exactly, the fuzzy fallback's ids (at
+    most ``SEARCH_MAX_HITS``). Use ``search_ids()`` where the ranking
+    matters.
+    """
+    terms = normalize(query).split()
+    if not terms:
+        return []
+    if within is not None and not isinstance(within, QuerySet):
+        within = list(within)
+        if not within:
+            return []
+    backend = get_backend(using)
+    sql, params = backend.exact_sql(kind, terms, within)
+    if settings.SEARCH_FUZZY and not backend._fetch(f"SELECT 1 FROM ({sql}) hits LIMIT 1", params):
+        return backend.fuzzy(kind, terms, settings.SEARCH_MAX_HITS, within)
+    return RawSQL(sql, params)
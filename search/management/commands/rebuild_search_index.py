@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from search.documents import DOCUMENTS, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite the search documents from the user and prescription tables. "
+        "Run it after bulk imports or updates that bypass model signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", action="append", choices=sorted(DOCUMENTS),
+                            help="Only rebuild this document kind (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        totals = rebuild(options["kind"], batch_size=options["batch_size"])
+        summary = ", ".join(f"{count} {kind} documents" for kind, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index: {summary}"))
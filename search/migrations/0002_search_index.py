@@ -0,0 +1,81 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+SQLITE_FTS = [
+    """
+    CREATE VIRTUAL TABLE search_fts USING fts5(
+        body, kind UNINDEXED, object_id UNINDEXED,
+        content='search_searchdocument', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER search_fts_insert AFTER INSERT ON search_searchdocument BEGIN
+        INSERT INTO search_fts(rowid, body, kind, object_id)
+        VALUES (new.id, new.body, new.kind, new.object_id);
+    END
+    """,
+    """
+    CREATE TRIGGER search_fts_delete AFTER DELETE ON search_searchdocument BEGIN
+        INSERT INTO search_fts(search_fts, rowid, body, kind, object_id)
+        VALUES ('delete', old.id, old.body, old.kind, old.object_id);
+    END
+    """,
+    """
+    CREATE TRIGGER search_fts_update AFTER UPDATE ON search_searchdocument BEGIN
+        INSERT INTO search_fts(search_fts, rowid, body, kind, object_id)
+        VALUES ('delete', old.id, old.body, old.kind, old.object_id);
+        INSERT INTO search_fts(rowid, body, kind, object_id)
+        VALUES (new.id, new.body, new.kind, new.object_id);
+    END
+    """,
+]
+
+POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX search_document_body_trgm ON search_searchdocument USING gin (body gin_trgm_ops)",
+]
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        try:
+            schema_editor.execute(SQLITE_FTS[0])
+        except OperationalError:
+            # SQLite older than 3.34 has no trigram tokenizer; search falls back to LIKE
+            return
+        for statement in SQLITE_FTS[1:]:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        for statement in POSTGRES_TRGM:
+            schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for trigger in ("search_fts_insert", "search_fts_delete", "search_fts_update"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        schema_editor.execute("DROP TABLE IF EXISTS search_fts")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS search_document_body_trgm")
+
+
+def populate(apps, schema_editor):
+    from search.documents import rebuild
+
+    rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+        ('users', '0004_userstats'),
+        ('prescriptions', '0004_prescription_is_active'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
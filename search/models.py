@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class SearchDocument(models.Model):
+    """
+    Normalized searchable text for one user or prescription.
+
+    The database-specific index lives next to this table: an FTS5 trigram
+    table on SQLite, a pg_trgm GIN index on PostgreSQL (see
+    ``search/migrations/0002_search_index.py``).
+    """
+    KIND_CHOICES = [
+        ("user", "User"),
+        ("prescription", "Prescription"),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    body = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="unique_search_document"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id}"
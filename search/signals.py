@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from prescriptions.models import Prescription
+from users.models import User
+from . import documents
+
+
+def _indexed_fields_changed(kind, update_fields):
+    # save(update_fields=["last_login"]) and friends leave the document alone
+    return update_fields is None or bool(set(update_fields) & set(documents.DOCUMENTS[kind][2]))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Prescription)
+def indexed_object_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    kind = documents.kind_for(sender)
+    if _indexed_fields_changed(kind, update_fields):
+        documents.index_object(kind, instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Prescription)
+def indexed_object_removed(sender, instance, **kwargs):
+    documents.remove_object(documents.kind_for(sender), instance.pk)
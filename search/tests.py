@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from users.models import User
+from .engine import FTS_TABLE, LikeBackend, SQLiteFTSBackend, get_backend, search_filter, search_ids
+from .models import SearchDocument
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="drhouse", role="doctor", first_name="Gregory")
+        self.patient = User.objects.create(username="jdoe", role="patient", first_name="Zoë", last_name="Müller")
+        self.amox = self.prescribe(medicine="Amoxicillin", dosage="500mg", instructions="twice daily")
+        self.ibu = self.prescribe(medicine="Ibuprofen", dosage="200mg", instructions="with food")
+
+    def prescribe(self, **fields):
+        appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_datetime=timezone.now() + timedelta(days=1 + Appointment.objects.count()),
+        )
+        return Prescription.objects.create(appointment=appointment, doctor=self.doctor, patient=self.patient, **fields)
+
+    def fts_ids(self, match):
+        if connection.vendor != "sqlite" or not isinstance(get_backend(), SQLiteFTSBackend):
+            self.skipTest("SQLite FTS5 trigram index not available")
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT object_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_substring_and_accent_insensitive_matches(self):
+        self.assertEqual(search_ids("prescription", "amox"), [self.amox.pk])
+        self.assertEqual(search_ids("prescription", "DAILY twice"), [self.amox.pk])
+        self.assertEqual(search_ids("user", "muller zoe"), [self.patient.pk])
+
+    def test_short_terms_narrow_long_ones(self):
+        self.assertEqual(search_ids("prescription", "mg food"), [self.ibu.pk])
+
+    def test_typo_falls_back_to_similarity(self):
+        self.assertEqual(search_ids("prescription", "amoxicilin"), [self.amox.pk])
+
+    def test_within_restricts_candidates(self):
+        self.assertEqual(search_ids("prescription", "mg", within=[self.ibu.pk]), [self.ibu.pk])
+        self.assertEqual(search_ids("prescription", "amox", within=[self.ibu.pk]), [])
+
+    def test_triggers_follow_document_changes(self):
+        self.assertEqual(self.fts_ids('"amoxicillin"'), {self.amox.pk})
+        self.amox.medicine = "Azithromycin"
+        self.amox.save()
+        self.assertEqual(self.fts_ids('"amoxicillin"'), set())
+        self.assertEqual(self.fts_ids('"azithro"'), {self.amox.pk})
+        self.amox.delete()
+        self.assertEqual(self.fts_ids('"azithro"'), set())
+        self.assertFalse(SearchDocument.objects.filter(kind="prescription", object_id=self.amox.pk).exists())
+
+    def test_unrelated_field_updates_leave_the_document(self):
+        document = SearchDocument.objects.get(kind="user", object_id=self.doctor.pk)
+        self.doctor.save(update_fields=["last_login"])
+        self.assertEqual(SearchDocument.objects.get(pk=document.pk).updated_at, document.updated_at)
+
+    @override_settings(SEARCH_MAX_HITS=1)
+    def test_filter_is_not_capped(self):
+        self.assertEqual(len(search_ids("prescription", "mg")), 1)
+        matches = Prescription.objects.filter(id__in=search_filter("prescription", "mg"))
+        self.assertEqual(set(matches), {self.amox, self.ibu})
+
+    def test_filter_restricts_and_falls_back(self):
+        within = Prescription.objects.filter(pk=self.ibu.pk).values_list("id", flat=True)
+        matches = Prescription.objects.filter(id__in=search_filter("prescription", "mg", within=within))
+        self.assertEqual(list(matches), [self.ibu])
+        self.assertEqual(search_filter("prescription", "amoxicilin"), [self.amox.pk])
+        self.assertEqual(search_filter("prescription", "  "), [])
+
+    def test_like_backend_filter(self):
+        backend = LikeBackend(connection)
+        sql, params = backend.exact_sql("user", ["zoe"], None)
+        self.assertEqual(list(User.objects.filter(id__in=RawSQL(sql, params))), [self.patient])
+
+    @override_settings(SEARCH_MAX_HITS=1)
+    def test_admin_list_counts_every_match(self):
+        admin = User.objects.create(username="adm", role="admin")
+        User.objects.create(username="zoe2", role="patient", first_name="Zoe")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin_users_list"), {"search": "zoe"})
+        self.assertEqual(response.context["page_obj"].count, 2)
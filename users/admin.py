@@ -1,7 +1,7 @@
 # users/admin.py
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User
+from .models import JobCheckpoint, User
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'role', 'is_staff', 'date_joined')
@@ -18,3 +18,9 @@ class CustomUserAdmin(UserAdmin):
     )
 
 admin.site.register(User, CustomUserAdmin)
+
+
+@admin.register(JobCheckpoint)
+class JobCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_started_at', 'last_finished_at', 'runs', 'processed', 'locked_until', 'last_error')
+    readonly_fields = ('runs', 'processed', 'last_started_at', 'last_finished_at')
@@ -0,0 +1,26 @@
+"""
+Helpers for the async views.
+
+Under ASGI these views run on the event loop and read through the async ORM,
+so a slow client or a polling browser no longer holds a worker thread while
+it waits. Anything a template touches must be loaded before ``render()``,
+which is synchronous: the lazy ``request.user`` and session, and querysets
+(materialized into lists with their relations ``select_related``).
+Otherwise rendering raises ``SynchronousOnlyOperation``. Views whose
+templates load data lazily (the fragment-cached dashboards) render in a
+thread with ``sync_to_async(render)`` instead.
+"""
+
+
+async def aload_request(request):
+    """Resolve the user and load the session so templates read them from memory"""
+    request.user = await request.auser()
+    session = getattr(request, "session", None)
+    if session is not None:
+        # Messages and the CSRF token are read from the session while rendering
+        await session.aitems()
+    return request.user
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
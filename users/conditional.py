@@ -0,0 +1,187 @@
+"""
+Conditional GET for the pages patients and doctors keep refreshing.
+
+``@conditional_page(validator)`` asks ``validator(request)`` for a cheap
+summary of the data a page shows, usually one aggregate query such as the
+count and ``Max("updated_at")`` of the user's appointments. The page's ETag
+is a hash of that summary plus:
+
+* the user, and the name shown in the header
+* the CSRF secret, because forms on the page carry a token
+* the ``CONDITIONAL_GET_WINDOW`` bucket, which bounds how long "today" and
+  relative times ("issued 5 minutes ago") can stay unchanged
+* the template files' modification time, so a deploy changes every ETag
+
+When the browser's ``If-None-Match`` matches, the view does not run and the
+response is an empty ``304 Not Modified``. ETags are weak because two
+renders differ in their masked CSRF tokens. Responses are
+``Cache-Control: private, no-cache``: browsers keep the page but revalidate
+it every time, and shared caches do not store it. Requests with pending flash
+messages always render. A validator returns ``None`` to skip the
+conditional check, e.g. for a user the view will turn away.
+
+Outcomes are counted in ``clinicms_conditional_requests_total``: ``hit``
+(304), ``miss`` (rendered with an ETag) and ``skip``.
+"""
+import functools
+import hashlib
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Count, Max, Q
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+
+from . import metrics
+
+
+@functools.cache
+def _templates_stamp():
+    """Newest modification time of the project's template files"""
+    roots = [Path(directory) for directory in settings.TEMPLATES[0]["DIRS"]]
+    roots += [Path(config.path) / "templates" for config in apps.get_app_configs()
+              if config.path.startswith(str(settings.BASE_DIR))]
+    return max(
+        (path.stat().st_mtime for root in roots if root.is_dir() for path in root.rglob("*") if path.is_file()),
+        default=0,
+    )
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return (match.view_name or match._func_path) if match else "unresolved"
+
+
+def page_etag(request, state):
+    user = request.user
+    window = settings.CONDITIONAL_GET_WINDOW
+    raw = "|".join(str(part) for part in (
+        _view_name(request),
+        user.pk,
+        user.username,
+        request.META.get("CSRF_COOKIE", ""),
+        int(timezone.now().timestamp() // window),
+        _templates_stamp(),
+        state,
+    ))
+    return f'W/"{hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def _check(request, validator):
+    """(etag, 304 response or None); no etag when the request is skipped"""
+    if (
+        request.method not in ("GET", "HEAD")
+        or not settings.CONDITIONAL_GET_WINDOW
+        or len(messages.get_messages(request))
+    ):
+        return None, None
+    state = validator(request)
+    if state is None:
+        return None, None
+    # The CSRF secret must exist before it goes into the ETag
+    get_token(request)
+    etag = page_etag(request, state)
+    return etag, get_conditional_response(request, etag=etag)
+
+
+def _finish(request, response, etag, not_modified):
+    if etag is None:
+        outcome = "skip"
+    elif not_modified:
+        outcome = "hit"
+    elif response.status_code == 200:
+        outcome = "miss"
+        response.headers.setdefault("ETag", etag)
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        outcome = "skip"
+    metrics.registry.inc("clinicms_conditional_requests_total", view=_view_name(request), outcome=outcome)
+    return response
+
+
+def conditional_page(validator):
+    """
+    Answer 304 for unchanged pages; ``validator(request)`` returns a
+    summary of the page's data (any value with a stable ``str()``), or None
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @functools.wraps(view_func)
+            async def wrapper(request, *args, **kwargs):
+                etag, response = await sync_to_async(_check)(request, validator)
+                not_modified = response is not None
+                if not not_modified:
+                    response = await view_func(request, *args, **kwargs)
+                return _finish(request, response, etag, not_modified)
+        else:
+            @functools.wraps(view_func)
+            def wrapper(request, *args, **kwargs):
+                etag, response = _check(request, validator)
+                not_modified = response is not None
+                if not not_modified:
+                    response = view_func(request, *args, **kwargs)
+                return _finish(request, response, etag, not_modified)
+        return wrapper
+    return decorator
+
+
+# ===== Validators =====
+
+def appointments_state(queryset):
+    """
+    Row count, newest ``updated_at`` and how many are still ahead of now;
+    the last one changes as appointments move from upcoming to past
+    """
+    return tuple(queryset.aggregate(
+        total=Count("id"),
+        latest=Max("updated_at"),
+        upcoming=Count("id", filter=Q(appointment_datetime__gte=timezone.now())),
+    ).values())
+
+
+def prescriptions_state(queryset):
+    return tuple(queryset.aggregate(total=Count("id"), latest=Max("updated_at")).values())
+
+
+def patient_appointments(request):
+    if request.user.role != "patient":
+        return None
+    return appointments_state(Appointment.objects.filter(patient=request.user))
+
+
+def own_appointments(request):
+    """A patient's or doctor's appointments (``list_appointments``)"""
+    role = request.user.role
+    if role == "patient":
+        return appointments_state(Appointment.objects.filter(patient=request.user))
+    if role == "doctor":
+        return appointments_state(Appointment.objects.filter(doctor=request.user))
+    return None
+
+
+def patient_prescriptions(request):
+    if request.user.role != "patient":
+        return None
+    return prescriptions_state(Prescription.objects.filter(appointment__patient=request.user))
+
+
+def patient_dashboard(request):
+    if request.user.role != "patient":
+        return None
+    return patient_appointments(request) + patient_prescriptions(request)
+
+
+def doctor_dashboard(request):
+    if request.user.role != "doctor":
+        return None
+    return (
+        appointments_state(Appointment.objects.filter(doctor=request.user))
+        + prescriptions_state(Prescription.objects.filter(doctor=request.user))
+    )
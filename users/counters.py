@@ -0,0 +1,258 @@
+"""
+Maintenance of the per-user ``UserStats`` counters.
+
+Signal handlers in ``users.signals`` translate appointment and prescription
+changes into ``F()`` increments on the affected doctor and patient rows.
+Rows that do not exist yet are left alone: ``get_user_stats()`` builds them
+from the source tables on first read, and ``reconcile()`` (``manage.py
+reconcile_user_stats``) recomputes them in batches to repair drift.
+"""
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from .models import User, UserStats
+
+STATUS_FIELDS = {
+    "pending": "pending_appointments",
+    "completed": "completed_appointments",
+    "cancelled": "cancelled_appointments",
+    "missed": "missed_appointments",
+}
+
+
+# ===== Computing from the source tables =====
+
+def _empty_stats():
+    values = {name: 0 for name in UserStats.COUNTER_FIELDS}
+    values["last_visit"] = None
+    return values
+
+
+def _appointment_aggregates(side):
+    return {
+        "total_appointments": Count("id"),
+        **{field: Count("id", filter=Q(status=status)) for status, field in STATUS_FIELDS.items()},
+        "distinct": Count("doctor" if side == "patient_id" else "patient", distinct=True),
+        "last_visit": Max("appointment_datetime", filter=Q(status="completed")),
+    }
+
+
+def collect_stats(user_ids):
+    """{user_id: {field: value}} for ``user_ids`` from four grouped queries"""
+    stats = {user_id: _empty_stats() for user_id in user_ids}
+    if not stats:
+        return stats
+
+    for side, distinct_field in (("doctor_id", "distinct_patients"), ("patient_id", "distinct_doctors")):
+        rows = (
+            Appointment.objects.filter(**{f"{side}__in": user_ids})
+            .values(side)
+            .annotate(**_appointment_aggregates(side))
+            .order_by()
+        )
+        for row in rows:
+            values = stats[row[side]]
+            values["total_appointments"] += row["total_appointments"]
+            for field in STATUS_FIELDS.values():
+                values[field] += row[field]
+            values[distinct_field] += row["distinct"]
+            if row["last_visit"] and (values["last_visit"] is None or row["last_visit"] > values["last_visit"]):
+                values["last_visit"] = row["last_visit"]
+
+    for side in ("doctor_id", "appointment__patient_id"):
+        rows = (
+            Prescription.objects.filter(**{f"{side}__in": user_ids})
+            .values(side)
+            .annotate(total=Count("id"), active=Count("id", filter=Q(is_active=True)))
+            .order_by()
+        )
+        for row in rows:
+            stats[row[side]]["prescriptions"] += row["total"]
+            stats[row[side]]["active_prescriptions"] += row["active"]
+
+    return stats
+
+
+def get_user_stats(user):
+    """The user's counters: one primary-key lookup, built on first use"""
+    stats = UserStats.objects.filter(pk=user.pk).first()
+    if stats is not None:
+        return stats
+    values = collect_stats([user.pk])[user.pk]
+    try:
+        with transaction.atomic():
+            return UserStats.objects.create(user_id=user.pk, **values)
+    except IntegrityError:
+        # Built concurrently by another request
+        return UserStats.objects.get(pk=user.pk)
+
+
+async def aget_user_stats(user):
+    """``get_user_stats()`` for async views; only a missing row leaves the event loop"""
+    stats = await UserStats.objects.filter(pk=user.pk).afirst()
+    if stats is not None:
+        return stats
+    return await sync_to_async(get_user_stats)(user)
+
+
+def reconcile(batch_size=500, user_ids=None, dry_run=False):
+    """Recompute counters in batches; returns (checked, repaired)"""
+    users = User.objects.order_by("pk")
+    if user_ids:
+        users = users.filter(pk__in=user_ids)
+    checked = repaired = 0
+    last_pk = 0
+    while True:
+        batch = list(users.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1]
+        expected = collect_stats(batch)
+        current = {row.pk: row for row in UserStats.objects.filter(pk__in=batch)}
+        for user_id, values in expected.items():
+            checked += 1
+            row = current.get(user_id)
+            if row is not None and all(getattr(row, name) == value for name, value in values.items()):
+                continue
+            repaired += 1
+            if not dry_run:
+                UserStats.objects.update_or_create(user_id=user_id, defaults=values)
+    return checked, repaired
+
+
+# ===== Incremental maintenance =====
+
+def bump(user_id, deltas):
+    """Apply counter deltas to an existing row; missing rows are built lazily"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not user_id or not deltas:
+        return
+    UserStats.objects.filter(pk=user_id).update(
+        updated_at=timezone.now(),
+        **{name: F(name) + delta for name, delta in deltas.items()},
+    )
+
+
+def _refresh_last_visit(user_id):
+    last_visit = Appointment.objects.filter(
+        Q(doctor_id=user_id) | Q(patient_id=user_id), status="completed"
+    ).aggregate(last=Max("appointment_datetime"))["last"]
+    UserStats.objects.filter(pk=user_id).update(last_visit=last_visit, updated_at=timezone.now())
+
+
+def _appointment_values(appointment, fallback=None):
+    fallback = fallback or {}
+    return {
+        name: fallback.get(name, getattr(appointment, name))
+        for name in ("doctor_id", "patient_id", "status", "appointment_datetime")
+    }
+
+
+def _pair_exists(doctor_id, patient_id):
+    return Appointment.objects.filter(doctor_id=doctor_id, patient_id=patient_id).exists()
+
+
+def _apply_appointment(deltas, values, sign):
+    for user_id in (values["doctor_id"], values["patient_id"]):
+        deltas[user_id]["total_appointments"] += sign
+        field = STATUS_FIELDS.get(values["status"])
+        if field:
+            deltas[user_id][field] += sign
+
+
+def appointment_changed(appointment, previous=None):
+    """
+    Apply an appointment insert/update. ``previous`` is the loaded field
+    values (``Appointment._loaded_values``) or ``None`` for a new row.
+    """
+    new = _appointment_values(appointment)
+    old = _appointment_values(appointment, previous) if previous is not None else None
+    if old == new:
+        return
+
+    deltas = defaultdict(lambda: defaultdict(int))
+    if old:
+        _apply_appointment(deltas, old, -1)
+    _apply_appointment(deltas, new, 1)
+
+    new_pair = (new["doctor_id"], new["patient_id"])
+    old_pair = (old["doctor_id"], old["patient_id"]) if old else None
+    if old_pair != new_pair:
+        # The row is already saved, so the pair is new when it is the only one
+        if Appointment.objects.filter(doctor_id=new_pair[0], patient_id=new_pair[1]).count() == 1:
+            deltas[new_pair[0]]["distinct_patients"] += 1
+            deltas[new_pair[1]]["distinct_doctors"] += 1
+        if old_pair and not _pair_exists(*old_pair):
+            deltas[old_pair[0]]["distinct_patients"] -= 1
+            deltas[old_pair[1]]["distinct_doctors"] -= 1
+
+    for user_id, user_deltas in deltas.items():
+        bump(user_id, user_deltas)
+
+    if old and old["status"] == "completed" and old != new:
+        for user_id in {old["doctor_id"], old["patient_id"], new["doctor_id"], new["patient_id"]}:
+            _refresh_last_visit(user_id)
+    elif new["status"] == "completed" and new["appointment_datetime"]:
+        UserStats.objects.filter(
+            Q(last_visit__isnull=True) | Q(last_visit__lt=new["appointment_datetime"]),
+            pk__in=[new["doctor_id"], new["patient_id"]],
+        ).update(last_visit=new["appointment_datetime"])
+
+
+def appointment_deleted(appointment):
+    values = _appointment_values(appointment)
+    deltas = defaultdict(lambda: defaultdict(int))
+    _apply_appointment(deltas, values, -1)
+    if not _pair_exists(values["doctor_id"], values["patient_id"]):
+        deltas[values["doctor_id"]]["distinct_patients"] -= 1
+        deltas[values["patient_id"]]["distinct_doctors"] -= 1
+    for user_id, user_deltas in deltas.items():
+        bump(user_id, user_deltas)
+    if values["status"] == "completed":
+        for user_id in (values["doctor_id"], values["patient_id"]):
+            _refresh_last_visit(user_id)
+
+
+def _prescription_patient_id(appointment_id):
+    return Appointment.objects.filter(pk=appointment_id).values_list("patient_id", flat=True).first()
+
+
+def _prescription_holders(doctor_id, appointment_id, is_active):
+    """[(user_id, deltas)] for the issuing doctor and the receiving patient"""
+    deltas = {"prescriptions": 1, "active_prescriptions": 1 if is_active else 0}
+    return [(doctor_id, deltas), (_prescription_patient_id(appointment_id), deltas)]
+
+
+def prescription_changed(prescription, previous=None):
+    new = (prescription.doctor_id, prescription.appointment_id, prescription.is_active)
+    old = None
+    if previous is not None:
+        old = tuple(
+            previous.get(name, getattr(prescription, name))
+            for name in ("doctor_id", "appointment_id", "is_active")
+        )
+    if old == new:
+        return
+    changes = defaultdict(lambda: defaultdict(int))
+    if old:
+        for user_id, deltas in _prescription_holders(*old):
+            for name, delta in deltas.items():
+                changes[user_id][name] -= delta
+    for user_id, deltas in _prescription_holders(*new):
+        for name, delta in deltas.items():
+            changes[user_id][name] += delta
+    for user_id, deltas in changes.items():
+        bump(user_id, deltas)
+
+
+def prescription_deleted(prescription):
+    for user_id, deltas in _prescription_holders(
+        prescription.doctor_id, prescription.appointment_id, prescription.is_active
+    ):
+        bump(user_id, {name: -delta for name, delta in deltas.items()})
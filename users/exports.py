@@ -0,0 +1,137 @@
+"""
+Streaming data exports for admin_export_data.
+
+Rows are pulled with ``.values(...).iterator(chunk_size=...)`` and encoded
+one at a time as JSON, NDJSON or CSV, optionally gzip-compressed on the
+fly, so memory use stays flat no matter how large the table is.
+
+Under ASGI a ``StreamingHttpResponse`` given a sync iterator collects it
+into a list before sending anything, so the view wraps the blocks with
+``aiter_blocks()`` there. Each block is still produced in the request's
+sync thread, where the database cursor lives.
+"""
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from .models import User
+
+# Rows fetched from the database per round-trip
+EXPORT_CHUNK_SIZE = 2000
+
+# Encoded output is coalesced into blocks of about this many bytes
+EXPORT_BLOCK_SIZE = 64 * 1024
+
+EXPORTS = {
+    'users': (
+        lambda: User.objects.order_by('id'),
+        ['id', 'username', 'first_name', 'last_name', 'email', 'role', 'date_joined', 'is_active'],
+    ),
+    'appointments': (
+        lambda: Appointment.objects.order_by('id'),
+        ['id', 'patient__username', 'doctor__username', 'appointment_datetime',
+         'appointment_type', 'status', 'symptoms', 'notes', 'created_at'],
+    ),
+    'prescriptions': (
+        lambda: Prescription.objects.order_by('id'),
+        ['id', 'doctor__username', 'appointment__patient__username',
+         'medicine', 'dosage', 'instructions', 'date_issued'],
+    ),
+}
+
+FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def iter_rows(export_type, chunk_size=EXPORT_CHUNK_SIZE):
+    queryset_factory, fields = EXPORTS[export_type]
+    return queryset_factory().values(*fields).iterator(chunk_size=chunk_size)
+
+
+def json_chunks(rows):
+    """A JSON array written one element at a time"""
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(row, default=str)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def ndjson_chunks(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(rows, fields):
+    writer = csv.DictWriter(_Echo(), fieldnames=fields)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def encode_blocks(chunks, block_size=EXPORT_BLOCK_SIZE):
+    """Encode text chunks and coalesce them into ~block_size byte blocks"""
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= block_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_blocks(blocks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_export(export_type, format_type, compress=False):
+    """Iterable of bytes blocks for one export"""
+    _queryset_factory, fields = EXPORTS[export_type]
+    rows = iter_rows(export_type)
+    if format_type == 'csv':
+        chunks = csv_chunks(rows, fields)
+    elif format_type == 'ndjson':
+        chunks = ndjson_chunks(rows)
+    else:
+        chunks = json_chunks(rows)
+    blocks = encode_blocks(chunks)
+    return gzip_blocks(blocks) if compress else blocks
+
+
+async def aiter_blocks(blocks):
+    """Async iterator over a sync iterable of bytes, one block per thread hop"""
+    blocks = iter(blocks)
+    next_block = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (block := await next_block(blocks, None)) is not None:
+            yield block
+    finally:
+        close = getattr(blocks, 'close', None)
+        if close is not None:
+            # Releases the database cursor when the client disconnects early
+            await sync_to_async(close, thread_sensitive=True)()
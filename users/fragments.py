@@ -0,0 +1,121 @@
+"""
+Fragment caching for the dashboards.
+
+Each dashboard section sits in a ``{% cache %}`` block that varies on one
+key built from:
+
+* the view and the user
+* the user's data version, which ``users.signals`` bumps after a commit
+  that touches the user's appointments or prescriptions
+* the local date, because "today" and "this month" figures change at
+  midnight
+* the CSRF secret, because cached forms carry a CSRF token
+
+Views pass data the template loads only when it renders a section:
+querysets (lazy already) and ``deferred()`` callables. A section served from
+the cache never evaluates them, so a dashboard whose sections are all
+cached runs no query for its data. Async views render in a thread
+(``sync_to_async(render)``) so those loads may use the ORM.
+
+Admin dashboards use the clinic-wide version, which any appointment,
+prescription or user change bumps. Clock-relative text inside a section
+("booked 5 minutes ago") can be up to ``DASHBOARD_FRAGMENT_TTL`` seconds old.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.utils import timezone
+
+from appointments.models import Appointment
+
+CACHE_PREFIX = "dashboard:version"
+
+# Version scope for clinic-wide data (the admin dashboard)
+CLINIC = "clinic"
+
+
+def _version_key(scope):
+    return f"{CACHE_PREFIX}:{scope}"
+
+
+def data_version(scope):
+    return cache.get_or_set(_version_key(scope), 1, timeout=None)
+
+
+async def adata_version(scope):
+    return await cache.aget_or_set(_version_key(scope), 1, timeout=None)
+
+
+def _bump_now(scopes):
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, timeout=None)
+
+
+def bump(*user_ids):
+    """
+    Invalidate the dashboards of ``user_ids`` (and the clinic-wide ones)
+    once the current transaction commits, so no request can cache
+    pre-commit data under the new version.
+    """
+    scopes = {user_id for user_id in user_ids if user_id} | {CLINIC}
+    transaction.on_commit(lambda: _bump_now(scopes))
+
+
+def appointment_changed(appointment, previous=None):
+    previous = previous or {}
+    bump(appointment.doctor_id, appointment.patient_id, previous.get("doctor_id"), previous.get("patient_id"))
+
+
+def prescription_changed(prescription, previous=None):
+    """The patient dashboard lists prescriptions through their appointment's patient"""
+    previous = previous or {}
+    appointment_ids = {prescription.appointment_id, previous.get("appointment_id")} - {None}
+    patient_ids = Appointment.objects.filter(pk__in=appointment_ids).values_list("patient_id", flat=True)
+    bump(
+        prescription.doctor_id, prescription.patient_id,
+        previous.get("doctor_id"), previous.get("patient_id"),
+        *patient_ids,
+    )
+
+
+def deferred(loader):
+    """Zero-argument callable memoizing ``loader()``; templates call it on first use"""
+    return functools.cache(loader)
+
+
+class DashboardFragments:
+    """The cache key and TTL a dashboard template's ``{% cache %}`` blocks use"""
+
+    def __init__(self, request, view_name, version):
+        csrf_secret = request.META.get("CSRF_COOKIE", "")
+        day = timezone.localdate().isoformat()
+        raw = f"{view_name}:{request.user.pk}:{version}:{day}:{csrf_secret}"
+        self.key = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+        self.ttl = settings.DASHBOARD_FRAGMENT_TTL
+
+    def context(self):
+        return {"fragment_key": self.key, "fragment_ttl": self.ttl}
+
+
+def _prepare(request):
+    # Make sure the CSRF secret exists before it goes into the key; forms
+    # in cached sections carry tokens that only match this secret
+    get_token(request)
+
+
+def dashboard_fragments(request, view_name, scope):
+    _prepare(request)
+    return DashboardFragments(request, view_name, data_version(scope))
+
+
+async def adashboard_fragments(request, view_name, scope):
+    _prepare(request)
+    return DashboardFragments(request, view_name, await adata_version(scope))
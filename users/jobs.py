@@ -0,0 +1,127 @@
+"""
+Periodic jobs run by ``manage.py run_jobs`` (cron, or ``--loop`` as a worker).
+
+A job is a generator function taking its ``JobCheckpoint`` and a batch size.
+It reads where to resume from ``checkpoint.cursor`` and yields
+``(processed, cursor)`` after each batch it has committed. The runner saves
+the cursor after every batch and stops the job after ``max_batches``, so a
+run does bounded work and the next run continues where it stopped. A job
+returns, and the runner resets the cursor, once a pass finds nothing left.
+
+Jobs must be idempotent: a run that dies between committing a batch and
+saving the cursor repeats that batch. Each job holds a lease on its
+checkpoint row for ``JOBS_LEASE_SECONDS``, so overlapping cron runs or
+several workers do not run the same job at once. The runner renews the
+lease after every batch, and only the run whose ``locked_until`` is still on
+the row may renew or release it: a run that outlived its lease (a batch
+slower than ``JOBS_LEASE_SECONDS``) stops instead of working alongside the
+run that took over.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import JobCheckpoint
+
+logger = logging.getLogger(__name__)
+
+JOBS = {
+    "sweep_missed": "appointments.jobs.sweep_missed",
+    "send_reminders": "appointments.jobs.send_reminders",
+    "send_queued_mail": "outbox.delivery.send_queued_mail",
+}
+
+
+@dataclass
+class JobResult:
+    name: str
+    processed: int = 0
+    batches: int = 0
+    finished_pass: bool = False
+    skipped: bool = False
+    error: str = ""
+
+
+class LeaseLost(Exception):
+    """Another run took over the job after this run's lease expired"""
+
+
+def _lease_end(now):
+    return now + timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+
+
+def acquire(name):
+    """The job's checkpoint if its lease was free, else None"""
+    JobCheckpoint.objects.get_or_create(name=name)
+    now = timezone.now()
+    locked_until = _lease_end(now)
+    acquired = JobCheckpoint.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now), name=name
+    ).update(locked_until=locked_until, last_started_at=now)
+    if not acquired:
+        return None
+    checkpoint = JobCheckpoint.objects.get(name=name)
+    # Ownership is checked against the exact value written above
+    checkpoint.locked_until = locked_until
+    return checkpoint
+
+
+def _owned(checkpoint):
+    return JobCheckpoint.objects.filter(name=checkpoint.name, locked_until=checkpoint.locked_until)
+
+
+def _save_progress(checkpoint, processed, cursor):
+    """Record a committed batch and renew the lease, or raise LeaseLost"""
+    locked_until = _lease_end(timezone.now())
+    saved = _owned(checkpoint).update(
+        cursor=cursor, processed=F("processed") + processed, locked_until=locked_until
+    )
+    if not saved:
+        raise LeaseLost(f"lease on {checkpoint.name} expired and was taken over")
+    checkpoint.cursor = cursor
+    checkpoint.locked_until = locked_until
+
+
+def _release(checkpoint, error=""):
+    """Free the lease, unless another run already holds it"""
+    _owned(checkpoint).update(
+        locked_until=None,
+        last_finished_at=timezone.now(),
+        last_error=error,
+        runs=F("runs") + 1,
+    )
+
+
+def run(name, batch_size=200, max_batches=10):
+    """Run one job for at most ``max_batches`` batches"""
+    result = JobResult(name)
+    checkpoint = acquire(name)
+    if checkpoint is None:
+        result.skipped = True
+        return result
+    job = import_string(JOBS[name])
+    try:
+        batches = job(checkpoint, batch_size)
+        for processed, cursor in batches:
+            _save_progress(checkpoint, processed, cursor)
+            result.processed += processed
+            result.batches += 1
+            if result.batches >= max_batches:
+                batches.close()
+                break
+        else:
+            result.finished_pass = True
+            _save_progress(checkpoint, 0, {})
+    except LeaseLost as exc:
+        logger.warning("Job %s stopped: %s", name, exc)
+        result.error = f"LeaseLost: {exc}"
+    except Exception as exc:
+        logger.exception("Job %s failed", name)
+        result.error = f"{type(exc).__name__}: {exc}"[:500]
+    _release(checkpoint, result.error)
+    return result
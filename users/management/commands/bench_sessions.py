@@ -0,0 +1,71 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from users.models import User
+
+BENCH_USERNAME = "bench_sessions_patient"
+
+ENGINES = (
+    ("db", "django.contrib.sessions.backends.db"),
+    ("cached_db", "django.contrib.sessions.backends.cached_db"),
+    ("users.sessions", "users.sessions"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Count django_session reads and writes per authenticated page view for "
+        "the database, cached_db and users.sessions engines. The clock is "
+        "simulated, so --interval seconds pass between requests without waiting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=60)
+        parser.add_argument("--interval", type=float, default=5.0, help="Simulated seconds between requests")
+        parser.add_argument("--path", default="/patient/profile/")
+
+    def handle(self, *args, **options):
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create(username=BENCH_USERNAME, role="patient")
+        try:
+            for label, engine in ENGINES:
+                self._run(label, engine, user, options)
+        finally:
+            user.delete()
+
+    def _run(self, label, engine, user, options):
+        clock = [timezone.now()]
+        hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        with override_settings(SESSION_ENGINE=engine, ALLOWED_HOSTS=hosts), \
+                mock.patch("django.utils.timezone.now", side_effect=lambda: clock[0]):
+            client = Client()
+            client.force_login(user)
+            reads = writes = 0
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(options["requests"]):
+                    clock[0] += timedelta(seconds=options["interval"])
+                    client.get(options["path"])
+            # Read the log now: the next request outside the context resets it
+            total_queries = len(queries)
+            for query in queries:
+                sql = query["sql"]
+                if "django_session" not in sql:
+                    continue
+                if sql.lstrip().upper().startswith("SELECT"):
+                    reads += 1
+                else:
+                    writes += 1
+            still_logged_in = client.get(options["path"]).status_code == 200
+        requests = options["requests"]
+        self.stdout.write(
+            f"{label:<15} session reads={reads:<4} writes={writes:<4} "
+            f"writes/request={writes / requests:.2f} all queries/request={total_queries / requests:.1f} "
+            f"logged_in={still_logged_in}"
+        )
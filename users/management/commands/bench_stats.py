@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from users.stats import get_clinic_stats, metric_specs
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare one COUNT query per admin counter with the conditional "
+        "aggregation used by users.stats.get_clinic_stats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        repeat = options["repeat"]
+
+        def per_metric():
+            return {
+                metric.name: metric.count(model.objects.all())
+                for model, metrics in metric_specs(now).items()
+                for metric in metrics
+            }
+
+        def aggregated():
+            return get_clinic_stats(now)
+
+        legacy_values = per_metric()
+        snapshot = aggregated()
+        mismatched = [name for name, value in legacy_values.items() if getattr(snapshot, name) != value]
+
+        for label, func in (("one COUNT per metric", per_metric), ("conditional aggregation", aggregated)):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                func()
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            self.stdout.write(f"{label:<26} queries={len(queries):<3} avg={elapsed:.2f}ms")
+
+        if mismatched:
+            self.stdout.write(self.style.ERROR(f"Mismatched metrics: {', '.join(mismatched)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All {len(legacy_values)} metrics match"))
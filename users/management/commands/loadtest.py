@@ -0,0 +1,191 @@
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from users.models import User
+
+BENCH_USERNAME = "loadtest_patient"
+
+SERVERS = {
+    "wsgi": ["clinicms.wsgi:application"],
+    "asgi": ["clinicms.asgi:application", "-k", "uvicorn_worker.UvicornWorker"],
+}
+
+# The patient's polling and dashboard endpoints
+DEFAULT_PATHS = ("/patient/notifications/", "/patient/appointments/ajax/", "/dashboard/patient/")
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "HTTP load against one gunicorn worker process, once with the WSGI app "
+        "(sync worker) and once with the ASGI app (uvicorn worker). Normal "
+        "clients poll the patient endpoints while slow clients hold "
+        "connections open by trickling their request headers, the way slow "
+        "mobile clients do. Use --url to load an already running server that "
+        "shares this database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", action="append", choices=sorted(SERVERS),
+                            help="Only run this server (repeatable)")
+        parser.add_argument("--url", help="Load this server instead of starting gunicorn")
+        parser.add_argument("--clients", type=int, default=10, help="Concurrent normal clients")
+        parser.add_argument("--slow-clients", type=int, default=20, help="Connections trickling headers")
+        parser.add_argument("--trickle", type=float, default=1.0, help="Seconds between slow header lines")
+        parser.add_argument("--seconds", type=float, default=10.0, help="Load duration per server")
+        parser.add_argument("--timeout", type=float, default=5.0, help="Per-request timeout of normal clients")
+        parser.add_argument("--path", action="append", help="Path to request (repeatable)")
+
+    def handle(self, *args, **options):
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create(username=BENCH_USERNAME, role="patient")
+        try:
+            cookie = self._session_cookie(user)
+            if options["url"]:
+                self._report(options["url"], self._load(options["url"], cookie, options), options)
+                return
+            for name in options["server"] or SERVERS:
+                with self._serve(name) as url:
+                    self._report(name, self._load(url, cookie, options), options)
+        finally:
+            user.delete()
+
+    def _session_cookie(self, user):
+        client = Client()
+        client.force_login(user)
+        return f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    # ===== Server =====
+
+    @contextmanager
+    def _serve(self, name):
+        port = _free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", *SERVERS[name], "--workers", "1",
+             "--bind", f"127.0.0.1:{port}", "--log-level", "warning"],
+            env=dict(os.environ, ALLOWED_HOSTS="127.0.0.1,localhost"),
+        )
+        try:
+            self._wait_for(port, process)
+            yield f"http://127.0.0.1:{port}"
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def _wait_for(self, port, process):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"gunicorn exited with status {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError("gunicorn did not start listening within 30 seconds")
+
+    # ===== Load =====
+
+    def _load(self, url, cookie, options):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        paths = options["path"] or DEFAULT_PATHS
+        stop = threading.Event()
+        results = {"latencies": [], "statuses": {}, "errors": 0, "slow_open": 0}
+        lock = threading.Lock()
+
+        def normal_client(number):
+            index = number
+            while not stop.is_set():
+                path = paths[index % len(paths)]
+                index += 1
+                started = time.perf_counter()
+                connection = http.client.HTTPConnection(host, port, timeout=options["timeout"])
+                try:
+                    connection.request("GET", path, headers={"Cookie": cookie})
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                except OSError:
+                    status = None
+                finally:
+                    connection.close()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if status is None:
+                        results["errors"] += 1
+                    else:
+                        results["statuses"][status] = results["statuses"].get(status, 0) + 1
+                        results["latencies"].append(elapsed)
+
+        def slow_client():
+            try:
+                sock = socket.create_connection((host, port), timeout=options["seconds"] + 5)
+            except OSError:
+                return
+            try:
+                sock.sendall(f"GET {paths[0]} HTTP/1.1\r\nHost: {host}\r\n".encode())
+                with lock:
+                    results["slow_open"] += 1
+                line = 0
+                while not stop.wait(options["trickle"]):
+                    sock.sendall(f"X-Trickle-{line}: 1\r\n".encode())
+                    line += 1
+            except OSError:
+                pass
+            finally:
+                sock.close()
+
+        threads = [threading.Thread(target=slow_client) for _ in range(options["slow_clients"])]
+        for thread in threads:
+            thread.start()
+        # Let the slow connections get accepted before measuring
+        time.sleep(min(1.0, options["trickle"]))
+        normal = [threading.Thread(target=normal_client, args=(n,)) for n in range(options["clients"])]
+        for thread in normal:
+            thread.start()
+        time.sleep(options["seconds"])
+        stop.set()
+        for thread in threads + normal:
+            thread.join()
+        return results
+
+    def _report(self, name, results, options):
+        latencies = results["latencies"]
+        completed = len(latencies)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{name}: {options['clients']} clients, {results['slow_open']}/{options['slow_clients']} slow connections"
+        ))
+        statuses = " ".join(f"{status}={count}" for status, count in sorted(results["statuses"].items()))
+        self.stdout.write(
+            f"  requests={completed} ({completed / options['seconds']:.1f}/s) "
+            f"errors={results['errors']} statuses: {statuses or '-'}"
+        )
+        self.stdout.write(
+            f"  p50={_percentile(latencies, 0.5) * 1000:.1f}ms "
+            f"p95={_percentile(latencies, 0.95) * 1000:.1f}ms "
+            f"p99={_percentile(latencies, 0.99) * 1000:.1f}ms"
+        )
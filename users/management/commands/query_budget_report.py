@@ -0,0 +1,40 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the per-view query report collected by QueryBudgetMiddleware. "
+        "Run the test suite with QUERY_BUDGET_REPORT=<file> first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="Report file (defaults to QUERY_BUDGET_REPORT)")
+        parser.add_argument("--over-budget", action="store_true", help="Only views that exceeded their budget")
+
+    def handle(self, *args, **options):
+        path = options["path"] or settings.QUERY_BUDGET_REPORT
+        if not path:
+            raise CommandError("No report file given and QUERY_BUDGET_REPORT is not set")
+        try:
+            with open(path) as report_file:
+                views = json.load(report_file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+        rows = sorted(views.items(), key=lambda item: item[1]["max_queries"], reverse=True)
+        if options["over_budget"]:
+            rows = [(name, entry) for name, entry in rows if entry["over_budget"]]
+
+        self.stdout.write(f"{'view':60} {'reqs':>5} {'avg':>6} {'max':>5} {'budget':>6} {'over':>5} {'repeat':>6}")
+        for name, entry in rows:
+            average = entry["queries"] / entry["requests"] if entry["requests"] else 0
+            line = (
+                f"{name[:60]:60} {entry['requests']:>5} {average:>6.1f} {entry['max_queries']:>5} "
+                f"{entry['budget']:>6} {entry['over_budget']:>5} {entry['max_repeats']:>6}"
+            )
+            self.stdout.write(self.style.ERROR(line) if entry["over_budget"] else line)
+            if entry["over_budget"] and entry["worst_shape"]:
+                self.stdout.write(f"    most repeated: {entry['worst_shape'][:150]}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from users import counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-user dashboard counters (UserStats) from the appointment "
+        "and prescription tables and repair any rows that drifted. Schedule it "
+        "nightly and run it after bulk imports that bypass signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="Only this user id (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without writing")
+
+    def handle(self, *args, **options):
+        checked, repaired = counters.reconcile(
+            batch_size=options["batch_size"],
+            user_ids=options["user_ids"],
+            dry_run=options["dry_run"],
+        )
+        verb = "would repair" if options["dry_run"] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} users, {verb} {repaired}"))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the periodic jobs (missed-appointment sweep, reminder emails, "
+        "outbox delivery) in bounded batches. Each job resumes from its "
+        "checkpoint. Run from cron, "
+        "or with --loop as a long-running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("job", nargs="*", help=f"Jobs to run: {', '.join(jobs.JOBS)} (default: all)")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--max-batches", type=int, default=10, help="Batches per job per run")
+        parser.add_argument("--loop", action="store_true", help="Keep running every --interval seconds")
+        parser.add_argument("--interval", type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        names = options["job"] or list(jobs.JOBS)
+        unknown = set(names) - set(jobs.JOBS)
+        if unknown:
+            raise CommandError(f"Unknown jobs: {', '.join(sorted(unknown))}")
+        while True:
+            for name in names:
+                self._report(jobs.run(name, options["batch_size"], options["max_batches"]))
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
+
+    def _report(self, result):
+        if result.skipped:
+            self.stdout.write(f"{result.name}: already running elsewhere, skipped")
+        elif result.error:
+            self.stdout.write(self.style.ERROR(f"{result.name}: {result.error} after {result.processed} rows"))
+        else:
+            state = "pass complete" if result.finished_pass else "more to do, resumes next run"
+            self.stdout.write(f"{result.name}: {result.processed} rows in {result.batches} batches ({state})")
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.template_warmup import WARM_APPS, template_names, warm
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile every template of the project apps, render each with an empty "
+        "context, and report per-template compile and render times. Exits with "
+        "an error on any template syntax error."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--app", action="append", choices=WARM_APPS, help="Only this app (repeatable)")
+        parser.add_argument("--no-render", action="store_true", help="Compile only")
+
+    def handle(self, *args, **options):
+        names = template_names(options["app"] or WARM_APPS)
+        timings = warm(names, render=not options["no_render"])
+
+        self.stdout.write(f"{'template':50} {'compile':>9} {'render':>9}")
+        for timing in sorted(timings, key=lambda timing: timing.compile_seconds, reverse=True):
+            render = "-" if timing.render_seconds is None else f"{timing.render_seconds * 1000:.1f}ms"
+            line = f"{timing.name[:50]:50} {timing.compile_seconds * 1000:>7.1f}ms {render:>9}"
+            if timing.error:
+                self.stdout.write(self.style.ERROR(f"{line}  {timing.error}"))
+            elif timing.render_error:
+                self.stdout.write(f"{line}  (render needs view context: {timing.render_error[:80]})")
+            else:
+                self.stdout.write(line)
+
+        compiled = [timing for timing in timings if not timing.error]
+        total_compile = sum(timing.compile_seconds for timing in timings)
+        total_render = sum(timing.render_seconds or 0 for timing in timings)
+        self.stdout.write(
+            f"{len(compiled)}/{len(timings)} templates compiled in {total_compile * 1000:.1f}ms"
+            + ("" if options["no_render"] else f", rendered in {total_render * 1000:.1f}ms")
+        )
+        broken = [timing.name for timing in timings if timing.error]
+        if broken:
+            raise CommandError(f"Template syntax errors in: {', '.join(broken)}")
@@ -0,0 +1,299 @@
+"""
+Request, database and template metrics in the Prometheus text format.
+
+Each process keeps its counters and histograms in memory and periodically
+writes them to ``METRICS_DIR/metrics-<pid>.json`` (atomic replace). The
+``/metrics`` endpoint and ``admin_system_health`` merge every worker's file,
+so numbers add up across gunicorn workers without a shared server. Files of
+workers that have exited are kept, which keeps the counters monotonic; clear
+the directory on deploy.
+
+``users.middleware.MetricsMiddleware`` records per-URL-name latency, status,
+query count/time and response size; ``InstrumentedDjangoTemplates`` records
+template render time.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+HISTOGRAMS = {
+    "clinicms_request_duration_seconds": ("Request latency by URL name", LATENCY_BUCKETS),
+    "clinicms_db_queries_per_request": ("Database queries per request by URL name", QUERY_COUNT_BUCKETS),
+    "clinicms_db_query_duration_seconds": ("Time spent in the database per request by URL name", LATENCY_BUCKETS),
+    "clinicms_template_render_seconds": ("Template render time by template name", LATENCY_BUCKETS),
+    "clinicms_response_size_bytes": ("Response body size by URL name", SIZE_BUCKETS),
+}
+
+COUNTERS = {
+    "clinicms_requests_total": "Requests by URL name, method and status",
+    "clinicms_exceptions_total": "Unhandled exceptions by URL name and type",
+    "clinicms_appointment_save_events_total": "Appointment.save outcomes (appointments.models.save_counters)",
+    "clinicms_conditional_requests_total": "Conditional GET outcomes by URL name (users.conditional; hit = 304)",
+}
+
+# Recent unhandled exceptions kept per worker for admin_system_health
+MAX_RECENT_ERRORS = 20
+
+
+def _label_key(labels):
+    return json.dumps(sorted(labels.items()), separators=(",", ":"))
+
+
+def _metrics_dir():
+    return getattr(settings, "METRICS_DIR", "") or os.path.join(tempfile.gettempdir(), "clinicms-metrics")
+
+
+class Registry:
+    """This process's metrics; reset automatically in forked children"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.counters = {name: {} for name in COUNTERS}
+        self.histograms = {name: {} for name in HISTOGRAMS}
+        self.errors = deque(maxlen=MAX_RECENT_ERRORS)
+        self.last_flush = 0.0
+
+    def _check_fork(self):
+        if self.pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self._check_fork()
+            series = self.counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = HISTOGRAMS[name][1]
+        key = _label_key(labels)
+        with self.lock:
+            self._check_fork()
+            series = self.histograms[name]
+            # Per-bucket (non-cumulative) counts, then sum and count
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    values[index] += 1
+                    break
+            else:
+                values[len(buckets)] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def record_error(self, message):
+        with self.lock:
+            self._check_fork()
+            self.errors.append((time.time(), message))
+
+    def snapshot(self):
+        from appointments.models import save_counters
+
+        with self.lock:
+            self._check_fork()
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            counters["clinicms_appointment_save_events_total"] = {
+                _label_key({"event": event}): value for event, value in save_counters.items()
+            }
+            return {
+                "counters": counters,
+                "histograms": {name: {key: list(values) for key, values in series.items()}
+                               for name, series in self.histograms.items()},
+                "errors": list(self.errors),
+            }
+
+    def flush(self, force=False):
+        """Write this worker's file, at most every METRICS_FLUSH_INTERVAL seconds"""
+        now = time.monotonic()
+        interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 5)
+        if not force and now - self.last_flush < interval:
+            return
+        self.last_flush = now
+        directory = _metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        data = self.snapshot()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump(data, temp_file)
+        os.replace(temp_path, os.path.join(directory, f"metrics-{self.pid}.json"))
+
+
+registry = Registry()
+
+
+def collect():
+    """Merge the metrics files of every worker (this one flushed first)"""
+    registry.flush(force=True)
+    merged = {
+        "counters": {name: {} for name in COUNTERS},
+        "histograms": {name: {} for name in HISTOGRAMS},
+        "errors": [],
+    }
+    directory = _metrics_dir()
+    for filename in os.listdir(directory):
+        if not (filename.startswith("metrics-") and filename.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as metrics_file:
+                data = json.load(metrics_file)
+        except (OSError, ValueError):
+            continue
+        for name, series in data.get("counters", {}).items():
+            target = merged["counters"].setdefault(name, {})
+            for key, value in series.items():
+                target[key] = target.get(key, 0) + value
+        for name, series in data.get("histograms", {}).items():
+            target = merged["histograms"].setdefault(name, {})
+            for key, values in series.items():
+                if key in target:
+                    target[key] = [a + b for a, b in zip(target[key], values)]
+                else:
+                    target[key] = list(values)
+        merged["errors"].extend(data.get("errors", []))
+    merged["errors"].sort(reverse=True)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, **extra):
+    pairs = [(name, value) for name, value in json.loads(key)] + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render_text(merged=None):
+    """Prometheus text exposition format (version 0.0.4)"""
+    merged = merged or collect()
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(merged["counters"].get(name, {}).items()):
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, values in sorted(merged["histograms"].get(name, {}).items()):
+            cumulative = 0
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(key, le='+Inf')} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(key)} {values[-2]}")
+            lines.append(f"{name}_count{_format_labels(key)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def quantile(values, buckets, q):
+    """Estimate a quantile from histogram buckets (linear within a bucket)"""
+    total = values[-1]
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(buckets, values):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    return buckets[-1]
+
+
+def _hit_rate(outcomes):
+    """Percentage of conditional GETs answered 304, or None for other views"""
+    if not outcomes:
+        return None
+    checked = outcomes.get("hit", 0) + outcomes.get("miss", 0)
+    return outcomes.get("hit", 0) / checked * 100 if checked else 0
+
+
+def view_summaries(merged=None, limit=10):
+    """Per-URL-name latency and database figures, slowest p95 first"""
+    merged = merged or collect()
+    histograms = merged["histograms"]
+    requests = merged["histograms"]["clinicms_request_duration_seconds"]
+    errors = {}
+    for key, value in merged["counters"]["clinicms_requests_total"].items():
+        labels = dict(json.loads(key))
+        if labels.get("status", "").startswith("5"):
+            errors[labels["view"]] = errors.get(labels["view"], 0) + value
+
+    conditional = {}
+    for key, value in merged["counters"].get("clinicms_conditional_requests_total", {}).items():
+        labels = dict(json.loads(key))
+        outcomes = conditional.setdefault(labels["view"], {})
+        outcomes[labels["outcome"]] = outcomes.get(labels["outcome"], 0) + value
+
+    # Fold the per-method series into one per view
+    latencies = {}
+    for key, values in requests.items():
+        view = dict(json.loads(key))["view"]
+        previous = latencies.get(view)
+        latencies[view] = [a + b for a, b in zip(previous, values)] if previous else list(values)
+
+    rows = []
+    for view, latency in latencies.items():
+        view_key = _label_key({"view": view})
+        queries = histograms["clinicms_db_queries_per_request"].get(view_key)
+        db_time = histograms["clinicms_db_query_duration_seconds"].get(view_key)
+        count = latency[-1]
+        rows.append({
+            "view": view,
+            "requests": count,
+            "errors": errors.get(view, 0),
+            "avg_ms": latency[-2] / count * 1000 if count else 0,
+            "p50_ms": (quantile(latency, LATENCY_BUCKETS, 0.5) or 0) * 1000,
+            "p95_ms": (quantile(latency, LATENCY_BUCKETS, 0.95) or 0) * 1000,
+            "avg_queries": queries[-2] / queries[-1] if queries and queries[-1] else 0,
+            "avg_db_ms": db_time[-2] / db_time[-1] * 1000 if db_time and db_time[-1] else 0,
+            "not_modified_rate": _hit_rate(conditional.get(view)),
+        })
+    rows.sort(key=lambda row: row["p95_ms"], reverse=True)
+    return rows[:limit]
+
+
+# ===== Template render timing =====
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            registry.observe(
+                "clinicms_template_render_seconds",
+                time.perf_counter() - start,
+                template=self.origin.template_name or "<string>",
+            )
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend that times every top-level render"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
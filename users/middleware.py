@@ -1,13 +1,412 @@
-from django.contrib.auth import logout
+import atexit
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import alogout, logout
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.shortcuts import redirect
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from clinicms.database import REPLICA_DB_ALIAS, use_primary
+
+
+class HybridMiddleware:
+    """
+    Base for the middleware below: each runs natively in a WSGI (sync) or an
+    ASGI (async) handler chain. A sync-only middleware in an ASGI chain
+    would make Django run everything inside it, async views included,
+    through a thread adapter on every request.
+    """
+    sync_capable = True
+    async_capable = True
 
-class AutoLogoutOnHomeMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+
+@contextmanager
+def wrap_queries(hook):
+    """Install ``hook`` as an ``execute_wrapper`` on every database connection"""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(hook))
+        yield
 
+
+@asynccontextmanager
+async def awrap_queries(hook):
+    """
+    ``wrap_queries()`` for async code. The async ORM runs queries in a
+    worker thread with its own connection objects, so the hooks have to be
+    installed (and removed) from that thread.
+    """
+    stack = ExitStack()
+    await sync_to_async(stack.enter_context)(wrap_queries(hook))
+    try:
+        yield
+    finally:
+        await sync_to_async(stack.close)()
+
+
+class AutoLogoutOnHomeMiddleware(HybridMiddleware):
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         # Check if user is authenticated and visits dashboard
-        if request.user.is_authenticated and request.path == '/':
+        if request.path == '/' and request.user.is_authenticated:
             logout(request)  # destroys session immediately
             return redirect('public_dashboard')
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path == '/' and (await request.auser()).is_authenticated:
+            await alogout(request)
+            return redirect('public_dashboard')
+        return await self.get_response(request)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise that also runs natively in an ASGI chain"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Without autorefresh this is a dictionary lookup; the file itself is
+        # streamed by Django's async response handling
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+# ===== Query budgets =====
+
+query_logger = logging.getLogger('clinicms.queries')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:%s|\?|\d+)\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """SQL with literals and IN-lists collapsed, so repeated shapes compare equal"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def query_budget(max_queries=None, max_repeats=None):
+    """
+    Declare a view's query budget for QueryBudgetMiddleware::
+
+        @query_budget(12)
+        def dashboard_admin(request): ...
+
+    ``max_repeats`` caps how often one SQL shape may run (N+1 detection).
+    """
+    def decorator(view_func):
+        # Outer decorators built with functools.wraps copy the attribute along
+        view_func.query_budget = (max_queries, max_repeats)
+        return view_func
+    return decorator
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` hook counting queries by fingerprint"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def worst_repeat(self):
+        if not self.shapes:
+            return None, 0
+        return self.shapes.most_common(1)[0]
+
+
+class QueryReport:
+    """Per-view totals across requests, optionally dumped to JSON at exit"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def add(self, view_name, recorder, budget, over_budget):
+        shape, repeats = recorder.worst_repeat()
+        with self.lock:
+            entry = self.views.setdefault(view_name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'max_repeats': 0,
+                'worst_shape': None, 'budget': budget, 'over_budget': 0, 'seconds': 0.0,
+            })
+            entry['requests'] += 1
+            entry['queries'] += recorder.count
+            entry['seconds'] += recorder.duration
+            entry['max_queries'] = max(entry['max_queries'], recorder.count)
+            if repeats > entry['max_repeats']:
+                entry['max_repeats'] = repeats
+                entry['worst_shape'] = shape
+            entry['over_budget'] += int(over_budget)
+
+    def write(self, path):
+        """Merge this process's numbers into the JSON report at ``path``"""
+        with self.lock:
+            if not self.views:
+                return
+            try:
+                with open(path) as report_file:
+                    existing = json.load(report_file)
+            except (OSError, ValueError):
+                existing = {}
+            for view_name, entry in self.views.items():
+                merged = existing.get(view_name)
+                if merged is None:
+                    existing[view_name] = dict(entry)
+                    continue
+                for key in ('requests', 'queries', 'over_budget', 'seconds'):
+                    merged[key] += entry[key]
+                merged['max_queries'] = max(merged['max_queries'], entry['max_queries'])
+                if entry['max_repeats'] > merged['max_repeats']:
+                    merged['max_repeats'] = entry['max_repeats']
+                    merged['worst_shape'] = entry['worst_shape']
+                merged['budget'] = entry['budget']
+            with open(path, 'w') as report_file:
+                json.dump(existing, report_file, indent=2, sort_keys=True)
+            self.views.clear()
+
+
+query_report = QueryReport()
+
+
+class QueryBudgetMiddleware(HybridMiddleware):
+    """
+    Count every query a request runs (via ``connection.execute_wrapper``) and
+    compare it with the view's ``@query_budget`` or ``QUERY_BUDGET_DEFAULT``.
+
+    Over-budget requests and SQL shapes repeated more than
+    ``QUERY_BUDGET_MAX_REPEATS`` times are logged, or raise
+    ``QueryBudgetExceeded`` when ``QUERY_BUDGET_ACTION = 'raise'``. With
+    ``QUERY_BUDGET_REPORT`` set, per-view totals are written there as JSON
+    (see ``manage.py query_budget_report``).
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG)
+        self.default_budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', 30)
+        self.default_repeats = getattr(settings, 'QUERY_BUDGET_MAX_REPEATS', 5)
+        self.action = getattr(settings, 'QUERY_BUDGET_ACTION', 'log')
+        self.report_path = getattr(settings, 'QUERY_BUDGET_REPORT', '')
+        if self.enabled and self.report_path:
+            atexit.register(query_report.write, self.report_path)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        if self.async_mode:
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        with wrap_queries(recorder):
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        async with awrap_queries(recorder):
+            response = await self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    def check(self, request, recorder):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return
+        view_func = match.func
+        view_name = getattr(view_func, '__module__', '') + '.' + getattr(
+            view_func, '__qualname__', getattr(view_func, '__name__', repr(view_func))
+        )
+        max_queries, max_repeats = getattr(view_func, 'query_budget', (None, None))
+        max_queries = max_queries if max_queries is not None else self.default_budget
+        max_repeats = max_repeats if max_repeats is not None else self.default_repeats
+        shape, repeats = recorder.worst_repeat()
+
+        problems = []
+        if recorder.count > max_queries:
+            problems.append(f'{recorder.count} queries (budget {max_queries})')
+        if repeats > max_repeats:
+            problems.append(f'same SQL run {repeats} times (possible N+1): {shape[:200]}')
+        query_report.add(view_name, recorder, max_queries, bool(problems))
+        if not problems:
+            return
+
+        message = f'{request.method} {request.path} [{view_name}]: ' + '; '.join(problems)
+        if self.action == 'raise':
+            raise QueryBudgetExceeded(message)
+        query_logger.warning(message)
+
+
+# ===== Metrics =====
+
+class QueryTimer:
+    """Lightweight ``execute_wrapper`` hook: query count and total time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Record per-URL-name latency, status, database queries/time and response
+    size into ``users.metrics.registry`` (exposed on ``/metrics``).
+    """
+
+    def __init__(self, get_response):
+        from . import metrics
+
+        super().__init__(get_response)
+        self.metrics = metrics
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with wrap_queries(timer):
+            response = self.get_response(request)
+        self.record(request, response, timer, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        async with awrap_queries(timer):
+            response = await self.get_response(request)
+        self.record(request, response, timer, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, timer, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+        registry = self.metrics.registry
+        registry.observe('clinicms_request_duration_seconds', duration, view=view, method=request.method)
+        registry.inc('clinicms_requests_total', view=view, method=request.method, status=str(response.status_code))
+        registry.observe('clinicms_db_queries_per_request', timer.count, view=view)
+        registry.observe('clinicms_db_query_duration_seconds', timer.duration, view=view)
+        if not response.streaming:
+            registry.observe('clinicms_response_size_bytes', len(response.content), view=view)
+        registry.flush()
+
+    def process_exception(self, request, exception):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+        registry = self.metrics.registry
+        registry.inc('clinicms_exceptions_total', view=view, exception=type(exception).__name__)
+        registry.record_error(f'{type(exception).__name__} in {request.method} {request.path}: {exception}'[:500])
+
+
+# ===== Read replica pinning =====
+
+REPLICA_PIN_COOKIE = 'pin_primary'
+
+
+class ReplicaPinningMiddleware(HybridMiddleware):
+    """
+    Keep a browser's reads on the primary while its writes may not have
+    reached the replica yet: the whole of a non-GET request, and any request
+    within REPLICA_PIN_SECONDS after one (tracked with a short-lived cookie).
+    Not loaded when no replica is configured.
+    """
+
+    def __init__(self, get_response):
+        if REPLICA_DB_ALIAS not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    @staticmethod
+    def _writes(request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def _pinned(self, request):
+        return self._writes(request) or REPLICA_PIN_COOKIE in request.COOKIES
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._pinned(request):
+            return self.get_response(request)
+        with use_primary():
+            response = self.get_response(request)
+        return self.set_pin(request, response)
+
+    async def __acall__(self, request):
+        if not self._pinned(request):
+            return await self.get_response(request)
+        # The context variable is copied into the threads running the ORM
+        with use_primary():
+            response = await self.get_response(request)
+        return self.set_pin(request, response)
+
+    def set_pin(self, request, response):
+        if self._writes(request) and settings.REPLICA_PIN_SECONDS:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
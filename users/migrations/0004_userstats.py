@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_specialization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_appointments', models.PositiveIntegerField(default=0)),
+                ('pending_appointments', models.PositiveIntegerField(default=0)),
+                ('completed_appointments', models.PositiveIntegerField(default=0)),
+                ('cancelled_appointments', models.PositiveIntegerField(default=0)),
+                ('distinct_patients', models.PositiveIntegerField(default=0)),
+                ('distinct_doctors', models.PositiveIntegerField(default=0)),
+                ('prescriptions', models.PositiveIntegerField(default=0)),
+                ('active_prescriptions', models.PositiveIntegerField(default=0)),
+                ('last_visit', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_missed(apps, schema_editor):
+    """Fill the new counter for rows built before it existed"""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    UserStats = apps.get_model('users', 'UserStats')
+    missed = Appointment.objects.filter(status='missed')
+    totals = {}
+    for side in ('doctor_id', 'patient_id'):
+        for row in missed.values(side).annotate(total=Count('id')).order_by():
+            totals[row[side]] = totals.get(row[side], 0) + row['total']
+    for user_id, total in totals.items():
+        UserStats.objects.filter(pk=user_id).update(missed_appointments=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_jobcheckpoint'),
+        ('appointments', '0012_appointmentreminder_alter_appointment_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='missed_appointments',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_missed, migrations.RunPython.noop),
+    ]
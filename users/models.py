@@ -16,3 +16,63 @@ class User(AbstractUser):
 
     def __str__(self):
         return f"{self.username} ({self.role})"
+
+
+class UserStats(models.Model):
+    """
+    Denormalized per-user counters for the dashboards.
+
+    Kept current with ``F()`` increments by ``users.signals``; rows are built
+    from the source tables on first read and ``manage.py reconcile_user_stats``
+    repairs any drift.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    total_appointments = models.PositiveIntegerField(default=0)
+    pending_appointments = models.PositiveIntegerField(default=0)
+    completed_appointments = models.PositiveIntegerField(default=0)
+    cancelled_appointments = models.PositiveIntegerField(default=0)
+    missed_appointments = models.PositiveIntegerField(default=0)
+    distinct_patients = models.PositiveIntegerField(default=0)  # As doctor
+    distinct_doctors = models.PositiveIntegerField(default=0)  # As patient
+    prescriptions = models.PositiveIntegerField(default=0)
+    active_prescriptions = models.PositiveIntegerField(default=0)
+    last_visit = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    COUNTER_FIELDS = (
+        "total_appointments",
+        "pending_appointments",
+        "completed_appointments",
+        "cancelled_appointments",
+        "missed_appointments",
+        "distinct_patients",
+        "distinct_doctors",
+        "prescriptions",
+        "active_prescriptions",
+    )
+
+    class Meta:
+        verbose_name_plural = "user stats"
+
+    def __str__(self):
+        return f"Stats for user #{self.user_id}"
+
+
+class JobCheckpoint(models.Model):
+    """
+    Progress and lease of a periodic job (``users.jobs``, ``manage.py run_jobs``).
+
+    ``cursor`` is where the job resumes when a run stops before finishing a
+    pass; ``locked_until`` keeps two workers from running the job at once.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    cursor = models.JSONField(default=dict, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    runs = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Job {self.name}"
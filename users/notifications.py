@@ -0,0 +1,334 @@
+"""
+Patient notifications pushed over Server-Sent Events.
+
+A patient's notifications ("appointments in the next 24 hours", "overdue
+appointments") are a function of their pending appointment times and the
+clock. Those times are cached as a sorted tuple of timestamps, built from
+one query on a miss. The appointment signal handlers in ``users.signals``
+delete the entry once a change commits and never edit it in place, so the
+next read rebuilds it from the database. Deletes reach only the writing
+process with a per-process cache, and a read racing a commit can cache the
+old times, so entries also expire after ``NOTIFICATIONS_STATE_TTL``
+seconds, which is short unless the cache is shared.
+
+After each change the handlers publish the patient's id on the broker.
+Each open stream wakes up, re-reads the cached times and sends an event
+only when the counts changed. Appointments enter the 24-hour window (or
+become overdue) as time passes, with no write to publish, so each stream
+also sleeps no longer than the next such boundary.
+
+Brokers (``NOTIFICATIONS_BROKER``):
+
+* ``memory`` - wake-ups reach streams in the same process only
+* ``cache`` - also bumps a per-patient counter in the shared cache, which
+  streams check every ``NOTIFICATIONS_CACHE_POLL`` seconds; with
+  ``CACHE_BACKEND=file`` this reaches every worker on the host
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from appointments.models import Appointment
+
+CACHE_PREFIX = "notifications"
+
+UPCOMING_WINDOW = timedelta(hours=24)
+
+# Seconds between keep-alive comments on an idle stream (proxies drop
+# connections that stay silent for about a minute)
+HEARTBEAT_SECONDS = 25
+
+
+def _ttl():
+    return getattr(settings, "NOTIFICATIONS_STATE_TTL", 30)
+
+
+def _cache_key(patient_id):
+    return f"{CACHE_PREFIX}:{patient_id}"
+
+
+# ===== Pending appointment times =====
+
+def build_pending_times(patient_id):
+    """Timestamps of the patient's pending appointments, from the database"""
+    times = Appointment.objects.filter(
+        patient_id=patient_id, status="pending"
+    ).values_list("appointment_datetime", flat=True)
+    return tuple(sorted(when.timestamp() for when in times if when))
+
+
+def get_pending_times(patient_id):
+    """Cached pending times for a patient, built on a miss"""
+    key = _cache_key(patient_id)
+    times = cache.get(key)
+    if times is None:
+        times = build_pending_times(patient_id)
+        cache.set(key, times, _ttl())
+    return times
+
+
+async def aget_pending_times(patient_id):
+    times = await cache.aget(_cache_key(patient_id))
+    if times is None:
+        times = await sync_to_async(get_pending_times)(patient_id)
+    return times
+
+
+def summarize(times, now=None):
+    """(upcoming, overdue) counts at ``now``"""
+    now = (now or timezone.now()).timestamp()
+    window_end = now + UPCOMING_WINDOW.total_seconds()
+    upcoming = sum(1 for when in times if now <= when <= window_end)
+    overdue = sum(1 for when in times if when < now)
+    return upcoming, overdue
+
+
+def seconds_until_change(times, now=None):
+    """Seconds until an appointment enters the 24-hour window or becomes overdue"""
+    now = (now or timezone.now()).timestamp()
+    window = UPCOMING_WINDOW.total_seconds()
+    boundaries = [
+        boundary
+        for when in times
+        for boundary in (when - window, when)
+        if boundary > now
+    ]
+    return min(boundaries) - now if boundaries else None
+
+
+def payload(upcoming, overdue):
+    """The patient_notifications JSON body"""
+    notifications = []
+    if upcoming > 0:
+        notifications.append({
+            'type': 'info',
+            'message': f'You have {upcoming} appointment{"s" if upcoming > 1 else ""} in the next 24 hours.',
+            'icon': 'fa-bell'
+        })
+    if overdue > 0:
+        notifications.append({
+            'type': 'warning',
+            'message': f'You have {overdue} overdue appointment{"s" if overdue > 1 else ""}.',
+            'icon': 'fa-exclamation-triangle'
+        })
+    return {
+        'notifications': notifications,
+        'count': len(notifications),
+        'upcoming': upcoming,
+        'overdue': overdue,
+    }
+
+
+# ===== Brokers =====
+
+class Subscription:
+    """One open stream, woken from whichever thread publishes"""
+
+    def __init__(self, patient_id):
+        self.patient_id = patient_id
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+        self.sequence = None
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # The stream's event loop has already shut down
+            pass
+
+    async def wait(self, timeout):
+        """True when woken by a publish, False when ``timeout`` ran out"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.event.clear()
+
+
+class MemoryBroker:
+    """In-process pub/sub keyed by patient id"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, patient_id):
+        subscription = Subscription(patient_id)
+        with self._lock:
+            self._subscribers[patient_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.patient_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.patient_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, patient_id):
+        with self._lock:
+            subscribers = list(self._subscribers.get(patient_id, ()))
+        for subscription in subscribers:
+            subscription.notify()
+
+    async def wait(self, subscription, timeout):
+        return await subscription.wait(timeout)
+
+
+class CacheBroker(MemoryBroker):
+    """
+    Local broker stand-in: publishes also bump a counter in the shared
+    cache, which streams in other processes notice on their next check.
+    """
+
+    @staticmethod
+    def _sequence_key(patient_id):
+        return f"{CACHE_PREFIX}:sequence:{patient_id}"
+
+    def publish(self, patient_id):
+        key = self._sequence_key(patient_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+        super().publish(patient_id)
+
+    async def wait(self, subscription, timeout):
+        key = self._sequence_key(subscription.patient_id)
+        if subscription.sequence is None:
+            subscription.sequence = await cache.aget(key, 0)
+        poll = getattr(settings, "NOTIFICATIONS_CACHE_POLL", 2.0)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if await subscription.wait(min(poll, remaining)):
+                subscription.sequence = await cache.aget(key, 0)
+                return True
+            sequence = await cache.aget(key, 0)
+            if sequence != subscription.sequence:
+                subscription.sequence = sequence
+                return True
+
+
+BROKERS = {
+    "memory": MemoryBroker,
+    "cache": CacheBroker,
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = BROKERS[getattr(settings, "NOTIFICATIONS_BROKER", "memory")]()
+        return _broker
+
+
+# ===== Streams =====
+
+def format_event(data, event="notifications"):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(patient_id, max_seconds=None):
+    """
+    SSE body for one patient: the current notifications, then an event
+    whenever the counts change. Ends after ``NOTIFICATIONS_STREAM_SECONDS``
+    so connections are recycled; the browser reconnects on its own.
+    """
+    broker = get_broker()
+    subscription = broker.subscribe(patient_id)
+    max_seconds = max_seconds or getattr(settings, "NOTIFICATIONS_STREAM_SECONDS", 300)
+    deadline = time.monotonic() + max_seconds
+    last = None
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            times = await aget_pending_times(patient_id)
+            now = timezone.now()
+            counts = summarize(times, now)
+            if counts != last:
+                last = counts
+                yield format_event(payload(*counts))
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # A boundary wake-up lands just after the appointment crosses it
+            boundary = seconds_until_change(times, now)
+            timeout = min(HEARTBEAT_SECONDS, remaining, boundary + 0.5 if boundary is not None else remaining)
+            woken = await broker.wait(subscription, timeout)
+            if not woken and timeout == HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+# ===== Incremental maintenance =====
+
+def _pending(values):
+    if values and values.get("status") == "pending" and values.get("appointment_datetime"):
+        return values["patient_id"], values["appointment_datetime"].timestamp()
+    return None
+
+
+def _invalidate(patient_ids):
+    """Drop the patients' cached times and wake their streams"""
+    cache.delete_many([_cache_key(patient_id) for patient_id in patient_ids])
+    broker = get_broker()
+    for patient_id in patient_ids:
+        broker.publish(patient_id)
+
+
+def appointment_changed(appointment, previous=None, created=False):
+    """
+    Invalidate the affected patients once the transaction commits.
+    ``previous`` holds the loaded field values (``Appointment._loaded_values``).
+    """
+    fields = ("patient_id", "status", "appointment_datetime")
+    new = _pending({name: getattr(appointment, name) for name in fields})
+    if created:
+        old = None
+    elif previous is None:
+        # Prior state unknown: the appointment may have left the pending set
+        patient_id = appointment.patient_id
+        transaction.on_commit(lambda: _invalidate({patient_id}))
+        return
+    else:
+        old = _pending({name: previous.get(name, getattr(appointment, name)) for name in fields})
+    if old == new:
+        return
+    patient_ids = {entry[0] for entry in (old, new) if entry}
+    transaction.on_commit(lambda: _invalidate(patient_ids))
+
+
+def appointment_deleted(appointment):
+    old = _pending({
+        "patient_id": appointment.patient_id,
+        "status": appointment.status,
+        "appointment_datetime": appointment.appointment_datetime,
+    })
+    if old:
+        transaction.on_commit(lambda: _invalidate({old[0]}))
@@ -0,0 +1,252 @@
+"""
+Keyset (cursor) pagination for the list views.
+
+``Paginator`` runs a full ``COUNT(*)`` and an ``OFFSET n`` scan, both of
+which slow down on deep pages of large tables. ``paginate()`` seeks instead:
+the page boundary is encoded as an opaque cursor holding the ordering values
+of the last (or first) row shown, and the next page is fetched with
+``WHERE (col, id) < (value, last_id) ORDER BY col, id LIMIT n + 1``, which
+an index on the ordering columns answers without scanning skipped rows.
+
+Counts are optional: ``count="exact"`` runs one COUNT, ``count="estimate"``
+uses planner statistics on PostgreSQL for unfiltered tables and otherwise
+counts at most ``ESTIMATE_CAP`` rows, and ``count=None`` skips it.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+CURSOR_PARAM = "cursor"
+
+# "estimate" mode never counts more rows than this
+ESTIMATE_CAP = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return ["dt", value.isoformat()]
+    if isinstance(value, date):
+        return ["d", value.isoformat()]
+    return ["v", value]
+
+
+def _decode_value(encoded):
+    kind, value = encoded
+    if kind == "dt":
+        return parse_datetime(value)
+    if kind == "d":
+        return parse_date(value)
+    return value
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, [_encode_value(value) for value in values]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, field_count):
+    """(direction, values) for a cursor string; raises InvalidCursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, encoded = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = [_decode_value(item) for item in encoded]
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if direction not in ("next", "prev") or len(values) != field_count or None in values:
+        raise InvalidCursor(cursor)
+    return direction, values
+
+
+def ordering_for(queryset):
+    """
+    [(field, descending), ...] from the queryset's ordering (its
+    ``order_by()`` or else the model's ``Meta.ordering``), with the primary
+    key appended as a tie-breaker in the direction of the first column.
+    Unordered querysets page by newest primary key first.
+
+    Raises ValueError for orderings keyset pagination cannot seek on:
+    expressions, random order, relations and lookups across them.
+    """
+    query = queryset.query
+    opts = query.get_meta()
+    pk_name = opts.pk.attname
+    items = query.order_by or (query.default_ordering and opts.ordering) or [f"-{pk_name}"]
+    ordering = []
+    for item in items:
+        if not isinstance(item, str) or item == "?" or "__" in item:
+            raise ValueError(f"Keyset pagination needs plain field orderings, got {item!r}")
+        descending = item.startswith("-")
+        name = item.lstrip("-")
+        if name in query.annotations:
+            ordering.append((name, descending))
+            continue
+        field = opts.pk if name == "pk" else opts.get_field(name)
+        if not field.concrete or (field.is_relation and name != field.attname):
+            # Ordering by a relation sorts by the related model's ordering
+            raise ValueError(f"Keyset pagination cannot order by the relation {name!r}; use its id column")
+        ordering.append((field.attname, descending))
+    if not any(field == pk_name for field, _descending in ordering):
+        ordering.append((pk_name, ordering[0][1]))
+    return ordering
+
+
+def _seek_filter(ordering, values, forward):
+    """Q selecting rows strictly after ``values`` (before, when not forward)"""
+    condition = Q()
+    for position, (field, descending) in enumerate(ordering):
+        lookup = "lt" if descending == forward else "gt"
+        term = Q(**{f"{field}__{lookup}": values[position]})
+        for prior in range(position):
+            term &= Q(**{ordering[prior][0]: values[prior]})
+        condition |= term
+    return condition
+
+
+def _row_values(obj, ordering):
+    return [getattr(obj, field) for field, _descending in ordering]
+
+
+def estimated_count(queryset, cap=ESTIMATE_CAP):
+    """(count, is_estimate) without scanning more than ``cap`` rows"""
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql" and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] > cap:
+            return row[0], True
+    count = queryset.order_by()[:cap + 1].count()
+    if count > cap:
+        return cap, True
+    return count, False
+
+
+class CursorPage:
+    """
+    One page of results. Iterates like a ``Page`` and exposes
+    ``has_next``/``has_previous`` plus ready-made ``next_url``/``previous_url``
+    query strings that keep the request's other GET parameters.
+    """
+
+    def __init__(self, object_list, ordering, has_next, has_previous, query=None, count=None, count_is_estimate=False):
+        self.object_list = object_list
+        self.ordering = ordering
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.query = query
+        self.count = count
+        self.count_is_estimate = count_is_estimate
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self)} items>"
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return encode_cursor("next", _row_values(self.object_list[-1], self.ordering))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous:
+            return None
+        return encode_cursor("prev", _row_values(self.object_list[0], self.ordering))
+
+    def _url(self, cursor):
+        if cursor is None:
+            return None
+        query = self.query.copy() if self.query is not None else None
+        if query is None:
+            return f"?{CURSOR_PARAM}={cursor}"
+        query.pop("page", None)
+        query[CURSOR_PARAM] = cursor
+        return f"?{query.urlencode()}"
+
+    @property
+    def next_url(self):
+        return self._url(self.next_cursor)
+
+    @property
+    def previous_url(self):
+        return self._url(self.previous_cursor)
+
+    @property
+    def count_display(self):
+        """Total for templates, e.g. ``42`` or ``1000+``"""
+        if self.count is None:
+            return ""
+        return f"{self.count}+" if self.count_is_estimate else str(self.count)
+
+
+def paginate(request, queryset, per_page, count="exact"):
+    """
+    Drop-in replacement for ``Paginator(queryset, n).get_page(...)`` that
+    pages by the queryset's ordering (plus the primary key) using the
+    ``?cursor=`` param.
+
+    An invalid or stale cursor falls back to the first page.
+    """
+    ordering = ordering_for(queryset)
+    ordered = queryset.order_by(*[f"-{field}" if desc else field for field, desc in ordering])
+
+    direction, values = "next", None
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor:
+        try:
+            direction, values = decode_cursor(cursor, len(ordering))
+        except InvalidCursor:
+            direction, values = "next", None
+
+    forward = direction == "next"
+    page_qs = ordered if forward else ordered.reverse()
+    if values is not None:
+        page_qs = page_qs.filter(_seek_filter(ordering, values, forward))
+    rows = list(page_qs[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if forward:
+        has_next, has_previous = has_more, values is not None
+    else:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+
+    total, is_estimate = None, False
+    if count == "exact":
+        total = queryset.count()
+    elif count == "estimate":
+        total, is_estimate = estimated_count(queryset)
+
+    return CursorPage(
+        rows,
+        ordering,
+        has_next=has_next,
+        has_previous=has_previous,
+        query=request.GET,
+        count=total,
+        count_is_estimate=is_estimate,
+    )
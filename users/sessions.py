@@ -0,0 +1,91 @@
+"""
+Session engine that skips writes which would not change anything.
+
+With ``SESSION_SAVE_EVERY_REQUEST`` (the sliding 10-minute expiry) Django
+saves the session after every request, which on the database backend is an
+UPDATE of ``django_session`` per page view. This engine keeps the
+``cached_db`` layout (reads come from the cache, the database row is the
+durable copy) but only writes when the session data changed or the expiry
+moved more than ``SESSION_WRITE_THRESHOLD`` seconds since the last write.
+The cookie is still refreshed on every response, so the browser-side
+expiry slides as before; the server-side expiry trails it by at most the
+threshold.
+
+Use a cache shared by all workers (``CACHE_BACKEND=file`` or a cache
+server) when running more than one worker process: with per-process local
+memory, a worker can keep serving a session another worker changed or
+logged out until its cached copy expires.
+"""
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+logger = logging.getLogger("django.contrib.sessions")
+
+
+class SessionStore(CachedDBStore):
+    # Cache entries are (data, expiry timestamp) pairs, unlike cached_db's
+    cache_key_prefix = "clinicms.sessions."
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._persisted_data = None
+        self._persisted_expiry = None
+
+    def _serialize(self, data):
+        return self.serializer().dumps(data)
+
+    def _remember(self, data, expiry):
+        self._persisted_data = self._serialize(data)
+        self._persisted_expiry = expiry
+
+    def load(self):
+        try:
+            entry = self._cache.get(self.cache_key)
+        except Exception:
+            # Some backends raise on invalid keys; treat it as a miss
+            entry = None
+
+        if entry is not None:
+            data, expiry = entry
+        else:
+            session = self._get_session_from_db()
+            if session is None:
+                return {}
+            data, expiry = self.decode(session.session_data), session.expire_date
+            self._cache.set(self.cache_key, (data, expiry), self.get_expiry_age(expiry=expiry))
+        self._remember(data, expiry)
+        return data
+
+    def _unchanged(self):
+        # Loads the session (from the cache) if this request never touched it
+        data = self._get_session()
+        if self._persisted_data is None:
+            return False
+        threshold = timedelta(seconds=getattr(settings, "SESSION_WRITE_THRESHOLD", 60))
+        return (
+            self._serialize(data) == self._persisted_data
+            and self.get_expiry_date() - self._persisted_expiry < threshold
+        )
+
+    def save(self, must_create=False):
+        if not must_create and self.session_key is not None and self._unchanged():
+            return
+        # The database write from DBStore; cached_db's own cache write is replaced below
+        super(CachedDBStore, self).save(must_create)
+        data = self._get_session(no_load=must_create)
+        expiry = self.get_expiry_date()
+        try:
+            self._cache.set(self.cache_key, (data, expiry), self.get_expiry_age())
+        except Exception:
+            logger.exception("Error saving to cache (%s)", self._cache)
+        self._remember(data, expiry)
+
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
@@ -0,0 +1,57 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from . import counters, fragments, notifications
+from .models import User
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, "_loaded_values", None)
+    notifications.appointment_changed(instance, previous, created=created)
+    fragments.appointment_changed(instance, previous)
+    if not created and previous is None:
+        # Unknown prior state; reconcile_user_stats repairs these rows
+        return
+    counters.appointment_changed(instance, previous)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_removed(sender, instance, **kwargs):
+    counters.appointment_deleted(instance)
+    notifications.appointment_deleted(instance)
+    fragments.appointment_changed(instance)
+
+
+@receiver(post_save, sender=Prescription)
+def prescription_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, "_loaded_values", None)
+    fragments.prescription_changed(instance, previous)
+    if not created and previous is None:
+        return
+    counters.prescription_changed(instance, previous)
+
+
+@receiver(post_delete, sender=Prescription)
+def prescription_removed(sender, instance, **kwargs):
+    counters.prescription_deleted(instance)
+    fragments.prescription_changed(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and set(update_fields) <= {"last_login"}):
+        return
+    # Admin dashboard user counts
+    fragments.bump(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_removed(sender, instance, **kwargs):
+    fragments.bump(instance.pk)
@@ -0,0 +1,130 @@
+"""
+Clinic-wide counters shared by the admin dashboard, analytics and system
+health pages.
+
+Every counter is declared as a ``Metric`` and evaluated with conditional
+aggregation (``Count(filter=Q(...))``), so a full snapshot costs one query
+per table instead of one COUNT per number.
+"""
+from dataclasses import dataclass, fields
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from .models import User
+
+
+@dataclass(frozen=True)
+class Metric:
+    name: str
+    filter: Q = None
+    distinct: str = None
+
+    def aggregate(self):
+        return Count(self.distinct or "id", distinct=bool(self.distinct), filter=self.filter)
+
+    def count(self, queryset):
+        """Stand-alone COUNT for the same metric (used by the benchmark)"""
+        if self.filter is not None:
+            queryset = queryset.filter(self.filter)
+        if self.distinct:
+            return queryset.values(self.distinct).distinct().count()
+        return queryset.count()
+
+
+def metric_specs(now):
+    """{model: [Metric, ...]} for every counter in ClinicStats"""
+    today = now.date()
+    thirty_days_ago = now - timedelta(days=30)
+    sixty_days_ago = now - timedelta(days=60)
+    return {
+        User: [
+            Metric("total_users"),
+            Metric("total_doctors", Q(role="doctor")),
+            Metric("total_patients", Q(role="patient")),
+            Metric("total_admins", Q(role="admin")),
+            Metric("new_users_this_month", Q(date_joined__gte=thirty_days_ago)),
+            Metric("new_patients_this_month", Q(role="patient", date_joined__gte=thirty_days_ago)),
+            Metric("new_doctors_this_month", Q(role="doctor", date_joined__gte=thirty_days_ago)),
+            Metric("previous_month_users", Q(date_joined__gte=sixty_days_ago, date_joined__lt=thirty_days_ago)),
+            Metric("registrations_today", Q(date_joined__date=today)),
+        ],
+        Appointment: [
+            Metric("total_appointments"),
+            Metric("completed_appointments", Q(status="completed")),
+            Metric("pending_appointments", Q(status="pending")),
+            Metric("cancelled_appointments", Q(status="cancelled")),
+            Metric("today_appointments", Q(appointment_datetime__date=today)),
+            Metric("overdue_appointments", Q(status="pending", appointment_datetime__lt=now)),
+            Metric("active_patients", Q(appointment_datetime__gte=thirty_days_ago), distinct="patient"),
+            Metric("active_doctors", Q(appointment_datetime__gte=thirty_days_ago), distinct="doctor"),
+        ],
+        Prescription: [
+            Metric("total_prescriptions"),
+            Metric("monthly_prescriptions", Q(date_issued__gte=thirty_days_ago)),
+            Metric("prescriptions_today", Q(date_issued__date=today)),
+        ],
+    }
+
+
+@dataclass(frozen=True)
+class ClinicStats:
+    """Point-in-time snapshot of clinic-wide counters"""
+    # Users
+    total_users: int
+    total_doctors: int
+    total_patients: int
+    total_admins: int
+    new_users_this_month: int
+    new_patients_this_month: int
+    new_doctors_this_month: int
+    previous_month_users: int
+    registrations_today: int
+    # Appointments
+    total_appointments: int
+    completed_appointments: int
+    pending_appointments: int
+    cancelled_appointments: int
+    today_appointments: int
+    overdue_appointments: int
+    active_patients: int
+    active_doctors: int
+    # Prescriptions
+    total_prescriptions: int
+    monthly_prescriptions: int
+    prescriptions_today: int
+
+    @property
+    def total_records(self):
+        return self.total_users + self.total_appointments + self.total_prescriptions
+
+    @property
+    def inactive_doctors(self):
+        """Doctors with no appointments in the last 30 days"""
+        return max(self.total_doctors - self.active_doctors, 0)
+
+    def completion_rate(self, digits=1):
+        if not self.total_appointments:
+            return 0
+        return round(self.completed_appointments / self.total_appointments * 100, digits)
+
+    @property
+    def user_growth_rate(self):
+        if not self.previous_month_users:
+            return 0
+        return round(
+            (self.new_users_this_month - self.previous_month_users) / self.previous_month_users * 100,
+            2
+        )
+
+
+def get_clinic_stats(now=None):
+    """Compute a ClinicStats snapshot with one aggregate query per table"""
+    now = now or timezone.now()
+    values = {}
+    for model, metrics in metric_specs(now).items():
+        values.update(model.objects.aggregate(**{metric.name: metric.aggregate() for metric in metrics}))
+    return ClinicStats(**{field.name: values[field.name] or 0 for field in fields(ClinicStats)})
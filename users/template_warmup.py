@@ -0,0 +1,115 @@
+"""
+Template precompilation.
+
+With the cached loader (``TEMPLATE_CACHE``), each worker process parses a
+template the first time it renders it and keeps the compiled tree. ``warm()``
+compiles every template of the project apps up front, so the first requests
+after a deploy do not pay for parsing. It also surfaces syntax errors before
+any page is served. ``clinicms.wsgi``/``clinicms.asgi`` call
+``warm_on_startup()`` (``TEMPLATE_WARMUP``), which compiles once in the
+gunicorn master with ``--preload``, or once per worker without it.
+``manage.py warm_templates`` runs the same pass, with render timings, as a
+release check.
+"""
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest
+from django.template import RequestContext, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+
+WARM_APPS = ("users", "appointments", "prescriptions")
+
+TEMPLATE_SUFFIXES = (".html", ".txt")
+
+
+@dataclass
+class TemplateTiming:
+    name: str
+    compile_seconds: float = 0.0
+    render_seconds: float = None
+    error: str = None
+    render_error: str = None
+
+
+def template_names(app_labels=WARM_APPS):
+    """Names (as passed to get_template) of every template in ``app_labels``"""
+    names = []
+    for label in app_labels:
+        root = Path(apps.get_app_config(label).path) / "templates"
+        if not root.is_dir():
+            continue
+        for path in sorted(root.rglob("*")):
+            name = path.relative_to(root).as_posix()
+            if path.is_file() and path.suffix in TEMPLATE_SUFFIXES and name not in names:
+                names.append(name)
+    return names
+
+
+def _django_engine():
+    # The backend alias follows its module name (see TEMPLATES), so look
+    # it up by type
+    for backend in engines.all():
+        if isinstance(backend, DjangoTemplates):
+            return backend.engine
+    raise ImproperlyConfigured("No DjangoTemplates backend in TEMPLATES")
+
+
+def _warmup_request():
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = "/"
+    request.META.update({"SERVER_NAME": "localhost", "SERVER_PORT": "80"})
+    request.user = AnonymousUser()
+    return request
+
+
+def warm(names=None, render=False):
+    """
+    Compile (and optionally render with an empty context) each template,
+    leaving it in the cached loader. Returns one ``TemplateTiming`` per name.
+    Render errors are expected for templates that need view context; they
+    are reported, not raised.
+    """
+    engine = _django_engine()
+    request = _warmup_request() if render else None
+    timings = []
+    for name in names if names is not None else template_names():
+        timing = TemplateTiming(name)
+        timings.append(timing)
+        start = time.perf_counter()
+        try:
+            template = engine.get_template(name)
+        except TemplateSyntaxError as exc:
+            timing.error = str(exc)
+            continue
+        finally:
+            timing.compile_seconds = time.perf_counter() - start
+        if not render:
+            continue
+        start = time.perf_counter()
+        try:
+            template.render(RequestContext(request, {}))
+        except Exception as exc:
+            timing.render_error = f"{type(exc).__name__}: {exc}"
+        finally:
+            timing.render_seconds = time.perf_counter() - start
+    return timings
+
+
+def warm_on_startup():
+    """Precompile the templates; a syntax error stops the process from serving"""
+    if not getattr(settings, "TEMPLATE_WARMUP", False):
+        return []
+    timings = warm()
+    broken = [timing for timing in timings if timing.error]
+    if broken:
+        raise ImproperlyConfigured(
+            "Template syntax errors: " + "; ".join(f"{timing.name}: {timing.error}" for timing in broken)
+        )
+    return timings
@@ -1,3 +1,553 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, reverse
+from django.utils import timezone
+
+from appointments.models import Appointment
+from prescriptions.models import Prescription
+from . import conditional, counters, fragments, jobs, metrics, notifications, template_warmup
+from .stats import get_clinic_stats, metric_specs
+from .middleware import (
+    QueryBudgetExceeded, QueryBudgetMiddleware, QueryRecorder, QueryReport, fingerprint, query_budget, query_report,
+)
+from .models import JobCheckpoint, User, UserStats
+from .pagination import decode_cursor, ordering_for, paginate
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        doctors = [User.objects.create(username=f"doc{i}", role="doctor") for i in range(2)]
+        patient = User.objects.create(username="pat", role="patient")
+        base = timezone.now() + timedelta(days=2)
+        # Two appointments share each time, so the id tie-breaker decides their order
+        for hours in range(4):
+            for doctor in doctors:
+                Appointment.objects.create(
+                    patient=patient, doctor=doctor, appointment_datetime=base + timedelta(hours=hours)
+                )
+        self.expected = list(
+            Appointment.objects.order_by("-appointment_datetime", "-id").values_list("id", flat=True)
+        )
+
+    def page(self, url="", per_page=3):
+        return paginate(self.factory.get(f"/appointments/{url}"), Appointment.objects.all(), per_page)
+
+    def test_ordering_defaults_to_meta_ordering(self):
+        self.assertEqual(
+            ordering_for(Appointment.objects.all()),
+            [("appointment_datetime", True), ("id", True)],
+        )
+
+    def test_ordering_maps_pk_and_keeps_explicit_order(self):
+        self.assertEqual(ordering_for(User.objects.order_by("username", "pk")), [("username", False), ("id", False)])
+
+    def test_ordering_by_relation_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ordering_for(Appointment.objects.order_by("doctor"))
+
+    def test_walks_forward_and_back_without_gaps(self):
+        pages, page = [], self.page()
+        while True:
+            pages.append([appointment.id for appointment in page])
+            if not page.has_next:
+                break
+            page = self.page(page.next_url)
+        self.assertEqual([pk for ids in pages for pk in ids], self.expected)
+        self.assertFalse(self.page().has_previous)
+
+        back = self.page(page.previous_url)
+        self.assertEqual([appointment.id for appointment in back], pages[-2])
+        self.assertTrue(back.has_next)
+
+    def test_cursor_holds_the_ordering_values(self):
+        page = self.page()
+        direction, values = decode_cursor(page.next_cursor, 2)
+        last = page[len(page) - 1]
+        self.assertEqual((direction, values), ("next", [last.appointment_datetime, last.id]))
+
+    def test_invalid_cursor_falls_back_to_the_first_page(self):
+        page = self.page("?cursor=not-a-cursor")
+        self.assertEqual([appointment.id for appointment in page], self.expected[:3])
+        self.assertFalse(page.has_previous)
+
+
+class UserStatsCounterTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+        for user in (self.doctor, self.patient):
+            counters.get_user_stats(user)
+        self.when = timezone.now() + timedelta(days=2)
+
+    def assertCountersMatchSource(self):
+        expected = counters.collect_stats([self.doctor.pk, self.patient.pk])
+        for user_id, values in expected.items():
+            row = UserStats.objects.get(pk=user_id)
+            self.assertEqual({name: getattr(row, name) for name in values}, values)
+        self.assertEqual(counters.reconcile(dry_run=True), (2, 0))
+
+    def test_status_changes_move_counts(self):
+        appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+        self.assertEqual(UserStats.objects.get(pk=self.doctor.pk).pending_appointments, 1)
+        appointment.status = "missed"
+        appointment.save()
+        stats = UserStats.objects.get(pk=self.patient.pk)
+        self.assertEqual((stats.pending_appointments, stats.missed_appointments), (0, 1))
+        self.assertCountersMatchSource()
+        appointment.status = "completed"
+        appointment.save()
+        self.assertEqual(UserStats.objects.get(pk=self.doctor.pk).last_visit, self.when)
+        self.assertCountersMatchSource()
+
+    def test_deletes_and_prescriptions(self):
+        first = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+        second = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, appointment_datetime=self.when + timedelta(hours=1)
+        )
+        prescription = Prescription.objects.create(
+            appointment=first, doctor=self.doctor, patient=self.patient, instructions="rest"
+        )
+        self.assertEqual(UserStats.objects.get(pk=self.doctor.pk).distinct_patients, 1)
+        prescription.is_active = False
+        prescription.save()
+        self.assertCountersMatchSource()
+        second.delete()
+        self.assertCountersMatchSource()
+        first.delete()
+        stats = UserStats.objects.get(pk=self.doctor.pk)
+        self.assertEqual((stats.total_appointments, stats.distinct_patients, stats.prescriptions), (0, 0, 0))
+        self.assertCountersMatchSource()
+
+    def test_reconcile_repairs_drift(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+        UserStats.objects.filter(pk=self.doctor.pk).update(total_appointments=7)
+        self.assertEqual(counters.reconcile(), (2, 1))
+        self.assertCountersMatchSource()
+
+
+class ClinicStatsTests(TestCase):
+    def setUp(self):
+        doctor = User.objects.create(username="doc", role="doctor")
+        patients = [User.objects.create(username=f"pat{i}", role="patient") for i in range(2)]
+        User.objects.create(username="adm", role="admin")
+        now = timezone.now()
+        for hours, status in ((-2, "pending"), (-1, "completed"), (3, "pending"), (5, "cancelled")):
+            appointment = Appointment(
+                patient=patients[hours % 2], doctor=doctor,
+                appointment_datetime=now + timedelta(hours=hours), status=status,
+            )
+            appointment.save(validate=False)
+        Prescription.objects.create(appointment=appointment, doctor=doctor, patient=appointment.patient)
+
+    def test_snapshot_costs_one_query_per_table(self):
+        with self.assertNumQueries(3):
+            stats = get_clinic_stats()
+        self.assertEqual((stats.total_users, stats.total_doctors, stats.total_patients), (4, 1, 2))
+        self.assertEqual((stats.total_appointments, stats.overdue_appointments), (4, 1))
+        self.assertEqual(stats.completion_rate(), 25.0)
+        self.assertEqual((stats.active_doctors, stats.inactive_doctors), (1, 0))
+
+    def test_snapshot_matches_separate_counts(self):
+        now = timezone.now()
+        stats = get_clinic_stats(now)
+        for model, metrics in metric_specs(now).items():
+            for metric in metrics:
+                with self.subTest(metric=metric.name):
+                    self.assertEqual(getattr(stats, metric.name), metric.count(model.objects.all()))
+
+
+@query_budget(2, max_repeats=2)
+def user_lookups(request, count=3):
+    """Test view: one query per user lookup"""
+    for pk in range(count):
+        User.objects.filter(pk=pk).first()
+
+
+@override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_REPORT="")
+class QueryBudgetTests(TestCase):
+    def tearDown(self):
+        query_report.views.clear()
+
+    def request(self, count):
+        request = RequestFactory().get("/lookups/")
+        request.resolver_match = ResolverMatch(user_lookups, (), {})
+        return QueryBudgetMiddleware(lambda request: user_lookups(request, count))(request)
+
+    def test_fingerprint_collapses_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x''y' LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+
+    def test_over_budget_and_repeats_are_logged(self):
+        with self.assertLogs("clinicms.queries", "WARNING") as logs:
+            self.request(3)
+        self.assertIn("3 queries (budget 2)", logs.output[0])
+        self.assertIn("same SQL run 3 times (possible N+1)", logs.output[0])
+        entry = query_report.views["users.tests.user_lookups"]
+        self.assertEqual((entry["requests"], entry["max_queries"], entry["over_budget"]), (1, 3, 1))
+
+    @override_settings(QUERY_BUDGET_ACTION="raise")
+    def test_raise_action(self):
+        self.request(2)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.request(3)
+
+    def test_report_merges_processes_and_prints(self):
+        recorder = QueryRecorder()
+        recorder.count, recorder.shapes["SELECT ?"] = 4, 4
+        first, second = QueryReport(), QueryReport()
+        first.add("clinic.view", recorder, 3, True)
+        second.add("clinic.view", recorder, 3, True)
+        second.add("clinic.cheap", QueryRecorder(), 3, False)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "queries.json")
+            first.write(path)
+            second.write(path)
+            with open(path) as report_file:
+                views = json.load(report_file)
+            self.assertEqual((views["clinic.view"]["requests"], views["clinic.view"]["queries"]), (2, 8))
+
+            out = StringIO()
+            call_command("query_budget_report", path, "--over-budget", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("clinic.view"))
+        self.assertIn("most repeated: SELECT ?", lines[2])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN="secret")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        metrics.registry._reset()
+
+    def test_quantile_interpolates_within_a_bucket(self):
+        buckets = (1, 2, 4)
+        values = [0, 2, 2, 0, 9.0, 4]
+        self.assertEqual(metrics.quantile(values, buckets, 0.5), 2.0)
+        self.assertEqual(metrics.quantile(values, buckets, 0.75), 3.0)
+        self.assertIsNone(metrics.quantile([0, 0, 0, 0, 0.0, 0], buckets, 0.5))
+
+    def test_collect_adds_up_every_workers_file(self):
+        metrics.registry.inc("clinicms_requests_total", view="home", method="GET", status="200")
+        metrics.registry.observe("clinicms_request_duration_seconds", 0.02, view="home", method="GET")
+        other = metrics.Registry()
+        other.pid = 1
+        other.inc("clinicms_requests_total", 2, view="home", method="GET", status="200")
+        other.observe("clinicms_request_duration_seconds", 20, view="home", method="GET")
+        with open(os.path.join(self.directory, "metrics-1.json"), "w") as metrics_file:
+            json.dump(other.snapshot(), metrics_file)
+
+        merged = metrics.collect()
+        self.assertEqual(list(merged["counters"]["clinicms_requests_total"].values()), [3])
+        latency = list(merged["histograms"]["clinicms_request_duration_seconds"].values())[0]
+        self.assertEqual((latency[2], latency[len(metrics.LATENCY_BUCKETS)], latency[-1]), (1, 1, 2))
+
+        text = metrics.render_text(merged)
+        self.assertIn('clinicms_requests_total{method="GET",status="200",view="home"} 3', text)
+        self.assertIn('clinicms_request_duration_seconds_bucket{method="GET",view="home",le="0.025"} 1', text)
+        self.assertIn('clinicms_request_duration_seconds_bucket{method="GET",view="home",le="+Inf"} 2', text)
+        self.assertEqual(metrics.view_summaries(merged)[0]["requests"], 2)
+
+    def test_endpoint_requires_the_token_or_an_admin(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE clinicms_requests_total counter", response.content.decode())
+
+
+@override_settings(DASHBOARD_FRAGMENT_TTL=300)
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(username="adm", role="admin")
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+
+    def versions(self):
+        return [fragments.data_version(scope) for scope in (self.doctor.pk, self.patient.pk, fragments.CLINIC)]
+
+    def test_versions_move_only_after_commit(self):
+        before = self.versions()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, appointment_datetime=timezone.now() + timedelta(days=1)
+            )
+            self.assertEqual(self.versions(), before)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.versions(), [version + 1 for version in before])
+
+    def test_rolled_back_change_keeps_the_versions(self):
+        before = self.versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Appointment.objects.create(
+                        patient=self.patient, doctor=self.doctor,
+                        appointment_datetime=timezone.now() + timedelta(days=1),
+                    )
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self.versions(), before)
+
+    def test_admin_dashboard_sections_are_served_from_cache(self):
+        self.client.force_login(self.admin)
+        url = reverse("dashboard_admin")
+
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(captured)
+
+        first = queries()
+        # The three clinic-wide aggregates are skipped while the sections are cached
+        self.assertEqual(queries(), first - 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create(username="new", role="patient")
+        self.assertEqual(queries(), first)
+
+
+LOCMEM_TEMPLATES = [{
+    "BACKEND": "django.template.backends.django.DjangoTemplates",
+    "OPTIONS": {
+        "loaders": [("django.template.loaders.locmem.Loader", {
+            "ok.html": "{{ user }}",
+            "broken.html": "{% if %}",
+        })],
+    },
+}]
+
+
+class TemplateWarmupTests(TestCase):
+    def test_every_project_template_compiles(self):
+        names = template_warmup.template_names()
+        self.assertIn("users/dashboard_admin.html", names)
+        self.assertEqual([timing.name for timing in template_warmup.warm(names) if timing.error], [])
+
+    @override_settings(TEMPLATES=LOCMEM_TEMPLATES)
+    def test_syntax_errors_are_reported(self):
+        ok, broken = template_warmup.warm(["ok.html", "broken.html"], render=True)
+        self.assertIsNone(ok.error)
+        self.assertIsNotNone(ok.render_seconds)
+        self.assertIsNotNone(broken.error)
+
+    @override_settings(TEMPLATES=LOCMEM_TEMPLATES, TEMPLATE_WARMUP=True)
+    def test_startup_refuses_broken_templates(self):
+        with mock.patch.object(template_warmup, "template_names", return_value=["ok.html", "broken.html"]):
+            with self.assertRaisesMessage(ImproperlyConfigured, "broken.html"):
+                template_warmup.warm_on_startup()
+        with mock.patch.object(template_warmup, "template_names", return_value=["ok.html"]):
+            self.assertEqual(len(template_warmup.warm_on_startup()), 1)
+
+    def test_command_reports_the_totals(self):
+        out = StringIO()
+        call_command("warm_templates", "--app", "prescriptions", "--no-render", stdout=out)
+        count = len(template_warmup.template_names(["prescriptions"]))
+        self.assertIn(f"{count}/{count} templates compiled", out.getvalue())
+
+
+@override_settings(CONDITIONAL_GET_WINDOW=300)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+        self.appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, appointment_datetime=timezone.now() + timedelta(days=2)
+        )
+        self.url = reverse("appointments:list_appointments")
+        self.client.force_login(self.patient)
+
+    def get(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(self.url, **headers)
+
+    def test_unchanged_page_answers_not_modified(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("private", first["Cache-Control"])
+        self.assertIn("no-cache", first["Cache-Control"])
+        response = self.get(first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_write_changes_the_etag(self):
+        etag = self.get()["ETag"]
+        self.appointment.status = "cancelled"
+        self.appointment.save()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_renamed_user_changes_the_etag(self):
+        etag = self.get()["ETag"]
+        self.patient.username = "patricia"
+        self.patient.save()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def check(self, user):
+        request = RequestFactory().get(self.url)
+        request.user = user
+        request._messages = CookieStorage(request)
+        return request, conditional._check(request, conditional.own_appointments)
+
+    def test_pending_flash_messages_skip_the_check(self):
+        request, (etag, _response) = self.check(self.patient)
+        self.assertIsNotNone(etag)
+        messages.success(request, "Appointment booked")
+        self.assertEqual(conditional._check(request, conditional.own_appointments), (None, None))
+
+    def test_users_the_view_turns_away_are_not_checked(self):
+        _request, result = self.check(User.objects.create(username="adm", role="admin"))
+        self.assertEqual(result, (None, None))
+
+
+class ExportStreamingTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username="adm", role="admin")
+        for i in range(3):
+            User.objects.create(username=f"pat{i}", role="patient")
+        self.url = reverse("admin_export_data") + "?type=users&format=ndjson"
+
+    def test_wsgi_streams_a_sync_iterator(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(self.url)
+        self.assertFalse(response.is_async)
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 4)
+
+    async def test_asgi_streams_an_async_iterator(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(self.url)
+        # A sync iterator would be read whole into memory before sending
+        self.assertTrue(response.is_async)
+        body = b"".join([block async for block in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 4)
+
+
+class NotificationTimesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create(username="doc", role="doctor")
+        self.patient = User.objects.create(username="pat", role="patient")
+        self.when = timezone.now() + timedelta(hours=3)
+
+    def times(self):
+        return notifications.get_pending_times(self.patient.pk)
+
+    def test_committed_changes_rebuild_from_the_database(self):
+        self.assertEqual(self.times(), ())
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, appointment_datetime=self.when
+            )
+        self.assertEqual(self.times(), (self.when.timestamp(),))
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = "missed"
+            appointment.save()
+        self.assertEqual(self.times(), ())
+
+    def test_stale_entry_is_replaced_not_edited(self):
+        # An entry that missed another worker's change (or lost a race)
+        cache.set(notifications._cache_key(self.patient.pk), (123.0,))
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_datetime=self.when)
+        self.assertEqual(self.times(), (self.when.timestamp(),))
+
+
+def counting_job(checkpoint, batch_size):
+    """Test job: three batches, resuming after the last one reported"""
+    start = checkpoint.cursor.get("after", 0)
+    for batch in range(start + 1, 4):
+        yield batch_size, {"after": batch}
+
+
+def failing_job(checkpoint, batch_size):
+    yield 1, {"after": 1}
+    raise RuntimeError("boom")
+
+
+def overrun_job(checkpoint, batch_size):
+    """Test job whose first batch outlives the lease and is taken over"""
+    JobCheckpoint.objects.filter(name=checkpoint.name).update(locked_until=timezone.now() + timedelta(hours=1))
+    yield 1, {"after": 1}
+    yield 1, {"after": 2}
+
+
+@override_settings(JOBS_LEASE_SECONDS=600)
+class JobRunnerTests(TestCase):
+    def setUp(self):
+        self.jobs = dict(jobs.JOBS)
+        jobs.JOBS.update(
+            counting="users.tests.counting_job", failing="users.tests.failing_job", overrun="users.tests.overrun_job"
+        )
+
+    def tearDown(self):
+        jobs.JOBS.clear()
+        jobs.JOBS.update(self.jobs)
+
+    def test_held_lease_skips_the_run(self):
+        self.assertIsNotNone(jobs.acquire("counting"))
+        self.assertIsNone(jobs.acquire("counting"))
+        self.assertTrue(jobs.run("counting").skipped)
+
+    def test_expired_lease_is_taken_over(self):
+        jobs.acquire("counting")
+        JobCheckpoint.objects.filter(name="counting").update(locked_until=timezone.now() - timedelta(seconds=1))
+        result = jobs.run("counting", batch_size=5)
+        self.assertFalse(result.skipped)
+        self.assertEqual(result.processed, 15)
+
+    def test_bounded_runs_resume_from_the_cursor(self):
+        first = jobs.run("counting", batch_size=1, max_batches=2)
+        self.assertEqual((first.batches, first.finished_pass), (2, False))
+        self.assertEqual(JobCheckpoint.objects.get(name="counting").cursor, {"after": 2})
+        second = jobs.run("counting", batch_size=1, max_batches=2)
+        self.assertEqual((second.batches, second.finished_pass), (1, True))
+        checkpoint = JobCheckpoint.objects.get(name="counting")
+        self.assertEqual((checkpoint.cursor, checkpoint.processed, checkpoint.runs), ({}, 3, 2))
+        self.assertIsNone(checkpoint.locked_until)
+
+    def test_failure_keeps_progress_and_releases_the_lease(self):
+        with self.assertLogs("users.jobs", "ERROR"):
+            result = jobs.run("failing")
+        self.assertEqual(result.error, "RuntimeError: boom")
+        checkpoint = JobCheckpoint.objects.get(name="failing")
+        self.assertEqual((checkpoint.cursor, checkpoint.last_error), ({"after": 1}, "RuntimeError: boom"))
+        self.assertIsNone(checkpoint.locked_until)
+
+    def test_each_batch_renews_the_lease(self):
+        checkpoint = jobs.acquire("counting")
+        later = timezone.now() + timedelta(minutes=5)
+        with mock.patch.object(jobs.timezone, "now", return_value=later):
+            jobs._save_progress(checkpoint, 1, {"after": 1})
+        self.assertEqual(JobCheckpoint.objects.get(name="counting").locked_until, later + timedelta(seconds=600))
+        self.assertEqual(checkpoint.locked_until, later + timedelta(seconds=600))
+
+    def test_taken_over_run_stops_and_keeps_the_new_lease(self):
+        with self.assertLogs("users.jobs", "WARNING"):
+            result = jobs.run("overrun")
+        self.assertTrue(result.error.startswith("LeaseLost"))
+        self.assertEqual((result.batches, result.processed), (0, 0))
+        checkpoint = JobCheckpoint.objects.get(name="overrun")
+        self.assertGreater(checkpoint.locked_until, timezone.now() + timedelta(minutes=50))
+        self.assertEqual((checkpoint.cursor, checkpoint.runs), ({}, 0))
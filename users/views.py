@@ -12,14 +12,14 @@ from .forms import PrescriptionForm
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.exceptions import PermissionDenied
 from django.utils import timezone
-from datetime import datetime, timedelta
-from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponse
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.db.models import Q, Count, Max, Sum
 from django.contrib.auth import get_user_model
 from django.template.loader import render_to_string
 from django.conf import settings
-from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
 import json
 from django.contrib.auth.views import (
     PasswordResetView, 
@@ -27,8 +27,20 @@ from django.contrib.auth.views import (
     PasswordResetConfirmView,
     PasswordResetCompleteView
 )
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.crypto import constant_time_compare
 from .forms import CustomPasswordResetForm, CustomSetPasswordForm
+from .stats import get_clinic_stats
+from .counters import get_user_stats
+from .async_support import aload_request
+from .fragments import CLINIC, adashboard_fragments, dashboard_fragments, deferred
+from . import conditional, exports, metrics, notifications
+from .pagination import paginate
+from .middleware import query_budget
+from appointments.schedule import MAX_SCHEDULE_DAYS, PERIODS, build_schedule, parse_day, period_range
+from analytics import rollups
+from search.engine import search_filter, search_ids
+from analytics.cache import admin_analytics_snapshot
 User = get_user_model()
 
 
@@ -86,155 +98,101 @@ def login_view(request):
 
 
 @login_required
-def dashboard_doctor(request):
-    appointments = Appointment.objects.filter(doctor=request.user)
-    prescriptions = Prescription.objects.filter(doctor=request.user)
-    return render(
-        request,
-        "users/dashboard_doctor.html",
-        {"appointments": appointments, "prescriptions": prescriptions},
-    )
+@conditional.conditional_page(conditional.doctor_dashboard)
+@query_budget(10)
+async def dashboard_doctor(request):
+    user = await aload_request(request)
+    fragments = await adashboard_fragments(request, "users.dashboard_doctor", user.pk)
+    # Querysets: only evaluated for sections missing from the fragment cache
+    context = {
+        "appointments": Appointment.objects.filter(doctor=user).select_related('patient'),
+        "prescriptions": Prescription.objects.filter(doctor=user).select_related('patient'),
+        **fragments.context(),
+    }
+    return await sync_to_async(render)(request, "users/dashboard_doctor.html", context)
 
 @login_required
-def dashboard_patient(request):
+@conditional.conditional_page(conditional.patient_dashboard)
+@query_budget(20)
+async def dashboard_patient(request):
     """Patient dashboard with stats, appointments, prescriptions, and next appointment"""
-    if request.user.role != "patient":
+    user = await aload_request(request)
+    if user.role != "patient":
         messages.error(request, "Access denied.")
         return redirect("login")
 
     now = timezone.now()
+    fragments = await adashboard_fragments(request, "users.dashboard_patient", user.pk)
 
     # Get all appointments & prescriptions for this patient
     appointments = Appointment.objects.filter(
-        patient=request.user
+        patient=user
     ).select_related("doctor").order_by("-appointment_datetime")
 
     prescriptions = Prescription.objects.filter(
-        appointment__patient=request.user
+        appointment__patient=user
     ).select_related("doctor", "appointment").order_by("-date_issued")
 
-    # Stats
-    upcoming_appointments_count = appointments.filter(
-        appointment_datetime__gte=now
-    ).count()
-
-    pending_appointments_count = appointments.filter(status="pending").count()
-    completed_appointments_count = appointments.filter(status="completed").count()
-    active_prescriptions_count = prescriptions.count()
-
-    # Recent activities
-    recent_appointments = appointments[:5]
-    recent_prescriptions = prescriptions[:5]
-
-    # Next appointment (closest upcoming)
-    next_appointment = appointments.filter(
-        appointment_datetime__gte=now
-    ).order_by("appointment_datetime").first()
+    # Everything below is loaded while rendering, and only for sections
+    # missing from the fragment cache
+    # Stats (counters from one primary-key lookup; "upcoming" depends on now)
+    stats = deferred(lambda: get_user_stats(user))
 
     context = {
-        "appointments": recent_appointments,
-        "prescriptions": recent_prescriptions,
-        "upcoming_appointments_count": upcoming_appointments_count,
-        "pending_appointments_count": pending_appointments_count,
-        "completed_appointments_count": completed_appointments_count,
-        "active_prescriptions_count": active_prescriptions_count,
-        "total_visits": completed_appointments_count,
-        "next_appointment": next_appointment,
+        # Recent activities
+        "appointments": appointments[:5],
+        "prescriptions": prescriptions[:5],
+        "upcoming_appointments_count": deferred(
+            lambda: appointments.filter(appointment_datetime__gte=now).count()
+        ),
+        "pending_appointments_count": lambda: stats().pending_appointments,
+        "completed_appointments_count": lambda: stats().completed_appointments,
+        "active_prescriptions_count": lambda: stats().prescriptions,
+        "total_visits": lambda: stats().completed_appointments,
+        # Next appointment (closest upcoming)
+        "next_appointment": deferred(
+            lambda: appointments.filter(appointment_datetime__gte=now).order_by("appointment_datetime").first()
+        ),
+        **fragments.context(),
     }
 
-    return render(request, "users/dashboard_patient.html", context)
+    return await sync_to_async(render)(request, "users/dashboard_patient.html", context)
 
 
 
 # Replace your existing dashboard_admin view with this enhanced version
 
 @login_required
+@query_budget(12)
 def dashboard_admin(request):
     """Enhanced admin dashboard with analytics preview"""
     if request.user.role != 'admin':
         messages.error(request, "Access denied.")
         return redirect('login')
     
-    now = timezone.now()
-    thirty_days_ago = now - timedelta(days=30)
-    
-    # Basic stats for the dashboard
-    total_users = User.objects.count()
-    total_doctors = User.objects.filter(role='doctor').count()
-    total_patients = User.objects.filter(role='patient').count()
-    total_admins = User.objects.filter(role='admin').count()
-    
-    # Growth metrics
-    new_users_this_month = User.objects.filter(
-        date_joined__gte=thirty_days_ago
-    ).count()
-    
-    new_patients_this_month = User.objects.filter(
-        role='patient',
-        date_joined__gte=thirty_days_ago
-    ).count()
-    
-    new_doctors_this_month = User.objects.filter(
-        role='doctor',
-        date_joined__gte=thirty_days_ago
-    ).count()
-    
-    # Appointment stats
-    total_appointments = Appointment.objects.count()
-    today_appointments = Appointment.objects.filter(
-        appointment_datetime__date=now.date()
-    ).count()
-    
-    completed_appointments = Appointment.objects.filter(
-        status='completed'
-    ).count()
-    
-    pending_appointments = Appointment.objects.filter(
-        status='pending'
-    ).count()
-    
-    # Calculate completion rate
-    appointment_completion_rate = round(
-        (completed_appointments / total_appointments * 100) if total_appointments > 0 else 0,
-        1
-    )
-    
-    # Active patients (had appointment in last 30 days)
-    active_patients = User.objects.filter(
-        role='patient',
-        appointments_as_patient__appointment_datetime__gte=thirty_days_ago
-    ).distinct().count()
-    
-    # Prescription stats
-    try:
-        total_prescriptions = Prescription.objects.count()
-        monthly_prescriptions = Prescription.objects.filter(
-            created_at__gte=thirty_days_ago
-        ).count()
-    except:
-        total_prescriptions = 0
-        monthly_prescriptions = 0
-    
-    # Total records in system
-    total_records = total_users + total_appointments + total_prescriptions
+    # All counters come from one aggregate query per table, run while
+    # rendering and only when a section is missing from the fragment cache
+    stats = deferred(get_clinic_stats)
+    fragments = dashboard_fragments(request, "users.dashboard_admin", CLINIC)
     
     context = {
-        'total_users': total_users,
-        'total_doctors': total_doctors,
-        'total_patients': total_patients,
-        'total_admins': total_admins,
-        'new_users_this_month': new_users_this_month,
-        'new_patients_this_month': new_patients_this_month,
-        'new_doctors_this_month': new_doctors_this_month,
-        'total_appointments': total_appointments,
-        'today_appointments': today_appointments,
-        'completed_appointments': completed_appointments,
-        'pending_appointments': pending_appointments,
-        'appointment_completion_rate': appointment_completion_rate,
-        'active_patients': active_patients,
-        'total_prescriptions': total_prescriptions,
-        'monthly_prescriptions': monthly_prescriptions,
-        'total_records': total_records,
+        'total_users': lambda: stats().total_users,
+        'total_doctors': lambda: stats().total_doctors,
+        'total_patients': lambda: stats().total_patients,
+        'total_admins': lambda: stats().total_admins,
+        'new_users_this_month': lambda: stats().new_users_this_month,
+        'new_patients_this_month': lambda: stats().new_patients_this_month,
+        'new_doctors_this_month': lambda: stats().new_doctors_this_month,
+        'total_appointments': lambda: stats().total_appointments,
+        'today_appointments': lambda: stats().today_appointments,
+        'completed_appointments': lambda: stats().completed_appointments,
+        'pending_appointments': lambda: stats().pending_appointments,
+        'appointment_completion_rate': lambda: stats().completion_rate(1),
+        'active_patients': lambda: stats().active_patients,
+        'total_prescriptions': lambda: stats().total_prescriptions,
+        'monthly_prescriptions': lambda: stats().monthly_prescriptions,
+        'total_records': lambda: stats().total_records,
+        **fragments.context(),
     }
     
     return render(request, "users/dashboard_admin.html", context)
@@ -310,38 +268,43 @@ def mark_completed(request, appointment_id):
     return redirect("dashboard_doctor")
 
 @login_required
+@query_budget(8)
 def doctor_schedule(request):
     """Display doctor's weekly schedule"""
     if request.user.role != 'doctor':
         messages.error(request, "Access denied.")
         return redirect('dashboard_doctor')
     
-    # Get current week's appointments
-    today = timezone.now().date()
-    week_start = today - timedelta(days=today.weekday())
-    week_end = week_start + timedelta(days=6)
-    
-    appointments = Appointment.objects.filter(
-        doctor=request.user,
-        appointment_datetime__date__range=[week_start, week_end]
-    ).select_related('patient').order_by('appointment_datetime')
-    
-    # Group appointments by day
-    schedule_by_day = {}
-    for i in range(7):
-        day = week_start + timedelta(days=i)
-        schedule_by_day[day] = appointments.filter(appointment_datetime__date=day)
+    # Current week by default; ?period=day|week|month&date=... or ?start=...&end=...
+    today = timezone.localdate()
+    anchor = parse_day(request.GET.get('date')) or today
+    period = request.GET.get('period', 'week')
+    if period not in PERIODS:
+        period = 'week'
+    week_start, week_end = period_range(period, anchor)
+    custom_start = parse_day(request.GET.get('start'))
+    custom_end = parse_day(request.GET.get('end'))
+    if custom_start and custom_end and custom_start <= custom_end:
+        week_start = custom_start
+        week_end = min(custom_end, custom_start + timedelta(days=MAX_SCHEDULE_DAYS - 1))
+    
+    # One query for the whole range, grouped by local date
+    schedule = build_schedule(request.user.id, week_start, week_end)
     
     context = {
-        'schedule_by_day': schedule_by_day,
+        'schedule_by_day': schedule,
         'week_start': week_start,
         'week_end': week_end,
+        'period': period,
+        'previous_date': week_start - timedelta(days=1),
+        'next_date': week_end + timedelta(days=1),
         'today': today
     }
     
     return render(request, 'users/doctor_schedule.html', context)
 
 @login_required
+@query_budget(10)
 def doctor_patients_list(request):
     """List all patients who have had appointments with this doctor"""
     if request.user.role != 'doctor':
@@ -368,13 +331,11 @@ def doctor_patients_list(request):
 ).order_by('username')
     
     # Pagination
-    paginator = Paginator(patients, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, patients, 20)
     
     context = {
         'patients': page_obj,
-        'total_patients': patients.count()
+        'total_patients': page_obj.count
     }
     
     return render(request, 'users/patient_list.html', context)
@@ -395,12 +356,10 @@ def doctor_patients_search(request):
             doctor=request.user
         ).values_list('patient_id', flat=True).distinct()
         
+        # Ranked ids from the search index, limited to this doctor's patients
+        ranked_ids = search_ids('user', query, limit=20, within=patient_ids)
         results = User.objects.filter(
-            Q(username__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query) |
-            Q(email__icontains=query),
-            id__in=patient_ids,
+            id__in=ranked_ids,
             role='patient'
         ).annotate(
     total_appointments=Count(
@@ -411,7 +370,9 @@ def doctor_patients_search(request):
         'appointments_as_patient__appointment_datetime',
         filter=Q(appointments_as_patient__doctor=request.user)
     )
-)[:20]
+)
+        rank = {user_id: position for position, user_id in enumerate(ranked_ids)}
+        results = sorted(results, key=lambda patient: rank[patient.id])
     
     context = {
         'query': query,
@@ -452,6 +413,7 @@ def doctor_medical_history(request):
     return render(request, 'users/medical_history.html', context)
 
 @login_required
+@query_budget(18)
 def doctor_analytics(request):
     """Analytics and reports for doctors"""
     if request.user.role != 'doctor':
@@ -462,12 +424,10 @@ def doctor_analytics(request):
     thirty_days_ago = now - timedelta(days=30)
     seven_days_ago = now - timedelta(days=7)
     
-    # Basic statistics
-    total_appointments = Appointment.objects.filter(doctor=request.user).count()
-    completed_appointments = Appointment.objects.filter(
-        doctor=request.user, 
-        status='completed'
-    ).count()
+    # Basic statistics (all-time counters from one primary-key lookup)
+    stats = get_user_stats(request.user)
+    total_appointments = stats.total_appointments
+    completed_appointments = stats.completed_appointments
     
     pending_appointments = Appointment.objects.filter(
         doctor=request.user, 
@@ -476,27 +436,19 @@ def doctor_analytics(request):
     ).count()
     
     # Weekly statistics
-    weekly_appointments = Appointment.objects.filter(
-        doctor=request.user,
-        appointment_datetime__gte=seven_days_ago
-    ).count()
+    weekly_appointments = rollups.appointment_totals(
+        start_day=seven_days_ago.date(), doctor_id=request.user.id
+    )['total']
     
     # Monthly statistics
-    monthly_appointments = Appointment.objects.filter(
-        doctor=request.user,
-        appointment_datetime__gte=thirty_days_ago
-    ).count()
-    
-    monthly_completed = Appointment.objects.filter(
-        doctor=request.user,
-        status='completed',
-        appointment_datetime__gte=thirty_days_ago
-    ).count()
+    monthly = rollups.appointment_totals(
+        start_day=thirty_days_ago.date(), doctor_id=request.user.id
+    )
+    monthly_appointments = monthly['total']
+    monthly_completed = monthly['completed']
     
     # Patient statistics
-    total_patients = Appointment.objects.filter(
-        doctor=request.user
-    ).values('patient').distinct().count()
+    total_patients = stats.distinct_patients
     
     # Active patients (had appointment in last 30 days)
     active_patients = Appointment.objects.filter(
@@ -505,15 +457,12 @@ def doctor_analytics(request):
     ).values('patient').distinct().count()
     
     # Prescription statistics
-    try:
-        total_prescriptions = Prescription.objects.filter(doctor=request.user).count()
-        monthly_prescriptions = Prescription.objects.filter(
-            doctor=request.user,
-            created_at__gte=thirty_days_ago
-        ).count()
-    except:
-        total_prescriptions = 0
-        monthly_prescriptions = 0
+    total_prescriptions = stats.prescriptions
+    monthly_prescriptions = sum(
+        month['total'] for month in rollups.prescription_series(
+            thirty_days_ago.date(), timezone.localdate(), doctor_id=request.user.id
+        )
+    )
     
     # Calculate rates
     completion_rate = round(
@@ -579,14 +528,11 @@ def doctor_profile(request):
         return redirect('doctor_profile')
     
     # Get doctor's statistics for profile
-    total_appointments = Appointment.objects.filter(doctor=request.user).count()
-    total_patients = Appointment.objects.filter(
-        doctor=request.user
-    ).values('patient').distinct().count()
+    stats = get_user_stats(request.user)
     
     context = {
-        'total_appointments': total_appointments,
-        'total_patients': total_patients,
+        'total_appointments': stats.total_appointments,
+        'total_patients': stats.distinct_patients,
     }
     
     return render(request, 'users/doctor_profile.html', context)
@@ -635,24 +581,18 @@ def patient_profile(request):
         return redirect('patient_profile')
     
     # Get patient statistics for profile
-    total_appointments = Appointment.objects.filter(patient=request.user).count()
-    completed_visits = Appointment.objects.filter(
-        patient=request.user, 
-        status='completed'
-    ).count()
-    total_prescriptions = Prescription.objects.filter(
-        appointment__patient=request.user
-    ).count()
+    stats = get_user_stats(request.user)
     
     context = {
-        'total_appointments': total_appointments,
-        'completed_visits': completed_visits,
-        'total_prescriptions': total_prescriptions,
+        'total_appointments': stats.total_appointments,
+        'completed_visits': stats.completed_appointments,
+        'total_prescriptions': stats.prescriptions,
     }
     
     return render(request, 'users/patient_profile.html', context)
 
 @login_required
+@query_budget(12)
 def patient_medical_history(request):
     """Complete medical history for patient"""
     if request.user.role != 'patient':
@@ -674,15 +614,13 @@ def patient_medical_history(request):
     ).select_related('doctor', 'appointment').order_by('-date_issued')
     
     # Pagination
-    paginator = Paginator(medical_records, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, medical_records, 10)
     
     context = {
         'medical_records': page_obj,
         'prescriptions': all_prescriptions,
         'recent_consultations': recent_consultations,
-        'total_visits': medical_records.count(),
+        'total_visits': page_obj.count,
         'total_prescriptions': all_prescriptions.count(),
     }
     return render(request, 'users/patient_medical_history.html', context)
@@ -690,6 +628,8 @@ def patient_medical_history(request):
 
 
 @login_required
+@conditional.conditional_page(conditional.patient_prescriptions)
+@query_budget(10)
 def patient_prescriptions(request):
     """View all prescriptions with filtering"""
     if request.user.role != 'patient':
@@ -718,23 +658,20 @@ def patient_prescriptions(request):
     # Search functionality
     search_query = request.GET.get('search')
     if search_query:
+        doctor_ids = prescriptions.values_list('doctor_id', flat=True).distinct()
         prescriptions = prescriptions.filter(
-            Q(medicine__icontains=search_query) |
-            Q(doctor__first_name__icontains=search_query) |
-            Q(doctor__last_name__icontains=search_query) |
-            Q(instructions__icontains=search_query)
+            Q(id__in=search_filter('prescription', search_query, within=prescriptions.values_list('id', flat=True))) |
+            Q(doctor_id__in=search_filter('user', search_query, within=doctor_ids))
         )
     
     # Pagination
-    paginator = Paginator(prescriptions, 10)  # Show 10 prescriptions per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, prescriptions, 10)  # Show 10 prescriptions per page
     
     context = {
         'prescriptions': page_obj,
         'search_query': search_query,
         'date_filter': date_filter,
-        'total_prescriptions': prescriptions.count(),
+        'total_prescriptions': page_obj.count,
     }
     
     # Render the dedicated prescriptions template
@@ -781,22 +718,23 @@ Generated on {timezone.now().strftime('%B %d, %Y at %I:%M %p')}
 
 
 @login_required
-def patient_appointments_ajax(request):
+async def patient_appointments_ajax(request):
     """AJAX endpoint for filtering appointments"""
-    if request.user.role != 'patient':
+    user = await request.auser()
+    if user.role != 'patient':
         return JsonResponse({'error': 'Access denied'}, status=403)
     
     status_filter = request.GET.get('status', 'all')
     
     appointments = Appointment.objects.filter(
-        patient=request.user
+        patient=user
     ).select_related('doctor').order_by('-appointment_datetime')
     
     if status_filter != 'all':
         appointments = appointments.filter(status=status_filter)
     
     appointments_data = []
-    for appt in appointments:
+    async for appt in appointments:
         appointments_data.append({
             'id': appt.id,
             'doctor_name': f"Dr. {appt.doctor.get_full_name() or appt.doctor.username}",
@@ -817,216 +755,133 @@ def patient_appointments_ajax(request):
     })
 
 @login_required
-def patient_notifications(request):
-    """Get patient notifications"""
-    if request.user.role != 'patient':
+async def patient_notifications(request):
+    """Get patient notifications (from the cached pending times, no queries)"""
+    user = await request.auser()
+    if user.role != 'patient':
         return JsonResponse({'error': 'Access denied'}, status=403)
     
-    now = timezone.now()
-    
-    # Upcoming appointments (within next 24 hours)
-    upcoming = Appointment.objects.filter(
-        patient=request.user,
-        status='pending',
-        appointment_datetime__gte=now,
-        appointment_datetime__lte=now + timedelta(hours=24)
-    ).count()
-    
-    # Overdue appointments
-    overdue = Appointment.objects.filter(
-        patient=request.user,
-        status='pending',
-        appointment_datetime__lt=now
-    ).count()
-    
-    notifications = []
-    
-    if upcoming > 0:
-        notifications.append({
-            'type': 'info',
-            'message': f'You have {upcoming} appointment{"s" if upcoming > 1 else ""} in the next 24 hours.',
-            'icon': 'fa-bell'
-        })
-    
-    if overdue > 0:
-        notifications.append({
-            'type': 'warning',
-            'message': f'You have {overdue} overdue appointment{"s" if overdue > 1 else ""}.',
-            'icon': 'fa-exclamation-triangle'
-        })
-    
-    return JsonResponse({
-        'notifications': notifications,
-        'count': len(notifications)
-    })
+    times = await notifications.aget_pending_times(user.id)
+    return JsonResponse(notifications.payload(*notifications.summarize(times)))
+
+
+@login_required
+async def patient_notifications_stream(request):
+    """Server-Sent Events: the patient's notifications, pushed when they change"""
+    user = await request.auser()
+    if user.role != 'patient':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if not isinstance(request, ASGIRequest):
+        # A sync worker cannot hold the stream open: send the current state
+        # and let EventSource reconnect after the old polling interval
+        times = await notifications.aget_pending_times(user.id)
+        body = f"retry: {settings.NOTIFICATIONS_WSGI_RETRY_MS}\n\n" + notifications.format_event(
+            notifications.payload(*notifications.summarize(times))
+        )
+        return HttpResponse(body, content_type='text/event-stream', headers=headers)
+    return StreamingHttpResponse(
+        notifications.event_stream(user.id), content_type='text/event-stream', headers=headers
+    )
 
 
 
 
 @login_required
+@query_budget(22)
 def admin_analytics(request):
     """Comprehensive analytics dashboard for admin"""
     if request.user.role != 'admin':
         messages.error(request, "Access denied.")
         return redirect('login')
     
+    # Served from a versioned cache; see analytics.cache for the refresh rules
+    context = admin_analytics_snapshot.get(build_admin_analytics_context)
+    return render(request, 'users/admin_analytics.html', context)
+
+
+def build_admin_analytics_context():
+    """Compute the admin analytics page context (cached by admin_analytics)"""
     now = timezone.now()
     thirty_days_ago = now - timedelta(days=30)
     seven_days_ago = now - timedelta(days=7)
     year_ago = now - timedelta(days=365)
     
-    # ===== USER GROWTH ANALYTICS =====
-    # Total users by role
-    total_doctors = User.objects.filter(role='doctor').count()
-    total_patients = User.objects.filter(role='patient').count()
-    total_admins = User.objects.filter(role='admin').count()
-    total_users = total_doctors + total_patients + total_admins
-    
-    # New users this month
-    new_users_this_month = User.objects.filter(
-        date_joined__gte=thirty_days_ago
-    ).count()
-    
-    new_patients_this_month = User.objects.filter(
-        role='patient',
-        date_joined__gte=thirty_days_ago
-    ).count()
+    # Counters for users, appointments and prescriptions in three queries
+    stats = get_clinic_stats(now)
     
-    new_doctors_this_month = User.objects.filter(
-        role='doctor',
-        date_joined__gte=thirty_days_ago
-    ).count()
+    # Chart series are read from the daily rollup tables (O(days), not O(rows))
+    today = timezone.localdate()
     
-    # Weekly user registration data for chart
-    weekly_registrations = User.objects.filter(
-        date_joined__gte=now - timedelta(days=84)  # 12 weeks
-    ).annotate(
-        week=TruncWeek('date_joined')
-    ).values('week').annotate(
-        count=Count('id')
-    ).order_by('week')
+    # ===== USER GROWTH ANALYTICS =====
+    # Weekly user registration data for chart (12 weeks)
+    weekly_registrations = rollups.registration_series(
+        today - timedelta(days=84), today, period='week'
+    )
     
     # Monthly user growth for the past year
-    monthly_growth = User.objects.filter(
-        date_joined__gte=year_ago
-    ).annotate(
-        month=TruncMonth('date_joined')
-    ).values('month').annotate(
-        total_users=Count('id'),
-        doctors=Count('id', filter=Q(role='doctor')),
-        patients=Count('id', filter=Q(role='patient'))
-    ).order_by('month')
+    monthly_growth = rollups.registration_series(
+        year_ago.date(), today, period='month'
+    )
     
     # ===== APPOINTMENT ANALYTICS =====
-    total_appointments = Appointment.objects.count()
-    completed_appointments = Appointment.objects.filter(status='completed').count()
-    pending_appointments = Appointment.objects.filter(status='pending').count()
-    cancelled_appointments = Appointment.objects.filter(status='cancelled').count()
-    
-    # Monthly appointment trends
-    monthly_appointments = Appointment.objects.filter(
-        appointment_datetime__gte=year_ago
-    ).annotate(
-        month=TruncMonth('appointment_datetime')
-    ).values('month').annotate(
-        total=Count('id'),
-        completed=Count('id', filter=Q(status='completed')),
-        pending=Count('id', filter=Q(status='pending'))
-    ).order_by('month')
+    # Monthly appointment trends (appointments may be scheduled ahead)
+    monthly_appointments = rollups.appointment_series(
+        year_ago.date(), date.max, period='month'
+    )
     
     # Daily appointments for the last 30 days
-    daily_appointments = Appointment.objects.filter(
-        appointment_datetime__gte=thirty_days_ago
-    ).annotate(
-        date=TruncDate('appointment_datetime')
-    ).values('date').annotate(
-        count=Count('id')
-    ).order_by('date')
+    daily_appointments = rollups.appointment_series(
+        thirty_days_ago.date(), date.max, period='day'
+    )
     
     # ===== PRESCRIPTION ANALYTICS =====
     try:
-        total_prescriptions = Prescription.objects.count()
-        monthly_prescriptions = Prescription.objects.filter(
-            created_at__gte=thirty_days_ago
-        ).count()
-        
         # Top prescribed medicines
-        top_medicines = Prescription.objects.values('medicine').annotate(
+        top_medicines = list(Prescription.objects.values('medicine').annotate(
             count=Count('id')
-        ).order_by('-count')[:10]
+        ).order_by('-count')[:10])
         
         # Prescription trends
-        prescription_trends = Prescription.objects.filter(
-            created_at__gte=year_ago
-        ).annotate(
-            month=TruncMonth('created_at')
-        ).values('month').annotate(
-            count=Count('id')
-        ).order_by('month')
+        prescription_trends = rollups.prescription_series(
+            year_ago.date(), today, period='month'
+        )
         
     except:
-        total_prescriptions = 0
-        monthly_prescriptions = 0
         top_medicines = []
         prescription_trends = []
     
     # ===== PERFORMANCE METRICS =====
     # Doctor utilization
-    doctor_performance = User.objects.filter(role='doctor').annotate(
+    doctor_performance = list(User.objects.filter(role='doctor').annotate(
         total_appointments=Count('appointments_as_doctor'),
         completed_appointments=Count(
             'appointments_as_doctor', 
             filter=Q(appointments_as_doctor__status='completed')
         ),
         total_prescriptions=Count('prescriptions')
-    ).order_by('-total_appointments')
-    
-    # Patient engagement
-    active_patients = User.objects.filter(
-        role='patient',
-        appointments_as_patient__appointment_datetime__gte=thirty_days_ago
-    ).distinct().count()
-    
-    # Conversion rates
-    appointment_completion_rate = round(
-        (completed_appointments / total_appointments * 100) if total_appointments > 0 else 0,
-        2
-    )
+    ).order_by('-total_appointments'))
     
     # ===== RECENT ACTIVITY =====
-    recent_users = User.objects.exclude(role='admin').order_by('-date_joined')[:10]
-    recent_appointments = Appointment.objects.select_related(
+    recent_users = list(User.objects.exclude(role='admin').order_by('-date_joined')[:10])
+    recent_appointments = list(Appointment.objects.select_related(
         'patient', 'doctor'
-    ).order_by('-created_at')[:10]
-    
-    # ===== GROWTH CALCULATIONS =====
-    # Calculate growth percentages
-    previous_month_start = thirty_days_ago - timedelta(days=30)
-    previous_month_users = User.objects.filter(
-        date_joined__gte=previous_month_start,
-        date_joined__lt=thirty_days_ago
-    ).count()
-    
-    user_growth_rate = 0
-    if previous_month_users > 0:
-        user_growth_rate = round(
-            ((new_users_this_month - previous_month_users) / previous_month_users * 100),
-            2
-        )
+    ).order_by('-created_at')[:10])
     
     # Prepare chart data as JSON
     weekly_chart_data = json.dumps([
         {
-            'week': reg['week'].strftime('%Y-%m-%d') if reg['week'] else '',
-            'count': reg['count']
+            'week': reg['period'].strftime('%Y-%m-%d'),
+            'count': reg['total']
         }
         for reg in weekly_registrations
     ])
     
     monthly_chart_data = json.dumps([
         {
-            'month': growth['month'].strftime('%Y-%m-%d') if growth['month'] else '',
-            'total_users': growth['total_users'],
+            'month': growth['period'].strftime('%Y-%m-%d'),
+            'total_users': growth['total'],
             'doctors': growth['doctors'],
             'patients': growth['patients']
         }
@@ -1035,7 +890,7 @@ def admin_analytics(request):
     
     appointment_chart_data = json.dumps([
         {
-            'month': appt['month'].strftime('%Y-%m-%d') if appt['month'] else '',
+            'month': appt['period'].strftime('%Y-%m-%d'),
             'total': appt['total'],
             'completed': appt['completed'],
             'pending': appt['pending']
@@ -1045,34 +900,34 @@ def admin_analytics(request):
     
     daily_appointment_data = json.dumps([
         {
-            'date': appt['date'].strftime('%Y-%m-%d') if appt['date'] else '',
-            'count': appt['count']
+            'date': appt['period'].strftime('%Y-%m-%d'),
+            'count': appt['total']
         }
         for appt in daily_appointments
     ])
     
     context = {
         # User metrics
-        'total_users': total_users,
-        'total_doctors': total_doctors,
-        'total_patients': total_patients,
-        'total_admins': total_admins,
-        'new_users_this_month': new_users_this_month,
-        'new_patients_this_month': new_patients_this_month,
-        'new_doctors_this_month': new_doctors_this_month,
-        'user_growth_rate': user_growth_rate,
-        'active_patients': active_patients,
+        'total_users': stats.total_users,
+        'total_doctors': stats.total_doctors,
+        'total_patients': stats.total_patients,
+        'total_admins': stats.total_admins,
+        'new_users_this_month': stats.new_users_this_month,
+        'new_patients_this_month': stats.new_patients_this_month,
+        'new_doctors_this_month': stats.new_doctors_this_month,
+        'user_growth_rate': stats.user_growth_rate,
+        'active_patients': stats.active_patients,
         
         # Appointment metrics
-        'total_appointments': total_appointments,
-        'completed_appointments': completed_appointments,
-        'pending_appointments': pending_appointments,
-        'cancelled_appointments': cancelled_appointments,
-        'appointment_completion_rate': appointment_completion_rate,
+        'total_appointments': stats.total_appointments,
+        'completed_appointments': stats.completed_appointments,
+        'pending_appointments': stats.pending_appointments,
+        'cancelled_appointments': stats.cancelled_appointments,
+        'appointment_completion_rate': stats.completion_rate(2),
         
         # Prescription metrics
-        'total_prescriptions': total_prescriptions,
-        'monthly_prescriptions': monthly_prescriptions,
+        'total_prescriptions': stats.total_prescriptions,
+        'monthly_prescriptions': stats.monthly_prescriptions,
         'top_medicines': top_medicines,
         
         # Performance data
@@ -1089,7 +944,7 @@ def admin_analytics(request):
         'daily_appointment_data': daily_appointment_data,
     }
     
-    return render(request, 'users/admin_analytics.html', context)
+    return context
 
 @login_required
 def admin_reports(request):
@@ -1112,17 +967,9 @@ def admin_reports(request):
     else:
         end_date = timezone.now().date()
     
-    # Users registered in date range
-    users_in_range = User.objects.filter(
-        date_joined__date__gte=start_date,
-        date_joined__date__lte=end_date
-    )
-    
-    # Appointments in date range
-    appointments_in_range = Appointment.objects.filter(
-        appointment_datetime__date__gte=start_date,
-        appointment_datetime__date__lte=end_date
-    )
+    # Daily series from the rollup tables
+    registrations = rollups.registration_series(start_date, end_date)
+    appointments = rollups.appointment_series(start_date, end_date)
     
     # Detailed statistics
     report_data = {
@@ -1131,25 +978,21 @@ def admin_reports(request):
             'end': end_date
         },
         'users': {
-            'total_registered': users_in_range.count(),
-            'doctors': users_in_range.filter(role='doctor').count(),
-            'patients': users_in_range.filter(role='patient').count(),
-            'daily_breakdown': users_in_range.annotate(
-                date=TruncDate('date_joined')
-            ).values('date').annotate(
-                count=Count('id')
-            ).order_by('date')
+            'total_registered': sum(day['total'] for day in registrations),
+            'doctors': sum(day['doctors'] for day in registrations),
+            'patients': sum(day['patients'] for day in registrations),
+            'daily_breakdown': [
+                {'date': day['period'], 'count': day['total']} for day in registrations
+            ]
         },
         'appointments': {
-            'total_scheduled': appointments_in_range.count(),
-            'completed': appointments_in_range.filter(status='completed').count(),
-            'pending': appointments_in_range.filter(status='pending').count(),
-            'cancelled': appointments_in_range.filter(status='cancelled').count(),
-            'daily_breakdown': appointments_in_range.annotate(
-                date=TruncDate('appointment_datetime')
-            ).values('date').annotate(
-                count=Count('id')
-            ).order_by('date')
+            'total_scheduled': sum(day['total'] for day in appointments),
+            'completed': sum(day['completed'] for day in appointments),
+            'pending': sum(day['pending'] for day in appointments),
+            'cancelled': sum(day['cancelled'] for day in appointments),
+            'daily_breakdown': [
+                {'date': day['period'], 'count': day['total']} for day in appointments
+            ]
         }
     }
     
@@ -1206,13 +1049,12 @@ def admin_user_analytics(request):
     ).order_by('-total_appointments')
     
     # User registration patterns
-    registration_by_day = User.objects.filter(
-        date_joined__gte=now - timedelta(days=30)
-    ).annotate(
-        day=TruncDate('date_joined')
-    ).values('day').annotate(
-        count=Count('id')
-    ).order_by('day')
+    registration_by_day = [
+        {'day': day['period'], 'count': day['total']}
+        for day in rollups.registration_series(
+            (now - timedelta(days=30)).date(), timezone.localdate()
+        )
+    ]
     
     # User demographics (if you have additional profile fields)
     user_role_distribution = User.objects.values('role').annotate(
@@ -1222,7 +1064,7 @@ def admin_user_analytics(request):
     context = {
         'most_active_patients': most_active_patients,
         'doctor_productivity': doctor_productivity,
-        'registration_by_day': list(registration_by_day),
+        'registration_by_day': registration_by_day,
         'user_role_distribution': list(user_role_distribution),
     }
     
@@ -1237,35 +1079,23 @@ def admin_system_health(request):
     
     now = timezone.now()
     
+    stats = get_clinic_stats(now)
+    
     # System health metrics
     health_metrics = {
         'database_stats': {
-            'total_records': (
-                User.objects.count() + 
-                Appointment.objects.count() + 
-                Prescription.objects.count()
-            ),
-            'users_table': User.objects.count(),
-            'appointments_table': Appointment.objects.count(),
-            'prescriptions_table': Prescription.objects.count(),
+            'total_records': stats.total_records,
+            'users_table': stats.total_users,
+            'appointments_table': stats.total_appointments,
+            'prescriptions_table': stats.total_prescriptions,
         },
         'recent_activity': {
-            'registrations_today': User.objects.filter(
-                date_joined__date=now.date()
-            ).count(),
-            'appointments_today': Appointment.objects.filter(
-                appointment_datetime__date=now.date()
-            ).count(),
-            'prescriptions_today': Prescription.objects.filter(
-                created_at__date=now.date()
-            ).count() if hasattr(Prescription, 'created_at') else 0,
+            'registrations_today': stats.registrations_today,
+            'appointments_today': stats.today_appointments,
+            'prescriptions_today': stats.prescriptions_today,
         },
         'system_usage': {
-            'peak_appointment_day': Appointment.objects.annotate(
-                day=TruncDate('appointment_datetime')
-            ).values('day').annotate(
-                count=Count('id')
-            ).order_by('-count').first(),
+            'peak_appointment_day': rollups.peak_appointment_day(),
             'busiest_doctor': User.objects.filter(
                 role='doctor'
             ).annotate(
@@ -1274,17 +1104,19 @@ def admin_system_health(request):
         }
     }
     
-    # Error tracking (you can expand this based on your error logging)
-    recent_errors = []  # Add your error tracking logic here
+    # Request metrics merged across workers (users.metrics)
+    merged_metrics = metrics.collect()
+    view_performance = metrics.view_summaries(merged_metrics)
+    recent_errors = [
+        {'message': message, 'timestamp': datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)}
+        for timestamp, message in merged_metrics['errors'][:10]
+    ]
     
     # Performance alerts
     alerts = []
     
     # Check for potential issues
-    overdue_appointments = Appointment.objects.filter(
-        status='pending',
-        appointment_datetime__lt=now
-    ).count()
+    overdue_appointments = stats.overdue_appointments
     
     if overdue_appointments > 10:
         alerts.append({
@@ -1293,14 +1125,7 @@ def admin_system_health(request):
             'action_url': '/admin/appointments/appointment/?status=pending'
         })
     
-    inactive_doctors = User.objects.filter(
-        role='doctor'
-    ).annotate(
-        recent_appointments=Count(
-            'appointments_as_doctor',
-            filter=Q(appointments_as_doctor__appointment_datetime__gte=now - timedelta(days=30))
-        )
-    ).filter(recent_appointments=0).count()
+    inactive_doctors = stats.inactive_doctors
     
     if inactive_doctors > 0:
         alerts.append({
@@ -1309,8 +1134,17 @@ def admin_system_health(request):
             'action_url': '/admin/users/user/?role=doctor'
         })
     
+    slow_views = [row for row in view_performance if row['p95_ms'] > 1000]
+    if slow_views:
+        alerts.append({
+            'type': 'warning',
+            'message': f'{len(slow_views)} pages have a p95 response time above 1 second',
+            'action_url': reverse('metrics')
+        })
+    
     context = {
         'health_metrics': health_metrics,
+        'view_performance': view_performance,
         'recent_errors': recent_errors,
         'alerts': alerts,
         'overdue_appointments': overdue_appointments,
@@ -1319,7 +1153,17 @@ def admin_system_health(request):
     
     return render(request, 'users/admin_system_health.html', context)
 
+def metrics_endpoint(request):
+    """Prometheus text-format metrics for all workers"""
+    token = settings.METRICS_TOKEN
+    authorized = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not (request.user.is_authenticated and request.user.role == 'admin'):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required 
+@query_budget(8)
 def admin_export_data(request):
     """Export system data in various formats"""
     if request.user.role != 'admin':
@@ -1328,56 +1172,30 @@ def admin_export_data(request):
     export_type = request.GET.get('type', 'users')
     format_type = request.GET.get('format', 'json')
     
-    if export_type == 'users':
-        data = list(User.objects.values(
-            'id', 'username', 'first_name', 'last_name', 
-            'email', 'role', 'date_joined', 'is_active'
-        ))
-    elif export_type == 'appointments':
-        data = list(Appointment.objects.select_related(
-            'patient', 'doctor'
-        ).values(
-            'id', 'patient__username', 'doctor__username',
-            'appointment_datetime', 'appointment_type', 'status',
-            'symptoms', 'notes', 'created_at'
-        ))
-    elif export_type == 'prescriptions':
-        data = list(Prescription.objects.select_related(
-            'doctor', 'appointment__patient'
-        ).values(
-            'id', 'doctor__username', 'appointment__patient__username',
-            'medicine', 'dosage', 'instructions', 'date_issued'
-        ))
-    else:
+    if export_type not in exports.EXPORTS:
         return JsonResponse({'error': 'Invalid export type'}, status=400)
-    
-    if format_type == 'json':
-        response = HttpResponse(
-            json.dumps(data, default=str, indent=2),
-            content_type='application/json'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{export_type}_export.json"'
-        return response
-    
-    # Add CSV export if needed
-    elif format_type == 'csv':
-        import csv
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{export_type}_export.csv"'
-        
-        if data:
-            writer = csv.DictWriter(response, fieldnames=data[0].keys())
-            writer.writeheader()
-            writer.writerows(data)
-        
-        return response
-    
-    return JsonResponse({'error': 'Invalid format'}, status=400)
+    if format_type not in exports.FORMATS:
+        return JsonResponse({'error': 'Invalid format'}, status=400)
+    
+    # Rows are streamed straight from a database cursor; gzip when the client accepts it
+    compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    content_type, extension = exports.FORMATS[format_type]
+    blocks = exports.stream_export(export_type, format_type, compress=compress)
+    if isinstance(request, ASGIRequest):
+        # A sync iterator would be read into memory whole before sending
+        blocks = exports.aiter_blocks(blocks)
+    response = StreamingHttpResponse(blocks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export_type}_export.{extension}"'
+    response['Vary'] = 'Accept-Encoding'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    return response
 
 
 # Add these three views to your users/views.py file
 
 @login_required
+@query_budget(12)
 def admin_users_list(request):
     """Admin view to list and manage users"""
     if request.user.role != 'admin':
@@ -1396,25 +1214,19 @@ def admin_users_list(request):
         users = users.filter(role=role_filter)
     
     if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(email__icontains=search_query)
-        )
+        users = users.filter(id__in=search_filter('user', search_query))
     
     # Pagination
-    paginator = Paginator(users, 25)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Deep tables: keyset pages with a bounded count
+    page_obj = paginate(request, users, 25, count='estimate')
     
     # Statistics
-    stats = {
-        'total_users': User.objects.exclude(role='admin').count(),
-        'total_doctors': User.objects.filter(role='doctor').count(),
-        'total_patients': User.objects.filter(role='patient').count(),
-        'active_users': User.objects.filter(is_active=True).exclude(role='admin').count(),
-    }
+    stats = User.objects.aggregate(
+        total_users=Count('id', filter=~Q(role='admin')),
+        total_doctors=Count('id', filter=Q(role='doctor')),
+        total_patients=Count('id', filter=Q(role='patient')),
+        active_users=Count('id', filter=Q(is_active=True) & ~Q(role='admin')),
+    )
     
     context = {
         'page_obj': page_obj,
@@ -1426,6 +1238,7 @@ def admin_users_list(request):
     return render(request, 'users/admin_users_list.html', context)
 
 @login_required
+@query_budget(12)
 def admin_appointments_list(request):
     """Admin view to list and manage appointments"""
     if request.user.role != 'admin':
@@ -1459,18 +1272,17 @@ def admin_appointments_list(request):
         appointments = appointments.filter(doctor_id=doctor_filter)
     
     # Pagination
-    paginator = Paginator(appointments, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Deep tables: keyset pages with a bounded count
+    page_obj = paginate(request, appointments, 20, count='estimate')
     
     # Statistics
-    stats = {
-        'total_appointments': Appointment.objects.count(),
-        'pending': Appointment.objects.filter(status='pending').count(),
-        'completed': Appointment.objects.filter(status='completed').count(),
-        'cancelled': Appointment.objects.filter(status='cancelled').count(),
-        'today': Appointment.objects.filter(appointment_datetime__date=timezone.now().date()).count(),
-    }
+    stats = Appointment.objects.aggregate(
+        total_appointments=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+        completed=Count('id', filter=Q(status='completed')),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        today=Count('id', filter=Q(appointment_datetime__date=timezone.now().date())),
+    )
     
     # Get doctors for filter dropdown
     doctors = User.objects.filter(role='doctor').order_by('first_name')
@@ -1487,6 +1299,7 @@ def admin_appointments_list(request):
     return render(request, 'users/admin_appointments_list.html', context)
 
 @login_required
+@query_budget(15)
 def admin_prescriptions_list(request):
     """Admin view to list and manage prescriptions"""
     if request.user.role != 'admin':
@@ -1517,18 +1330,15 @@ def admin_prescriptions_list(request):
             prescriptions = prescriptions.filter(doctor_id=doctor_filter)
         
         if search_query:
+            user_ids = search_filter('user', search_query)
             prescriptions = prescriptions.filter(
-                Q(medicine__icontains=search_query) |
-                Q(appointment__patient__first_name__icontains=search_query) |
-                Q(appointment__patient__last_name__icontains=search_query) |
-                Q(doctor__first_name__icontains=search_query) |
-                Q(doctor__last_name__icontains=search_query)
+                Q(id__in=search_filter('prescription', search_query)) |
+                Q(appointment__patient_id__in=user_ids) |
+                Q(doctor_id__in=user_ids)
             )
         
         # Pagination
-        paginator = Paginator(prescriptions, 20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        page_obj = paginate(request, prescriptions, 20, count='estimate')
         
         # Statistics
         stats = {